@@ -1,19 +1,125 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from auth_manager import AuthManager
+from flask_sock import Sock, ConnectionClosed
+from engine_pool import EngineOverloaded
+from startup import STARTUP_WARMUP_MODES, NotReady, Startup
 from config import Config
 import os
+import json
+import time
+import metrics
 
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
+sock = Sock(app)
 
-# Initialize Auth Manager
-auth_manager = AuthManager()
+# The Auth Manager is built and warmed up by create_app(), not on import;
+# it is set here once ready (see require_auth_manager)
+startup = Startup()
+auth_manager = None
+
+# Endpoints that answer without the Auth Manager, and so during warm-up
+STARTUP_EXEMPT_ENDPOINTS = {'health_check', 'readiness_check', 'get_metrics'}
 
 # Create upload folder if it doesn't exist
 os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
 
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    # Collect this request's stage timings for Server-Timing (not for long-lived WebSockets)
+    if Config.METRICS_ENABLED and request.headers.get('Upgrade', '').lower() != 'websocket':
+        g.stage_timings, g.collector_token = metrics.start_collecting()
+
+@app.before_request
+def require_auth_manager():
+    """Wait for warm-up (up to STARTUP_WAIT) before requests that need the Auth Manager"""
+    global auth_manager
+    if auth_manager is not None or request.endpoint in STARTUP_EXEMPT_ENDPOINTS or request.endpoint is None:
+        return None
+    try:
+        auth_manager = startup.get()
+    except NotReady as e:
+        response = jsonify({
+            'success': False,
+            'message': str(e)
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return None
+
+@app.after_request
+def finish_request_metrics(response):
+    if Config.METRICS_ENABLED and 'request_start' in g:
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REGISTRY.observe('face_http_request_seconds', elapsed, endpoint=endpoint)
+        metrics.inc('face_http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            metrics.inc('face_http_errors_total', endpoint=endpoint)
+        
+        timings = g.get('stage_timings')
+        if Config.METRICS_SERVER_TIMING and timings:
+            response.headers['Server-Timing'] = ', '.join(
+                [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timings.totals().items()]
+                + [f'total;dur={elapsed * 1000:.2f}']
+            )
+    return response
+
+@app.teardown_request
+def end_request_metrics(error=None):
+    if 'collector_token' in g:
+        metrics.stop_collecting(g.pop('collector_token'))
+
+def read_image_request(multiple=False):
+    """Read form fields and the image from a JSON, multipart or raw image request.
+    
+    JSON bodies carry a base64 data URL in 'image' (the original format).
+    multipart/form-data carries the image as a file part named 'image';
+    a raw image/* body is the image itself, with fields in the query
+    string. Binary uploads are returned as a buffer over the request
+    data, so decode_image reads them without a base64 round trip.
+    
+    With multiple=True a list of images is returned instead: a JSON
+    'images' array or several 'image' file parts (a burst of frames).
+    """
+    if request.mimetype.startswith('image/'):
+        image = request.get_data(cache=False)
+        return request.args.to_dict(), [image] if multiple else image
+    
+    if request.mimetype == 'multipart/form-data':
+        fields = request.form.to_dict()
+        # Small uploads are kept in a BytesIO: hand out its buffer without copying
+        uploads = [
+            upload.stream.getbuffer() if hasattr(upload.stream, 'getbuffer') else upload.stream.read()
+            for upload in request.files.getlist('image')
+        ]
+        if not uploads and 'image' in fields:
+            uploads = [fields.pop('image')]
+        if multiple:
+            return fields, uploads
+        return fields, uploads[0] if uploads else None
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {}, [] if multiple else None
+    if multiple:
+        images = data.get('images')
+        if not isinstance(images, list):
+            images = [data['image']] if data.get('image') is not None else []
+        return data, images
+    return data, data.get('image')
+
+def read_history_filters():
+    """Read the username, success and cursor filters shared by the history endpoints"""
+    success = request.args.get('success')
+    if success is not None:
+        if success.lower() not in ('true', 'false'):
+            raise ValueError('success must be "true" or "false"')
+        success = success.lower() == 'true'
+    return request.args.get('username') or None, success, request.args.get('cursor') or None
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -22,30 +128,88 @@ def health_check():
         'message': 'Face Recognition API is running'
     }), 200
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once warm-up has finished, 503 before (a probe starts a lazy warm-up)"""
+    if startup.state != 'ready':
+        startup.warm_up()
+    status = startup.status()
+    return jsonify(dict({'success': status['ready']}, **status)), 200 if status['ready'] else 503
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """Register a new user"""
     try:
-        data = request.get_json()
+        data, images = read_image_request(multiple=True)
         
         # Validate required fields
-        if not data or 'username' not in data or 'image' not in data:
+        if 'username' not in data or not images:
             return jsonify({
                 'success': False,
                 'message': 'Username and image are required'
             }), 400
         
+        if len(images) > Config.REGISTRATION_MAX_FRAMES:
+            return jsonify({
+                'success': False,
+                'message': f'At most {Config.REGISTRATION_MAX_FRAMES} images per registration'
+            }), 400
+        
         username = data.get('username')
         full_name = data.get('full_name', '')
         email = data.get('email', '')
-        image = data.get('image')
         
         # Register user
-        result = auth_manager.register_user(username, full_name, email, image)
+        result = auth_manager.register_user(username, full_name, email, images)
         
         status_code = 200 if result['success'] else 400
         return jsonify(result), status_code
+    
+    except EngineOverloaded as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503, {'Retry-After': '1'}
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/register/batch', methods=['POST'])
+def register_batch():
+    """Register many users in one request"""
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data or not isinstance(data.get('users'), list) or not data['users']:
+            return jsonify({
+                'success': False,
+                'message': 'A non-empty users list is required'
+            }), 400
+        
+        if len(data['users']) > Config.BULK_MAX_BATCH:
+            return jsonify({
+                'success': False,
+                'message': f'At most {Config.BULK_MAX_BATCH} users per batch'
+            }), 400
+        
+        # Only accept the documented fields; images must be inline and other entries are reported as failures
+        users = [{
+            'username': user.get('username'),
+            'full_name': user.get('full_name', ''),
+            'email': user.get('email', ''),
+            'image': user.get('image')
+        } if isinstance(user, dict) else user for user in data['users']]
+        
+        # Register users
+        result = auth_manager.register_users_batch(users)
         
+        status_code = 200 if result['success'] else 400
+        return jsonify(result), status_code
+    
     except Exception as e:
         return jsonify({
             'success': False,
@@ -56,29 +220,74 @@ def register():
 def authenticate():
     """Authenticate a user"""
     try:
-        data = request.get_json()
+        _, image = read_image_request()
         
         # Validate required fields
-        if not data or 'image' not in data:
+        if image is None:
             return jsonify({
                 'success': False,
                 'message': 'Image is required'
             }), 400
         
-        image = data.get('image')
-        
         # Authenticate user
         result = auth_manager.authenticate_user(image)
         
         status_code = 200 if result['success'] else 401
         return jsonify(result), status_code
-        
+    
+    except EngineOverloaded as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 503, {'Retry-After': '1'}
+    
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Server error: {str(e)}'
         }), 500
 
+@sock.route('/api/authenticate/stream')
+def authenticate_stream(ws):
+    """Continuously authenticate frames sent over a WebSocket.
+    
+    Each message is one frame, either binary image bytes or a base64 data
+    URL. Every processed frame gets a JSON result event back. Frames that
+    arrive while one is being processed are dropped in favour of the newest.
+    """
+    session = auth_manager.open_stream_session()
+    if session is None:
+        ws.send(json.dumps({
+            'type': 'error',
+            'success': False,
+            'message': 'Too many streaming sessions, please retry shortly'
+        }))
+        ws.close(reason=1013)
+        return
+    
+    try:
+        while True:
+            frame = ws.receive()
+            
+            # Skip to the newest frame if we have fallen behind
+            dropped = 0
+            while True:
+                newer = ws.receive(timeout=0)
+                if newer is None:
+                    break
+                frame = newer
+                dropped += 1
+            
+            try:
+                event = session.process(frame, dropped)
+            except Exception as e:
+                event = {'type': 'error', 'success': False, 'message': f'Server error: {str(e)}'}
+            ws.send(json.dumps(event))
+    except ConnectionClosed:
+        pass
+    finally:
+        auth_manager.close_stream_session(session)
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
     """Get all registered users"""
@@ -106,10 +315,18 @@ def delete_user(username):
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """Get login history"""
+    """Get one page of login history, newest first (pass next_cursor back as cursor)"""
     try:
-        limit = request.args.get('limit', 50, type=int)
-        result = auth_manager.get_login_history(limit)
+        limit = request.args.get('limit', Config.HISTORY_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), Config.HISTORY_MAX_PAGE_SIZE)
+        try:
+            username, success, cursor = read_history_filters()
+            result = auth_manager.get_login_history(limit, username, success, cursor)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         return jsonify(result), 200
     except Exception as e:
         return jsonify({
@@ -117,11 +334,66 @@ def get_history():
             'message': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """Stream all matching login history as newline-delimited JSON"""
+    try:
+        try:
+            username, success, cursor = read_history_filters()
+            attempts = auth_manager.export_login_history(username, success, cursor)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        # Rows are read from the cursor in batches as the client consumes them
+        rows = (app.json.dumps(attempt) + '\n' for attempt in attempts)
+        return Response(stream_with_context(rows), mimetype='application/x-ndjson')
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     """Get system statistics"""
     try:
-        result = auth_manager.get_statistics()
+        series = request.args.get('series')
+        if series is not None and series not in ('hour', 'day'):
+            return jsonify({
+                'success': False,
+                'message': 'series must be "hour" or "day"'
+            }), 400
+        
+        points = request.args.get('points', 24 if series == 'hour' else 30, type=int)
+        points = min(max(points, 1), Config.STATS_MAX_POINTS)
+        result = auth_manager.get_statistics(series, points)
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/gallery/status', methods=['GET'])
+def get_gallery_status():
+    """Get gallery size and sync staleness for this worker"""
+    try:
+        result = auth_manager.get_gallery_status()
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
+@app.route('/api/engine/status', methods=['GET'])
+def get_engine_status():
+    """Get engine pool load for this worker"""
+    try:
+        result = auth_manager.get_engine_status()
         return jsonify(result), 200
     except Exception as e:
         return jsonify({
@@ -129,6 +401,17 @@ def get_statistics():
             'message': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for this worker"""
+    try:
+        return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}'
+        }), 500
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -143,7 +426,28 @@ def internal_error(error):
         'message': 'Internal server error'
     }), 500
 
+def create_app():
+    """Start warming up the Auth Manager per STARTUP_WARMUP and return the app.
+    
+    With STARTUP_PRELOAD this only preloads, for servers that import the
+    app before forking workers, e.g. STARTUP_PRELOAD=true
+    gunicorn --preload 'app:create_app()'.
+    """
+    if Config.STARTUP_WARMUP not in STARTUP_WARMUP_MODES:
+        raise ValueError(f"Unknown startup warm-up mode: {Config.STARTUP_WARMUP}")
+    
+    if Config.STARTUP_PRELOAD:
+        startup.preload()
+    elif Config.STARTUP_WARMUP == 'eager':
+        startup.warm_up(wait=True)
+        if startup.error:
+            raise NotReady(f'Warm-up failed: {startup.error}')
+    elif Config.STARTUP_WARMUP == 'background':
+        startup.warm_up()
+    return app
+
 if __name__ == '__main__':
+    create_app()
     print("🚀 Starting Face Recognition API...")
     print(f"📡 Server running on http://{Config.HOST}:{Config.PORT}")
-    app.run(host=Config.HOST, port=Config.PORT, debug=Config.DEBUG)
\ No newline at end of file
+    app.run(host=Config.HOST, port=Config.PORT, debug=Config.DEBUG, threaded=True)
\ No newline at end of file
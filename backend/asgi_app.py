@@ -0,0 +1,430 @@
+"""Async entry point: the /api/* routes of app.py on Starlette, served over ASGI.
+
+Requires `pip install -r requirements-async.txt` (requirements.txt plus
+motor, starlette, uvicorn and python-multipart). Run from the backend
+directory with:
+    
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Requests are handled on an event loop instead of one thread each, so
+slow uploads, idle keep-alive and WebSocket connections and requests
+waiting on MongoDB (through motor, see async_database.py) cost a
+coroutine rather than a worker thread. Detection and encoding still run
+on the engine pool and other CPU-bound steps on threads (see
+async_auth_manager.py). Start-up, readiness and the 503 answers during
+warm-up work as in app.py; per-request Server-Timing is not supported
+because stage timings are collected per thread.
+"""
+import asyncio
+import contextlib
+import datetime
+import json
+import time
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+from werkzeug.http import http_date
+from async_auth_manager import AsyncAuthManager
+from engine_pool import EngineOverloaded
+from startup import STARTUP_WARMUP_MODES, NotReady, Startup
+from config import Config
+import metrics
+
+startup = Startup()
+auth_manager = None
+
+def json_default(value):
+    # Dates are rendered as in Flask's JSON responses (which also sort keys)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return http_date(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(content, separators=(',', ':')):
+    return json.dumps(content, default=json_default, separators=separators, sort_keys=True)
+
+class APIResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content).encode('utf-8')
+
+def error_response(message, status_code, headers=None):
+    return APIResponse({
+        'success': False,
+        'message': message
+    }, status_code, headers)
+
+async def require_auth_manager():
+    """The AsyncAuthManager, after waiting for warm-up (up to STARTUP_WAIT); raises NotReady"""
+    global auth_manager
+    if auth_manager is None:
+        manager = await run_in_threadpool(startup.get)
+        if auth_manager is None:
+            auth_manager = AsyncAuthManager(manager)
+    return auth_manager
+
+async def read_image_request(request, multiple=False):
+    """Async read_image_request of app.py: JSON, multipart or raw image bodies"""
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if mimetype.startswith('image/'):
+        image = await request.body()
+        return dict(request.query_params), [image] if multiple else image
+    
+    if mimetype == 'multipart/form-data':
+        form = await request.form()
+        fields = {key: value for key, value in form.multi_items() if isinstance(value, str)}
+        uploads = [await upload.read() for upload in form.getlist('image') if not isinstance(upload, str)]
+        if not uploads and 'image' in fields:
+            uploads = [fields.pop('image')]
+        if multiple:
+            return fields, uploads
+        return fields, uploads[0] if uploads else None
+    
+    data = None
+    if mimetype == 'application/json' or mimetype.endswith('+json'):
+        try:
+            data = await request.json()
+        except ValueError:
+            pass
+    if not isinstance(data, dict):
+        return {}, [] if multiple else None
+    if multiple:
+        images = data.get('images')
+        if not isinstance(images, list):
+            images = [data['image']] if data.get('image') is not None else []
+        return data, images
+    return data, data.get('image')
+
+def read_history_filters(request):
+    """Read the username, success and cursor filters shared by the history endpoints"""
+    success = request.query_params.get('success')
+    if success is not None:
+        if success.lower() not in ('true', 'false'):
+            raise ValueError('success must be "true" or "false"')
+        success = success.lower() == 'true'
+    return request.query_params.get('username') or None, success, request.query_params.get('cursor') or None
+
+def int_param(request, name, default):
+    """Integer query parameter, the default when missing or malformed (as Flask's type=int)"""
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+async def health_check(request):
+    """Health check endpoint"""
+    return APIResponse({
+        'status': 'healthy',
+        'message': 'Face Recognition API is running'
+    }, 200)
+
+async def readiness_check(request):
+    """Readiness: 200 once warm-up has finished, 503 before (a probe starts a lazy warm-up)"""
+    if startup.state != 'ready':
+        startup.warm_up()
+    status = startup.status()
+    return APIResponse(dict({'success': status['ready']}, **status), 200 if status['ready'] else 503)
+
+async def register(request):
+    """Register a new user"""
+    manager = await require_auth_manager()
+    try:
+        data, images = await read_image_request(request, multiple=True)
+        
+        # Validate required fields
+        if 'username' not in data or not images:
+            return error_response('Username and image are required', 400)
+        
+        if len(images) > Config.REGISTRATION_MAX_FRAMES:
+            return error_response(f'At most {Config.REGISTRATION_MAX_FRAMES} images per registration', 400)
+        
+        result = await manager.register_user(
+            data.get('username'), data.get('full_name', ''), data.get('email', ''), images
+        )
+        return APIResponse(result, 200 if result['success'] else 400)
+    
+    except EngineOverloaded as e:
+        return error_response(str(e), 503, {'Retry-After': '1'})
+    
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def register_batch(request):
+    """Register many users in one request"""
+    manager = await require_auth_manager()
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        
+        # Validate required fields
+        if not isinstance(data, dict) or not isinstance(data.get('users'), list) or not data['users']:
+            return error_response('A non-empty users list is required', 400)
+        
+        if len(data['users']) > Config.BULK_MAX_BATCH:
+            return error_response(f'At most {Config.BULK_MAX_BATCH} users per batch', 400)
+        
+        # Only accept the documented fields; images must be inline and other entries are reported as failures
+        users = [{
+            'username': user.get('username'),
+            'full_name': user.get('full_name', ''),
+            'email': user.get('email', ''),
+            'image': user.get('image')
+        } if isinstance(user, dict) else user for user in data['users']]
+        
+        result = await manager.register_users_batch(users)
+        return APIResponse(result, 200 if result['success'] else 400)
+    
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def authenticate(request):
+    """Authenticate a user"""
+    manager = await require_auth_manager()
+    try:
+        _, image = await read_image_request(request)
+        
+        # Validate required fields
+        if image is None:
+            return error_response('Image is required', 400)
+        
+        result = await manager.authenticate_user(image)
+        return APIResponse(result, 200 if result['success'] else 401)
+    
+    except EngineOverloaded as e:
+        return error_response(str(e), 503, {'Retry-After': '1'})
+    
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def authenticate_stream(websocket):
+    """Continuously authenticate frames sent over a WebSocket (see app.py).
+    
+    A reader task keeps only the newest frame while one is processed, so
+    frames that arrive in the meantime are dropped in favour of it.
+    """
+    await websocket.accept()
+    try:
+        manager = await require_auth_manager()
+        session = manager.open_stream_session()
+    except NotReady as e:
+        manager, session = None, None
+        message = str(e)
+    else:
+        message = 'Too many streaming sessions, please retry shortly'
+    if session is None:
+        await websocket.send_text(json.dumps({
+            'type': 'error',
+            'success': False,
+            'message': message
+        }))
+        await websocket.close(code=1013)
+        return
+    
+    newest = {'frame': None, 'dropped': 0, 'closed': False}
+    arrived = asyncio.Event()
+    
+    async def read_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if newest['frame'] is not None:
+                    newest['dropped'] += 1
+                newest['frame'] = message['bytes'] if message.get('bytes') is not None else message.get('text')
+                arrived.set()
+        finally:
+            newest['closed'] = True
+            arrived.set()
+    
+    reader = asyncio.create_task(read_frames())
+    try:
+        while True:
+            if newest['frame'] is None:
+                if newest['closed']:
+                    break
+                await arrived.wait()
+                arrived.clear()
+                continue
+            
+            frame, dropped = newest['frame'], newest['dropped']
+            newest['frame'], newest['dropped'] = None, 0
+            try:
+                event = await asyncio.to_thread(session.process, frame, dropped)
+            except Exception as e:
+                event = {'type': 'error', 'success': False, 'message': f'Server error: {str(e)}'}
+            await websocket.send_text(json.dumps(event))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        reader.cancel()
+        manager.close_stream_session(session)
+
+async def get_users(request):
+    """Get all registered users"""
+    manager = await require_auth_manager()
+    try:
+        return APIResponse(await manager.get_all_users(), 200)
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def delete_user(request):
+    """Delete a user"""
+    manager = await require_auth_manager()
+    try:
+        result = await manager.delete_user(request.path_params['username'])
+        return APIResponse(result, 200 if result['success'] else 404)
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def get_history(request):
+    """Get one page of login history, newest first (pass next_cursor back as cursor)"""
+    manager = await require_auth_manager()
+    try:
+        limit = int_param(request, 'limit', Config.HISTORY_PAGE_SIZE)
+        limit = min(max(limit, 1), Config.HISTORY_MAX_PAGE_SIZE)
+        try:
+            username, success, cursor = read_history_filters(request)
+            result = await manager.get_login_history(limit, username, success, cursor)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        return APIResponse(result, 200)
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def export_history(request):
+    """Stream all matching login history as newline-delimited JSON"""
+    manager = await require_auth_manager()
+    try:
+        try:
+            username, success, cursor = read_history_filters(request)
+            attempts = manager.export_login_history(username, success, cursor)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        
+        # Rows are read from the cursor in batches as the client consumes them
+        async def rows():
+            async for attempt in attempts:
+                yield dumps(attempt, separators=None) + '\n'
+        return StreamingResponse(rows(), media_type='application/x-ndjson')
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def get_statistics(request):
+    """Get system statistics"""
+    manager = await require_auth_manager()
+    try:
+        series = request.query_params.get('series')
+        if series is not None and series not in ('hour', 'day'):
+            return error_response('series must be "hour" or "day"', 400)
+        
+        points = int_param(request, 'points', 24 if series == 'hour' else 30)
+        points = min(max(points, 1), Config.STATS_MAX_POINTS)
+        return APIResponse(await manager.get_statistics(series, points), 200)
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def get_gallery_status(request):
+    """Get gallery size and sync staleness for this worker"""
+    manager = await require_auth_manager()
+    try:
+        return APIResponse(manager.get_gallery_status(), 200)
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def get_engine_status(request):
+    """Get engine pool load for this worker"""
+    manager = await require_auth_manager()
+    try:
+        return APIResponse(manager.get_engine_status(), 200)
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def get_metrics(request):
+    """Prometheus metrics for this worker"""
+    try:
+        return Response(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+    except Exception as e:
+        return error_response(f'Server error: {str(e)}', 500)
+
+async def not_ready(request, error):
+    return error_response(str(error), 503, {'Retry-After': '1'})
+
+async def not_found(request, error):
+    return error_response('Endpoint not found', 404)
+
+async def internal_error(request, error):
+    return error_response('Internal server error', 500)
+
+routes = [
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/api/ready', readiness_check, methods=['GET']),
+    Route('/api/register', register, methods=['POST']),
+    Route('/api/register/batch', register_batch, methods=['POST']),
+    Route('/api/authenticate', authenticate, methods=['POST']),
+    WebSocketRoute('/api/authenticate/stream', authenticate_stream),
+    Route('/api/users', get_users, methods=['GET']),
+    Route('/api/users/{username}', delete_user, methods=['DELETE']),
+    Route('/api/history', get_history, methods=['GET']),
+    Route('/api/history/export', export_history, methods=['GET']),
+    Route('/api/statistics', get_statistics, methods=['GET']),
+    Route('/api/gallery/status', get_gallery_status, methods=['GET']),
+    Route('/api/engine/status', get_engine_status, methods=['GET']),
+    Route('/api/metrics', get_metrics, methods=['GET'])
+]
+
+class RequestMetrics:
+    """ASGI middleware recording the request metrics app.py records in its hooks"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.paths = {route.endpoint: route.path for route in routes}
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not Config.METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        
+        start = time.perf_counter()
+        status = {}
+        
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            endpoint = self.paths.get(scope.get('endpoint'), 'unmatched')
+            code = status.get('code', 500)
+            metrics.REGISTRY.observe('face_http_request_seconds', elapsed, endpoint=endpoint)
+            metrics.inc('face_http_requests_total', endpoint=endpoint, method=scope['method'], status=code)
+            if code >= 500:
+                metrics.inc('face_http_errors_total', endpoint=endpoint)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Start warming up per STARTUP_WARMUP, as create_app() does for app.py"""
+    if Config.STARTUP_WARMUP not in STARTUP_WARMUP_MODES:
+        raise ValueError(f"Unknown startup warm-up mode: {Config.STARTUP_WARMUP}")
+    
+    if Config.STARTUP_WARMUP == 'eager':
+        await run_in_threadpool(startup.warm_up, True)
+        if startup.error:
+            raise NotReady(f'Warm-up failed: {startup.error}')
+    elif Config.STARTUP_WARMUP == 'background':
+        startup.warm_up()
+    yield
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    exception_handlers={NotReady: not_ready, 404: not_found, 500: internal_error}
+)
+app.add_middleware(RequestMetrics)
+# Any origin, method and header, as flask_cors.CORS(app) allows in app.py
+app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
\ No newline at end of file
@@ -0,0 +1,166 @@
+import asyncio
+from metrics import stage_timer
+from async_database import AsyncDatabase
+from auth_manager import AuthManager
+from face_engine import FaceEngine
+from probe_cache import ProbeCache
+
+class AsyncAuthManager:
+    """AuthManager operations for the async API (asgi_app.py).
+    
+    Wraps a started AuthManager and shares its gallery, engine pool, probe
+    cache, statistics and background writers. Database reads and writes
+    on the request path go through AsyncDatabase and are awaited; work
+    that holds a CPU (detection and encoding on the engine pool, template
+    selection, gallery search and updates, batch enrollment) runs on the
+    pool or a thread, so the event loop keeps serving other connections
+    meanwhile.
+    """
+    
+    def __init__(self, manager):
+        self.manager = manager
+        self.db = AsyncDatabase()
+        self.gallery = manager.gallery
+        self.engine_pool = manager.engine_pool
+        self.probe_cache = manager.probe_cache
+    
+    async def _engine(self, method, image):
+        """Await a FaceEngine call on the pool (may raise EngineOverloaded)"""
+        future = self.engine_pool.submit(method, image)
+        await asyncio.wrap_future(future)
+        return self.engine_pool.wait(future)
+    
+    async def register_user(self, username, full_name, email, images):
+        """Register a new user with face data from one frame or a short burst"""
+        # Validate input
+        if not isinstance(username, str) or not username.strip():
+            return AuthManager._failure('Username cannot be empty')
+        
+        username = username.strip()
+        
+        # Check if user already exists
+        with stage_timer('db_lookup'):
+            existing = await self.db.get_user_by_username(username)
+        if existing:
+            return AuthManager._failure('Username already exists')
+        
+        # Process face images, all frames of a burst in parallel
+        images = images if isinstance(images, list) else [images]
+        results = await asyncio.gather(*[
+            self._engine('process_image_for_registration', image) for image in images
+        ])
+        encodings = [encoding for success, _, encoding in results if success]
+        
+        if not encodings:
+            return AuthManager._failure(results[0][1])
+        
+        # Keep a few diverse templates and index the user by their centroid
+        with stage_timer('templates'):
+            templates, centroid, inconsistent = await asyncio.to_thread(FaceEngine.select_templates, encodings)
+        
+        # Add user to database
+        with stage_timer('db_write'):
+            success, result = await self.db.add_user(username, full_name, email, centroid, templates)
+        
+        if not success:
+            return AuthManager._failure(f'Failed to register user: {result}')
+        with stage_timer('gallery_update'):
+            await asyncio.to_thread(self.gallery.add, username, centroid, templates)
+        return AuthManager._registration_result(username, result, images, encodings, inconsistent, templates)
+    
+    async def register_users_batch(self, users):
+        """Register many users in one call (the bulk enroller runs in a thread)"""
+        return await asyncio.to_thread(self.manager.register_users_batch, users)
+    
+    async def authenticate_user(self, image):
+        """Authenticate user using face recognition"""
+        if len(self.gallery) == 0:
+            return AuthManager._authentication_result(False, 'No users registered yet', 0.0, None)
+        
+        # Encode on a pooled engine, then match against the shared gallery
+        key = ProbeCache.key(image) if self.probe_cache is not None else None
+        success, message, encoding = await self._encode_probe(image, key)
+        if success:
+            with stage_timer('match'):
+                success, message, confidence, username = await asyncio.to_thread(
+                    self.manager._match_probe, key, encoding
+                )
+        else:
+            confidence, username = 0.0, None
+        
+        # Log attempt (and last login if successful); enqueueing only blocks under backpressure
+        with stage_timer('audit'):
+            await asyncio.to_thread(self.manager.audit.record, username or 'Unknown', success, confidence)
+        
+        return AuthManager._authentication_result(success, message, confidence, username)
+    
+    async def _encode_probe(self, image, key):
+        """Encode a probe on the pool unless the same frame was seen recently"""
+        if self.probe_cache is None:
+            return await self._engine('encode_probe', image)
+        
+        probe = self.probe_cache.get_probe(key)
+        if probe is None:
+            signature = None
+            if self.probe_cache.perceptual:
+                signature = await asyncio.to_thread(FaceEngine.frame_signature, image)
+            if signature is not None:
+                probe = self.probe_cache.get_similar(key, signature)
+            if probe is None:
+                probe = tuple(await self._engine('encode_probe', image))
+                self.probe_cache.put_probe(key, probe, signature)
+        return probe
+    
+    async def get_all_users(self):
+        """Get all registered users"""
+        users = await self.db.get_all_users()
+        return {
+            'success': True,
+            'users': users,
+            'count': len(users)
+        }
+    
+    async def delete_user(self, username):
+        """Delete a user"""
+        success = await self.db.delete_user(username)
+        
+        if success:
+            await asyncio.to_thread(self.gallery.remove, username)
+        return AuthManager._deletion_result(username, success)
+    
+    async def get_login_history(self, limit=50, username=None, success=None, cursor=None):
+        """Get a page of login history, optionally for one user or outcome"""
+        before = AuthManager._decode_history_cursor(cursor) if cursor else None
+        history = await self.db.get_login_history(limit, username, success, before)
+        
+        # A full page may have more after it
+        next_cursor = AuthManager._encode_history_cursor(history[-1]) if len(history) == limit else None
+        for attempt in history:
+            del attempt['_id']
+        return {
+            'success': True,
+            'history': history,
+            'count': len(history),
+            'next_cursor': next_cursor
+        }
+    
+    def export_login_history(self, username=None, success=None, cursor=None):
+        """Async iterator over all matching login history"""
+        before = AuthManager._decode_history_cursor(cursor) if cursor else None
+        return self.db.iter_login_history(username, success, before)
+    
+    async def get_statistics(self, series=None, points=None):
+        """Get system statistics (cached counters; a miss reads them in a thread)"""
+        return await asyncio.to_thread(self.manager.get_statistics, series, points)
+    
+    def get_gallery_status(self):
+        return self.manager.get_gallery_status()
+    
+    def get_engine_status(self):
+        return self.manager.get_engine_status()
+    
+    def open_stream_session(self):
+        return self.manager.open_stream_session()
+    
+    def close_stream_session(self, session):
+        self.manager.close_stream_session(session)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""MongoDB access for the async API (asgi_app.py) over the motor driver.
+
+Requires motor (`pip install -r requirements-async.txt`). Only the
+request path lives here: the gallery sync, audit writer and statistics
+keep using Database from their background threads. Documents and
+queries come from the same Database helpers, so both APIs read and
+write the same data and the gallery change log and counters stay
+consistent between them.
+"""
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import Config
+from database import USER_LIST_PROJECTION, Database
+
+class AsyncDatabase:
+    def __init__(self):
+        self.client = AsyncIOMotorClient(Config.MONGO_URI)
+        self.db = self.client[Config.DB_NAME]
+        self.users = self.db.users
+        self.login_attempts = self.db.login_attempts
+        self.gallery_meta = self.db.gallery_meta
+        self.gallery_changes = self.db.gallery_changes
+        self.stats = self.db.stats
+    
+    async def add_user(self, username, full_name, email, face_encoding, face_templates=None):
+        """Add a new user with face encoding (a centroid when templates are given)"""
+        try:
+            user_data = Database._user_document(username, full_name, email, face_encoding, face_templates)
+            result = await self.users.insert_one(user_data)
+        except Exception as e:
+            return False, str(e)
+        
+        # As in Database.add_user, the user exists once inserted
+        try:
+            await self._record_gallery_changes('add', [username])
+            await self._count_users(1)
+        except Exception as e:
+            print(f"Error recording registration of {username}: {e}")
+        return True, str(result.inserted_id)
+    
+    async def get_user_by_username(self, username):
+        """Get user by username"""
+        return await self.users.find_one({'username': username, 'is_active': True})
+    
+    async def get_all_users(self):
+        """Get all active users"""
+        return await self.users.find({'is_active': True}, USER_LIST_PROJECTION).to_list(None)
+    
+    async def delete_user(self, username):
+        """Soft delete a user"""
+        result = await self.users.update_one(*Database._deactivation(username))
+        if result.modified_count > 0:
+            await self._record_gallery_changes('remove', [username])
+            await self._count_users(-1)
+        return result.modified_count > 0
+    
+    async def _record_gallery_changes(self, op, usernames):
+        """Bump the gallery version and log one change per username"""
+        usernames = list(usernames)
+        if not usernames:
+            return None
+        
+        meta = await self.gallery_meta.find_one_and_update(**Database._gallery_version_bump(len(usernames)))
+        await self.gallery_changes.insert_many(
+            Database._gallery_change_documents(op, usernames, meta['version'])
+        )
+        return meta['version']
+    
+    async def _count_users(self, delta):
+        """Adjust the active user counter"""
+        if delta:
+            await self.stats.update_one(*Database._user_count_update(delta), upsert=True)
+    
+    async def get_login_history(self, limit=50, username=None, success=None, before=None):
+        """Get one page of login history, newest first (see Database.get_login_history)"""
+        return await self.login_attempts.find(
+            Database._history_query(username, success, before)
+        ).sort([('timestamp', -1), ('_id', -1)]).limit(limit).to_list(None)
+    
+    def iter_login_history(self, username=None, success=None, before=None, batch_size=1000):
+        """Async cursor over all matching login history, newest first"""
+        return self.login_attempts.find(
+            Database._history_query(username, success, before),
+            {'_id': 0}
+        ).sort([('timestamp', -1), ('_id', -1)]).batch_size(batch_size)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from config import Config
+from metrics import timed_stage
+
+class AuditWriter:
+    """Writes login attempts and last-login updates off the request path.
+    
+    Attempts go into a bounded in-memory queue. A background thread
+    flushes them with one insert_many (plus one bulk_write for last
+    logins) once AUDIT_BATCH_SIZE are pending or AUDIT_FLUSH_INTERVAL
+    has passed. When the queue is full, record() waits up to
+    AUDIT_ENQUEUE_TIMEOUT and then writes synchronously, so a slow
+    database slows callers down instead of dropping attempts. close()
+    drains everything that is still queued.
+    """
+    
+    def __init__(self, db, enabled=None):
+        self.db = db
+        self.enabled = Config.AUDIT_ASYNC if enabled is None else enabled
+        self._queue = queue.Queue(maxsize=Config.AUDIT_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'queued': 0, 'written': 0, 'sync_writes': 0, 'failed_flushes': 0}
+        
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+    
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def record(self, username, success, confidence):
+        """Record a login attempt (and the last login on success)"""
+        attempt = {
+            'username': username,
+            'success': success,
+            'confidence': confidence,
+            'timestamp': datetime.utcnow()
+        }
+        
+        if self.enabled and not self._stop.is_set():
+            try:
+                self._queue.put(attempt, timeout=Config.AUDIT_ENQUEUE_TIMEOUT)
+                self._count('queued')
+                return
+            except queue.Full:
+                pass
+        
+        # Disabled, shutting down or backpressure: write in the caller
+        self._write([attempt])
+        self._count('sync_writes')
+    
+    @timed_stage('audit_write')
+    def _write(self, attempts):
+        self.db.log_login_attempts(attempts)
+        
+        last_logins = {}
+        for attempt in attempts:
+            if attempt['success'] and attempt['username'] != 'Unknown':
+                last_logins[attempt['username']] = attempt['timestamp']
+        self.db.update_last_logins(last_logins)
+        
+        self._count('written', len(attempts))
+    
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + Config.AUDIT_FLUSH_INTERVAL
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+                # Grab whatever else is already waiting without blocking
+                while True:
+                    if item is not None:
+                        batch.append(item)
+                    if len(batch) >= Config.AUDIT_BATCH_SIZE:
+                        break
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            
+            stopping = self._stop.is_set()
+            if batch and (len(batch) >= Config.AUDIT_BATCH_SIZE or time.monotonic() >= deadline or stopping):
+                batch = self._flush(batch)
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + Config.AUDIT_FLUSH_INTERVAL
+            
+            if stopping and self._queue.empty():
+                if batch:
+                    self._flush(batch)
+                return
+    
+    def _flush(self, batch):
+        """Write a batch; returns what is left to retry"""
+        try:
+            self._write(batch)
+            return []
+        except Exception as e:
+            self._count('failed_flushes')
+            print(f"Error writing login attempts: {e}")
+            if self._stop.is_set():
+                return []
+            # Retry on the next flush; the bounded queue still caps memory
+            return batch[-Config.AUDIT_QUEUE_SIZE:]
+    
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far has been written"""
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            with self._stats_lock:
+                done = self.stats['written'] >= self.stats['queued'] + self.stats['sync_writes']
+            if done:
+                return True
+            time.sleep(0.01)
+        return False
+    
+    def pending(self):
+        return self._queue.qsize()
+    
+    def close(self):
+        """Stop accepting queued writes and drain what is pending"""
+        if self._thread is not None:
+            self._stop.set()
+            try:
+                # Wake the writer immediately instead of at the next interval
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self._thread.join()
+            self._thread = None
\ No newline at end of file
@@ -1,83 +1,216 @@
+import base64
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from config import Config
+from metrics import REGISTRY, stage_timer
 from database import Database
 from face_engine import FaceEngine
+from engine_pool import EnginePool
+from probe_cache import ProbeCache
+from gallery_index import GalleryIndex
+from gallery_shards import ShardedGallery
+from gallery_sync import GallerySync
+from bulk_enroll import BulkEnroller
+from audit_writer import AuditWriter
+from stats_cache import StatsCache
+from stream_session import StreamSession
 
 class AuthManager:
-    def __init__(self):
-        self.db = Database()
+    """Registration, authentication and history on top of the shared services.
+    
+    Building a manager only loads the Haar cascades and sets things up:
+    nothing connects to MongoDB or starts a thread until start(). That
+    lets a server build it, and preload() the gallery snapshot, in its
+    master process before forking workers, which then share those pages
+    and each call start() (see startup.py).
+    """
+    
+    def __init__(self, start=True):
+        self.db = Database(create_indexes=False)
         self.face_engine = FaceEngine()
+        
+        # Detection and encoding run on pooled engines, one per worker
+        self.engine_pool = EnginePool()
+        
+        # Repeated and retried frames skip the engine (and matching while the gallery is unchanged)
+        self.probe_cache = ProbeCache() if Config.PROBE_CACHE_ENABLED else None
+        
+        # Local register/delete update the gallery directly and changes
+        # made by other workers arrive through the gallery sync
+        self.sharded = bool(Config.GALLERY_SHARDS or Config.GALLERY_SHARD_ADDRESSES)
+        if self.sharded:
+            # Shard processes are started (after any fork) by start()
+            self.gallery = ShardedGallery(self.db)
+            self.gallery_sync = GallerySync(self.db, self.gallery, snapshot_dir='')
+        else:
+            self.gallery = GalleryIndex()
+            self.gallery_sync = GallerySync(self.db, self.gallery)
+        
+        # Login attempts are written in batches by a background thread (from start())
+        self.audit = None
+        
+        # Statistics come from counters kept with each write, cached briefly
+        self.stats = StatsCache(self.db)
+        
+        # Worker processes for batch registration are started on first use
+        # Batch registrations get as many processes as the engine pool, not a second full set
+        self.bulk_enroller = BulkEnroller(self.db, workers=Config.ENGINE_WORKERS)
+        
+        # Each streaming session holds its own engine, so their number is capped
+        self.stream_sessions = 0
+        self._stream_lock = threading.Lock()
+        self.started = False
+        self.startup_seconds = {}
+        if start:
+            self.start()
+    
+    def preload(self):
+        """Map the gallery snapshot without connecting; True if there was one"""
+        return self.gallery_sync.preload()
+    
+    def start(self):
+        """Connect, load the gallery and start the engine workers and background threads.
+        
+        Resumable: after a failure, calling it again skips the phases that already finished.
+        """
+        phases = [
+            ('indexes', self.db.create_indexes),
+            ('gallery', self.gallery_sync.load),
+            ('engines', self.engine_pool.warm_up)
+        ]
+        if self.sharded:
+            phases.insert(1, ('shards', self.gallery.start))
+        for phase, step in phases:
+            if phase in self.startup_seconds:
+                continue
+            start = time.perf_counter()
+            step()
+            self.startup_seconds[phase] = round(time.perf_counter() - start, 3)
+        
+        # Each starts its thread only once
+        self.gallery_sync.start()
+        if self.audit is None:
+            self.audit = AuditWriter(self.db)
+        self.stats.start()
+        self._register_gauges()
+        self.started = True
+    
+    def _register_gauges(self):
+        """Expose this worker's gallery, pool and queue state on /api/metrics"""
+        REGISTRY.gauge('face_gallery_size', 'Users in this worker\'s gallery', lambda: len(self.gallery))
+        REGISTRY.gauge(
+            'face_gallery_versions_behind', 'Gallery changes not yet applied by this worker',
+            lambda: self.gallery_sync.staleness()['versions_behind']
+        )
+        if self.sharded:
+            REGISTRY.gauge('face_gallery_shards', 'Gallery shard connections and unanswered requests', lambda: {
+                    key: value for key, value in self.gallery.status().items() if key in ('connected', 'in_flight')
+                })
+        REGISTRY.gauge('face_engine_pool', 'Engine pool load and counters', lambda: {
+                key: value for key, value in self.engine_pool.status().items() if key != 'backend'
+            })
+        if self.probe_cache is not None:
+            REGISTRY.gauge('face_probe_cache', 'Probe cache size and counters', lambda: {
+                    key: value for key, value in self.probe_cache.status().items()
+                    if key not in ('max_bytes', 'ttl', 'perceptual')
+                })
+        REGISTRY.gauge('face_audit_queue_depth', 'Login attempts waiting to be written', self.audit.pending)
+        REGISTRY.gauge(
+            'face_stream_sessions_active', 'Open streaming authentication sessions',
+            lambda: self.stream_sessions
+        )
     
-    def register_user(self, username, full_name, email, base64_image):
-        """Register a new user with face data"""
+    def register_user(self, username, full_name, email, images):
+        """Register a new user with face data from one frame or a short burst"""
         # Validate input
-        if not username or not username.strip():
-            return {
-                'success': False,
-                'message': 'Username cannot be empty'
-            }
+        if not isinstance(username, str) or not username.strip():
+            return self._failure('Username cannot be empty')
         
         username = username.strip()
         
         # Check if user already exists
-        if self.db.get_user_by_username(username):
-            return {
-                'success': False,
-                'message': 'Username already exists'
-            }
+        with stage_timer('db_lookup'):
+            existing = self.db.get_user_by_username(username)
+        if existing:
+            return self._failure('Username already exists')
         
-        # Process face image
-        success, message, encoding = self.face_engine.process_image_for_registration(base64_image)
+        # Process face images, all frames of a burst in parallel
+        images = images if isinstance(images, list) else [images]
+        futures = [self.engine_pool.submit('process_image_for_registration', image) for image in images]
+        results = [self.engine_pool.wait(future) for future in futures]
+        encodings = [encoding for success, _, encoding in results if success]
         
-        if not success:
-            return {
-                'success': False,
-                'message': message
-            }
+        if not encodings:
+            return self._failure(results[0][1])
+        
+        # Keep a few diverse templates and index the user by their centroid
+        with stage_timer('templates'):
+            templates, centroid, inconsistent = FaceEngine.select_templates(encodings)
         
         # Add user to database
-        success, result = self.db.add_user(username, full_name, email, encoding)
+        with stage_timer('db_write'):
+            success, result = self.db.add_user(username, full_name, email, centroid, templates)
         
-        if success:
-            return {
-                'success': True,
-                'message': f'User {username} registered successfully',
-                'user_id': result
-            }
-        else:
-            return {
-                'success': False,
-                'message': f'Failed to register user: {result}'
-            }
+        if not success:
+            return self._failure(f'Failed to register user: {result}')
+        with stage_timer('gallery_update'):
+            self.gallery.add(username, centroid, templates)
+        return self._registration_result(username, result, images, encodings, inconsistent, templates)
+    
+    @staticmethod
+    def _failure(message):
+        """Response for a refused or failed request"""
+        return {
+            'success': False,
+            'message': message
+        }
+    
+    @staticmethod
+    def _registration_result(username, user_id, images, encodings, inconsistent, templates):
+        """Response for a registered user"""
+        return {
+            'success': True,
+            'message': f'User {username} registered successfully',
+            'user_id': user_id,
+            'frames': len(images),
+            'frames_rejected': len(images) - len(encodings) + inconsistent,
+            'templates': len(templates)
+        }
+    
+    def register_users_batch(self, users):
+        """Register many users ({username, full_name, email, image}) in one call"""
+        report = self.bulk_enroller.enroll(users, self.gallery)
+        return dict({
+            'success': report['registered'] > 0 or report['total'] == 0,
+            'message': f"Registered {report['registered']} of {report['total']} users"
+        }, **report)
     
     def authenticate_user(self, base64_image):
         """Authenticate user using face recognition"""
-        # Get all stored face encodings
-        stored_encodings = self.db.get_all_face_encodings()
-        
-        if not stored_encodings:
-            return {
-                'success': False,
-                'message': 'No users registered yet',
-                'confidence': 0.0,
-                'username': None
-            }
+        if len(self.gallery) == 0:
+            return self._authentication_result(False, 'No users registered yet', 0.0, None)
         
-        # Process image and compare
-        success, message, confidence, username = self.face_engine.process_image_for_authentication(
-            base64_image, 
-            stored_encodings
-        )
-        
-        # Log attempt
-        self.db.log_login_attempt(
-            username if username else 'Unknown',
-            success,
-            confidence
-        )
+        # Encode on a pooled engine, then match against the shared gallery
+        key = ProbeCache.key(base64_image) if self.probe_cache is not None else None
+        success, message, encoding = self._encode_probe(base64_image, key)
+        if success:
+            with stage_timer('match'):
+                success, message, confidence, username = self._match_probe(key, encoding)
+        else:
+            confidence, username = 0.0, None
         
-        # Update last login if successful
-        if success and username:
-            self.db.update_last_login(username)
+        # Log attempt (and last login if successful) off the request path
+        with stage_timer('audit'):
+            self.audit.record(username or 'Unknown', success, confidence)
         
+        return self._authentication_result(success, message, confidence, username)
+    
+    @staticmethod
+    def _authentication_result(success, message, confidence, username):
+        """Response for an authentication attempt"""
         return {
             'success': success,
             'message': message,
@@ -85,6 +218,51 @@ class AuthManager:
             'username': username
         }
     
+    def _encode_probe(self, image, key):
+        """Encode a probe on the pool unless the same frame was seen recently"""
+        if self.probe_cache is None:
+            return self.engine_pool.encode_probe(image)
+        
+        probe = self.probe_cache.get_probe(key)
+        if probe is None:
+            signature = FaceEngine.frame_signature(image) if self.probe_cache.perceptual else None
+            if signature is not None:
+                probe = self.probe_cache.get_similar(key, signature)
+            if probe is None:
+                probe = tuple(self.engine_pool.encode_probe(image))
+                self.probe_cache.put_probe(key, probe, signature)
+        return probe
+    
+    def _match_probe(self, key, encoding):
+        """Match a probe, reusing the cached decision while the gallery is unchanged"""
+        if self.probe_cache is None:
+            return FaceEngine.match_probe(encoding, self.gallery)
+        
+        # Read the generation first: a change during the search only makes the decision look stale
+        generation = self.gallery.generation
+        decision = self.probe_cache.get_decision(key, generation)
+        if decision is None:
+            decision = FaceEngine.match_probe(encoding, self.gallery)
+            self.probe_cache.put_decision(key, generation, decision)
+        return decision
+    
+    def open_stream_session(self):
+        """Start a continuous authentication session, None if at capacity"""
+        with self._stream_lock:
+            if self.stream_sessions >= Config.STREAM_MAX_SESSIONS:
+                return None
+            self.stream_sessions += 1
+        try:
+            return StreamSession(self.gallery, self.audit)
+        except Exception:
+            self.close_stream_session(None)
+            raise
+    
+    def close_stream_session(self, session):
+        """Release a session's slot"""
+        with self._stream_lock:
+            self.stream_sessions -= 1
+    
     def get_all_users(self):
         """Get all registered users"""
         users = self.db.get_all_users()
@@ -99,29 +277,79 @@ class AuthManager:
         success = self.db.delete_user(username)
         
         if success:
-            return {
-                'success': True,
-                'message': f'User {username} deleted successfully'
-            }
-        else:
-            return {
-                'success': False,
-                'message': f'User {username} not found'
-            }
+            self.gallery.remove(username)
+        return self._deletion_result(username, success)
     
-    def get_login_history(self, limit=50):
-        """Get login history"""
-        history = self.db.get_login_history(limit)
+    @staticmethod
+    def _deletion_result(username, success):
+        """Response for a user deletion"""
+        if not success:
+            return AuthManager._failure(f'User {username} not found')
+        return {
+            'success': True,
+            'message': f'User {username} deleted successfully'
+        }
+    
+    @staticmethod
+    def _encode_history_cursor(attempt):
+        """Opaque keyset cursor pointing just past an attempt"""
+        position = f"{attempt['timestamp'].isoformat()}|{attempt['_id']}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+    
+    @staticmethod
+    def _decode_history_cursor(cursor):
+        try:
+            timestamp, attempt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(timestamp), ObjectId(attempt_id)
+        except (ValueError, InvalidId):
+            raise ValueError('Invalid history cursor')
+    
+    def get_login_history(self, limit=50, username=None, success=None, cursor=None):
+        """Get a page of login history, optionally for one user or outcome"""
+        before = self._decode_history_cursor(cursor) if cursor else None
+        history = self.db.get_login_history(limit, username, success, before)
+        
+        # A full page may have more after it
+        next_cursor = self._encode_history_cursor(history[-1]) if len(history) == limit else None
+        for attempt in history:
+            del attempt['_id']
         return {
             'success': True,
             'history': history,
-            'count': len(history)
+            'count': len(history),
+            'next_cursor': next_cursor
+        }
+    
+    def export_login_history(self, username=None, success=None, cursor=None):
+        """Iterate over all matching login history (a database cursor, not a list)"""
+        before = self._decode_history_cursor(cursor) if cursor else None
+        return self.db.iter_login_history(username, success, before)
+    
+    def get_statistics(self, series=None, points=None):
+        """Get system statistics, optionally with an hourly or daily success-rate series"""
+        result = {
+            'success': True,
+            'statistics': self.stats.get_statistics()
+        }
+        if series:
+            result['series'] = {
+                'interval': series,
+                'points': self.stats.get_series(series, points)
+            }
+        return result
+    
+    def get_gallery_status(self):
+        """Get gallery size and how far it lags behind the database"""
+        return {
+            'success': True,
+            'gallery': dict({'size': len(self.gallery)}, **self.gallery_sync.staleness()),
+            'shards': self.gallery.status() if self.sharded else None
         }
     
-    def get_statistics(self):
-        """Get system statistics"""
-        stats = self.db.get_user_stats()
+    def get_engine_status(self):
+        """Get engine pool size, backlog and overload counters"""
         return {
             'success': True,
-            'statistics': stats
+            'engine_pool': self.engine_pool.status(),
+            'probe_cache': self.probe_cache.status() if self.probe_cache is not None else None
         }
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""Recall vs. latency of the IVF gallery search against the exact scan.
+
+Run from the backend directory:
+    
+    python -m benchmarks.ann_recall --sizes 10000 100000 --nprobe 1 4 8 16 32
+"""
+import argparse
+import time
+import numpy as np
+from gallery_index import GalleryIndex
+from search_backend import ExactSearch, IVFSearch
+from benchmarks.synthetic import synthetic_gallery, synthetic_probes
+
+def build_index(gallery, backend):
+    index = GalleryIndex(backend=backend)
+    index.load({f'user{i}': row for i, row in enumerate(gallery)})
+    return index
+
+def timed_search(index, probes):
+    results = []
+    latencies = []
+    for probe in probes:
+        start = time.perf_counter()
+        results.append(index.search(probe, k=1)[0][0])
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--nlist', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    
+    print(f"{'gallery':>8} {'mode':>6} {'nprobe':>6} {'recall@1':>9} {'p50 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    for size in args.sizes:
+        gallery = synthetic_gallery(size)
+        probes, _ = synthetic_probes(gallery, args.queries)
+        
+        exact = build_index(gallery, ExactSearch())
+        truth, exact_ms = timed_search(exact, probes)
+        exact_p50 = np.percentile(exact_ms, 50)
+        print(f"{size:>8} {'exact':>6} {'-':>6} {1.0:>9.3f} {exact_p50:>8.2f} "
+              f"{np.percentile(exact_ms, 99):>8.2f} {1.0:>8.1f}")
+        
+        start = time.perf_counter()
+        ivf = IVFSearch(nlist=args.nlist)
+        index = build_index(gallery, ivf)
+        print(f"{size:>8} {'train':>6} {len(ivf._centroids):>6} lists in {time.perf_counter() - start:.1f}s")
+        
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            found, ivf_ms = timed_search(index, probes)
+            recall = np.mean([a == b for a, b in zip(found, truth)])
+            p50 = np.percentile(ivf_ms, 50)
+            print(f"{size:>8} {'ivf':>6} {nprobe:>6} {recall:>9.3f} {p50:>8.2f} "
+                  f"{np.percentile(ivf_ms, 99):>8.2f} {exact_p50 / p50:>8.1f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
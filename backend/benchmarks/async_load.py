@@ -0,0 +1,231 @@
+"""Concurrent-connection capacity and tail latency: Flask (WSGI) vs. the async API.
+
+Starts each server in its own process on the mongomock stand-in, with a
+simulated round-trip time that sync requests wait out in a thread and
+async ones on the event loop:
+    
+    flask    app.py on Werkzeug's threaded server (one thread per connection)
+    gthread  app.py on gunicorn, one gthread worker with --threads threads
+             (preloaded before the fork, as in a production setup)
+    asgi     asgi_app.py on uvicorn, one worker
+
+Against each, --idle slow clients connect and send part of a request,
+then hold the connection open, while --clients closed-loop clients
+send GET --path for --seconds. Reports the active clients' throughput,
+p50/p99/max latency and failed requests, and the server's threads and
+RSS at the end.
+
+Run from the backend directory (requires the packages named in
+asgi_app.py, gunicorn and mongomock):
+    
+    python -m benchmarks.async_load --idle 0 1000 --clients 16 --rtt-ms 20
+"""
+import argparse
+import http.client
+import logging
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from benchmarks.suite import summarize
+
+SERVERS = ('flask', 'gthread', 'asgi')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def process_tree(pid):
+    """pid and all its descendants"""
+    pids = [pid]
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/task/{child}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def server_resources(pid):
+    """(threads, RSS MiB) summed over the server's processes"""
+    threads, rss_kb = 0, 0
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        threads += int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        rss_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return threads, rss_kb / 1024
+
+def serve(args):
+    """Seed the stand-in and run one server (in the child process)"""
+    from config import Config
+    from benchmarks.stand_in import use_async_stand_in, use_stand_in
+    from benchmarks.synthetic import synthetic_gallery
+    import database
+    
+    Config.GALLERY_SNAPSHOT_DIR = ''
+    Config.METRICS_ENABLED = False
+    use_stand_in(args.rtt_ms)
+    use_async_stand_in(args.rtt_ms)
+    gallery = synthetic_gallery(args.users)
+    db = database.Database()
+    db.add_users([(f'user{i}', '', '', gallery[i]) for i in range(args.users)])
+    start = datetime.utcnow() - timedelta(days=1)
+    db.log_login_attempts([
+        {'username': f'user{i % args.users}', 'success': i % 3 > 0, 'confidence': 90.0, 'timestamp': start + timedelta(minutes=i)}
+        for i in range(1000)
+    ])
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    
+    if args.serve == 'asgi':
+        import uvicorn
+        import asgi_app
+        uvicorn.run(asgi_app.app, host='127.0.0.1', port=args.port, log_level='error')
+    elif args.serve == 'gthread':
+        from gunicorn.app.base import BaseApplication
+        import app as api
+        
+        class Server(BaseApplication):
+            def load_config(self):
+                for key, value in {
+                    'bind': f'127.0.0.1:{args.port}', 'workers': 1, 'worker_class': 'gthread',
+                    'threads': args.threads, 'timeout': 120, 'loglevel': 'error'
+                }.items():
+                    self.cfg.set(key, value)
+            
+            def load(self):
+                return api.app
+        
+        Config.STARTUP_PRELOAD = True
+        api.create_app()
+        Server().run()
+    else:
+        from werkzeug.serving import make_server
+        import app as api
+        api.create_app()
+        make_server('127.0.0.1', args.port, api.app, threaded=True).serve_forever()
+
+def hold_idle(port, count):
+    """Open `count` connections that each send part of a request and stall"""
+    sockets = []
+    for _ in range(count):
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=2)
+            sock.sendall(b'GET /api/health HTTP/1.1\r\nHost: localhost\r\n')
+            sockets.append(sock)
+        except OSError:
+            break
+    return sockets
+
+def drive(port, path, clients, seconds, timeout):
+    """Closed-loop clients; returns (latencies, failures, elapsed)"""
+    latencies = [[] for _ in range(clients)]
+    failures = [0] * clients
+    deadline = time.perf_counter() + seconds
+    
+    def client(i):
+        connection = None
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise OSError(f'HTTP {response.status}')
+                latencies[i].append(time.perf_counter() - start)
+            except OSError:
+                failures[i] += 1
+                connection.close()
+                connection = None
+        if connection is not None:
+            connection.close()
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [t for per_client in latencies for t in per_client], sum(failures), time.perf_counter() - start
+
+def run(args, server, idle):
+    port = free_port()
+    child = subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.async_load', '--serve', server, '--port', str(port),
+        '--rtt-ms', str(args.rtt_ms), '--users', str(args.users), '--threads', str(args.threads)
+    ], stdout=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/api/ready')
+                if connection.getresponse().status == 200:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.05)
+        
+        sockets = hold_idle(port, idle)
+        time.sleep(1)
+        latencies, failures, elapsed = drive(port, args.path, args.clients, args.seconds, args.timeout)
+        threads, rss = server_resources(child.pid)
+        for sock in sockets:
+            sock.close()
+        
+        result = summarize(latencies, elapsed) if latencies else {'throughput': 0, 'p50_ms': None, 'p99_ms': None}
+        result.update({
+            'idle': len(sockets),
+            'max_ms': round(max(latencies) * 1000, 1) if latencies else None,
+            'failures': failures,
+            'threads': threads,
+            'rss_mib': rss
+        })
+        return result
+    finally:
+        child.terminate()
+        child.wait()
+
+def cell(value):
+    return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=SERVERS)
+    parser.add_argument('--idle', nargs='+', type=int, default=[0, 1000])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=5.0, help='Per-request client timeout')
+    parser.add_argument('--path', default='/api/history?limit=20')
+    parser.add_argument('--rtt-ms', type=float, default=20.0)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=32, help='gthread worker threads')
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args)
+        return
+    
+    print(f"{'server':>8} {'idle':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7} {'threads':>8} {'RSS MiB':>8}")
+    for server in args.servers:
+        for idle in args.idle:
+            r = run(args, server, idle)
+            print(
+                f"{server:>8} {r['idle']:>6} {r['throughput']:>8.1f} {cell(r['p50_ms'])} {cell(r['p99_ms'])} "
+                f"{cell(r['max_ms'])} {r['failures']:>7} {r['threads']:>8} {r['rss_mib']:>8.1f}"
+            )
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""authenticate_user latency with synchronous vs. background audit writes.
+
+Uses the mongomock stand-in with a simulated database round-trip time,
+so the two audit writes per request show up the way they would against
+a remote MongoDB.
+
+Run from the backend directory:
+    
+    python -m benchmarks.audit_latency --rtt-ms 2 --requests 200
+"""
+import argparse
+import base64
+import time
+import cv2
+import numpy as np
+from config import Config
+from benchmarks.stand_in import use_stand_in
+from benchmarks.synthetic import synthetic_face_image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rtt-ms', type=float, default=2.0)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+    
+    # The same frame is sent every time: measure the pipeline, not the probe cache
+    Config.PROBE_CACHE_ENABLED = False
+    use_stand_in(args.rtt_ms)
+    from auth_manager import AuthManager
+    
+    image = synthetic_face_image(640, 480, seed=1)
+    probe = 'data:image/jpeg;base64,' + base64.b64encode(cv2.imencode('.jpg', image)[1]).decode()
+    
+    print(f"{'audit':>6} {'p50 ms':>8} {'p99 ms':>8} {'rows':>6}")
+    for mode in (False, True):
+        Config.AUDIT_ASYNC = mode
+        manager = AuthManager()
+        if len(manager.gallery) == 0:
+            # Enroll the probe's identity plus filler users
+            manager.register_user('probe', '', '', probe)
+            rng = np.random.default_rng(0)
+            filler = manager.gallery.get_encoding('probe')
+            manager.db.add_users([
+                (f'user{i}', '', '', filler * rng.uniform(0.5, 1.5, filler.shape))
+                for i in range(args.users)
+            ])
+            manager.gallery_sync.load()
+        
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            manager.authenticate_user(probe)
+            latencies.append((time.perf_counter() - start) * 1000)
+        manager.audit.close()
+        manager.gallery_sync.stop()
+        
+        rows = manager.db.login_attempts.count_documents({})
+        print(f"{'async' if mode else 'sync':>6} {np.percentile(latencies, 50):>8.2f} "
+              f"{np.percentile(latencies, 99):>8.2f} {rows:>6}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
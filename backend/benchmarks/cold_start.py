@@ -0,0 +1,122 @@
+"""Gallery cold-start time: full database load vs. memory-mapped snapshot.
+
+For each gallery size the database path decodes every user document from
+BSON (the client-side half of get_all_face_encodings; a real server adds
+its scan and transfer time on top) and builds the GalleryIndex. The
+snapshot path runs in a fresh process: it maps the snapshot written from
+that index, catches up on --delta users registered after it through
+GallerySync (against a mongomock stand-in), and serves a first search.
+The page cache is warm, as it is for any worker after the first on a host.
+
+Run from the backend directory:
+    
+    python -m benchmarks.cold_start --users 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import bson
+from config import Config
+from database import Database
+from gallery_index import GalleryIndex
+from gallery_snapshot import write_snapshot
+from benchmarks.synthetic import synthetic_gallery
+
+def database_load(count, chunk=50000):
+    """Decode user documents as the driver returns them and build the index"""
+    gallery = synthetic_gallery(count)
+    payloads = [
+        b''.join(
+            bson.encode(dict({'username': f'user{i}'}, **Database._encode_face_encoding(gallery[i])))
+            for i in range(start, min(start + chunk, count))
+        )
+        for start in range(0, count, chunk)
+    ]
+    del gallery
+    
+    start = time.perf_counter()
+    encodings = {}
+    for payload in payloads:
+        for user in bson.decode_all(payload):
+            encodings[user['username']] = Database._decode_face_encoding(user)
+    decoded = time.perf_counter()
+    del payloads
+    
+    index = GalleryIndex()
+    index.load(encodings)
+    del encodings
+    return index, decoded - start, time.perf_counter() - decoded
+
+def snapshot_start(directory, delta):
+    """Child process: cold start from the snapshot plus a catch-up of `delta` users"""
+    from benchmarks.stand_in import use_stand_in
+    use_stand_in()
+    from gallery_snapshot import open_snapshot
+    from gallery_sync import GallerySync
+    
+    # Mapping alone, before any catch-up
+    start = time.perf_counter()
+    snapshot = open_snapshot(directory)
+    GalleryIndex().load_arrays(snapshot['usernames'], snapshot['matrix'], snapshot['stats'], snapshot['templates'])
+    mapped = time.perf_counter() - start
+    
+    # Users registered after the snapshot was taken (versions 1..delta)
+    db = Database()
+    extra = synthetic_gallery(delta, seed=1)
+    db.add_users([(f'new{i}', '', '', extra[i]) for i in range(delta)])
+    
+    Config.GALLERY_SNAPSHOT_DIR = directory
+    sync = GallerySync(db, GalleryIndex())
+    start = time.perf_counter()
+    sync.load()
+    loaded = time.perf_counter()
+    sync.gallery.search(extra[0], k=1)
+    searched = time.perf_counter()
+    
+    print(json.dumps({
+        'loaded_from': sync.loaded_from,
+        'size': len(sync.gallery),
+        'map': mapped,
+        'load': loaded - start,
+        'first_search': searched - loaded
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--delta', type=int, default=1000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        snapshot_start(args.child, args.delta)
+        return
+    
+    print(f"{'users':>8} {'db decode s':>12} {'db index s':>11} {'db total s':>11} "
+          f"{'snap write s':>13} {'snap MiB':>9} {'snap map s':>11} {'map+sync s':>12} {'1st search s':>13}")
+    for count in args.users:
+        index, decode, build = database_load(count)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            write_snapshot(index, 0, directory)
+            written = time.perf_counter() - start
+            del index
+            size = sum(os.stat(os.path.join(directory, name)).st_blocks * 512 for name in os.listdir(directory))
+            
+            child = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.cold_start', '--child', directory, '--delta', str(args.delta)],
+                capture_output=True, text=True, check=True
+            )
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            assert result['loaded_from'] == 'snapshot' and result['size'] == count + args.delta
+        
+        print(f"{count:>8} {decode:>12.3f} {build:>11.3f} {decode + build:>11.3f} "
+              f"{written:>13.3f} {size / 2**20:>9.1f} {result['map']:>11.3f} {result['load']:>12.3f} {result['first_search']:>13.3f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""Face detection latency and hit rate: full-resolution vs. downscaled + ROI refinement.
+
+Synthetic faces of several sizes and positions are drawn into frames of
+each resolution. A hit is exactly one detection whose center lies within
+a quarter face-size of the drawn face's center.
+
+Run from the backend directory:
+    
+    python -m benchmarks.detection --resolutions 640x480 1280x720 1920x1080 --downscale-widths 320 480 640
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from config import Config
+from face_engine import FaceEngine
+from benchmarks.synthetic import synthetic_face_image
+
+def fixtures(width, height, count):
+    """(image, center, face size) triples with varied scale and position"""
+    rng = np.random.default_rng(width)
+    items = []
+    for seed in range(count):
+        scale = rng.uniform(0.6, 1.4)
+        size = int(min(width, height) * 0.25 * scale)
+        cx = int(rng.uniform(size, width - size))
+        cy = int(rng.uniform(size * 1.4, height - size))
+        image = synthetic_face_image(width, height, scale=scale, seed=seed, center=(cx, cy))
+        items.append((cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (cx, cy), size))
+    return items
+
+def run(engine, items):
+    hits, latencies = 0, []
+    for gray, (cx, cy), size in items:
+        start = time.perf_counter()
+        faces, _ = engine.detect_faces(gray)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if len(faces) == 1:
+            x, y, w, h = faces[0]
+            hits += np.hypot(x + w / 2 - cx, y + h / 2 - cy) < size / 4
+    return hits / len(items), np.median(latencies), np.percentile(latencies, 95)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolutions', nargs='+', default=['640x480', '1280x720', '1920x1080'])
+    parser.add_argument('--downscale-widths', type=int, nargs='+', default=[320, 400, 480, 640])
+    parser.add_argument('--images', type=int, default=30)
+    args = parser.parse_args()
+    
+    cv2.setNumThreads(1)
+    engine = FaceEngine()
+    print(f"{'frame':>10} {'mode':>16} {'hit rate':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.split('x'))
+        items = fixtures(width, height, args.images)
+        
+        modes = [('full', None)] + [('downscaled', w) for w in args.downscale_widths if w < width]
+        for mode, target_width in modes:
+            Config.FACE_DETECTION_MODE = mode
+            if target_width:
+                Config.FACE_DETECTION_MAX_WIDTH = 0
+                Config.FACE_DETECTION_DOWNSCALE_WIDTH = target_width
+            hit_rate, p50, p95 = run(engine, items)
+            label = mode if target_width is None else f"{mode}@{target_width}"
+            print(f"{resolution:>10} {label:>16} {hit_rate:>9.2f} {p50:>8.2f} {p95:>8.2f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
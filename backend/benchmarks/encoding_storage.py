@@ -0,0 +1,55 @@
+"""Document size and full-gallery load time: BSON double arrays vs. binary blobs.
+
+Builds user documents exactly as Database writes them, encodes them to
+BSON (what MongoDB stores and sends over the wire), then times the
+client-side path of get_all_face_encodings: BSON decoding plus turning
+each encoding back into a NumPy array.
+
+Run from the backend directory:
+    
+    python -m benchmarks.encoding_storage --users 10000 100000
+"""
+import argparse
+import time
+import bson
+import numpy as np
+from database import Database
+from benchmarks.synthetic import synthetic_gallery
+
+def legacy_document(username, encoding):
+    return {'username': username, 'face_encoding': encoding.astype(np.float64).tolist()}
+
+def binary_document(username, encoding, dtype):
+    return dict({'username': username}, **Database._encode_face_encoding(encoding, dtype))
+
+def load_gallery(payload):
+    """Decode a BSON stream and rebuild the {username: encoding} mapping"""
+    start = time.perf_counter()
+    encodings = {
+        user['username']: Database._decode_face_encoding(user)
+        for user in bson.decode_all(payload)
+    }
+    return encodings, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+    
+    print(f"{'users':>8} {'storage':>8} {'bytes/doc':>10} {'total MiB':>10} {'load s':>8} {'max |err|':>10}")
+    for count in args.users:
+        gallery = synthetic_gallery(count).astype(np.float64)
+        layouts = (
+            ('list', lambda i: legacy_document(f'user{i}', gallery[i])),
+            ('float32', lambda i: binary_document(f'user{i}', gallery[i], 'float32')),
+            ('float16', lambda i: binary_document(f'user{i}', gallery[i], 'float16')),
+        )
+        for name, build in layouts:
+            payload = b''.join(bson.encode(build(i)) for i in range(count))
+            encodings, elapsed = load_gallery(payload)
+            error = max(np.abs(encodings[f'user{i}'] - gallery[i]).max() for i in range(0, count, 97))
+            print(f"{count:>8} {name:>8} {len(payload) / count:>10.0f} {len(payload) / 2**20:>10.1f} "
+                  f"{elapsed:>8.3f} {error:>10.1e}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""Authentication throughput through the engine pool vs. worker count.
+
+Closed-loop clients each submit encode_probe jobs for synthetic JPEG
+frames back to back; requests per second is completed jobs over wall
+time. Run with at least as many clients as workers so every worker is
+busy. Throughput can only scale up to the number of physical cores.
+
+Run from the backend directory:
+    
+    python -m benchmarks.engine_pool --workers 1 2 4 8 --backends thread process
+"""
+import argparse
+import os
+import threading
+import time
+import cv2
+from engine_pool import EngineOverloaded, EnginePool
+from benchmarks.synthetic import synthetic_face_image
+
+def run_clients(pool, frames, clients, duration):
+    """Drive the pool with closed-loop clients, returns (completed, rejected, elapsed)"""
+    completed = [0] * clients
+    rejected = [0] * clients
+    deadline = time.perf_counter() + duration
+    
+    def client(i):
+        n = i
+        while time.perf_counter() < deadline:
+            try:
+                pool.encode_probe(frames[n % len(frames)])
+                completed[i] += 1
+            except EngineOverloaded:
+                rejected[i] += 1
+            n += 1
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(completed), sum(rejected), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--backends', nargs='+', default=['thread', 'process'])
+    parser.add_argument('--clients-per-worker', type=int, default=2)
+    parser.add_argument('--resolution', default='640x480')
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+    
+    width, height = (int(v) for v in args.resolution.split('x'))
+    frames = [
+        cv2.imencode('.jpg', synthetic_face_image(width, height, seed=seed))[1].tobytes()
+        for seed in range(16)
+    ]
+    
+    print(f"{os.cpu_count()} CPUs, {args.resolution} frames")
+    print(f"{'backend':>8} {'workers':>8} {'clients':>8} {'req/s':>8} {'speedup':>8} {'rejected':>9}")
+    for backend in args.backends:
+        baseline = None
+        for workers in sorted(set(args.workers)):
+            clients = workers * args.clients_per_worker
+            pool = EnginePool(workers=workers, backend=backend, queue_size=clients)
+            try:
+                # Warm up every worker before measuring
+                run_clients(pool, frames, clients, 0.5)
+                completed, rejected, elapsed = run_clients(pool, frames, clients, args.duration)
+            finally:
+                pool.close()
+            
+            rate = completed / elapsed
+            baseline = baseline or rate
+            print(f"{backend:>8} {workers:>8} {clients:>8} {rate:>8.1f} {rate / baseline:>7.2f}x {rejected:>9}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""Per-frame cost of detect -> validate -> encode, legacy path vs. FrameContext.
+
+Run from the backend directory:
+    
+    python -m benchmarks.frame_pipeline --resolutions 640x480 1280x720 1920x1080
+"""
+import argparse
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from config import Config
+from face_engine import FaceEngine, FrameContext
+from benchmarks.reference import legacy_features
+from benchmarks.synthetic import synthetic_face_image
+
+def legacy_encode(engine, image, face):
+    """Pre-FrameContext encoding: its own cvtColor, list building and float64 Sobel"""
+    x, y, w, h = face
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    face_roi = cv2.equalizeHist(cv2.resize(gray[y:y+h, x:x+w], Config.IMAGE_SIZE))
+    return legacy_features(face_roi)
+
+def legacy_pipeline(engine, image, stages='all'):
+    """The pre-FrameContext pipeline: three cvtColor calls and float64 Sobel"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    face = FACE_BOXES[image.shape]
+    if stages == 'all':
+        engine.face_cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(100, 100), flags=cv2.CASCADE_SCALE_IMAGE
+        )
+    
+    x, y, w, h = face
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if stages == 'all':
+        engine.eye_cascade.detectMultiScale(gray[y:y+h, x:x+w], scaleFactor=1.1, minNeighbors=3, minSize=(20, 20))
+    
+    return legacy_encode(engine, image, face)
+
+def context_pipeline(engine, image, stages='all'):
+    frame = FrameContext(image)
+    face = FACE_BOXES[image.shape]
+    if stages == 'all':
+        engine.detect_faces(frame)
+        engine.validate_face(frame, face)
+    else:
+        frame.gray
+    return engine.extract_face_encoding(frame, face)
+
+# Face box per frame shape, found once so every path encodes the same ROI
+FACE_BOXES = {}
+
+def measure(pipeline, engine, image, repeats, stages):
+    pipeline(engine, image, stages)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        pipeline(engine, image, stages)
+    elapsed = (time.perf_counter() - start) / repeats
+    
+    tracemalloc.start()
+    pipeline(engine, image, stages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolutions', nargs='+', default=['640x480', '1280x720', '1920x1080'])
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    
+    cv2.setNumThreads(1)
+    engine = FaceEngine()
+    print(f"{'frame':>10} {'stages':>12} {'path':>8} {'ms/frame':>9} {'peak KiB':>9} {'max |diff|':>11}")
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.split('x'))
+        
+        # First synthetic identity the cascade detects at this resolution
+        for seed in range(10):
+            image = synthetic_face_image(width, height, seed=seed)
+            faces, _ = engine.detect_faces(image)
+            if len(faces) == 1:
+                break
+        else:
+            print(f"{resolution:>10} no face detected, skipping")
+            continue
+        FACE_BOXES[image.shape] = faces[0]
+        
+        diff = np.abs(legacy_pipeline(engine, image) - context_pipeline(engine, image)).max()
+        
+        # 'all' includes both cascades; 'convert+enc' isolates what FrameContext changes
+        for stages in ('all', 'convert+enc'):
+            for name, pipeline in (('legacy', legacy_pipeline), ('context', context_pipeline)):
+                ms, peak = measure(pipeline, engine, image, args.repeats, stages)
+                print(f"{resolution:>10} {stages:>12} {name:>8} {ms:>9.2f} {peak:>9.1f} "
+                      f"{diff if name == 'context' else 0:>11.2e}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""Gallery search in one process vs. fanned out to shard worker processes.
+
+For each gallery size, runs --queries probes from --clients concurrent
+threads against the in-process GalleryIndex and against ShardedGallery
+with each of --shards local shard processes, and reports throughput,
+p50/p99 latency and top-1 agreement with the in-process search.
+
+The slow-shard run stops one shard (SIGSTOP) for the whole run, so
+every search waits out the deadline and merges the rest: latency is
+bounded by --deadline and only probes whose match lived on the stopped
+shard are missed. Shards scan in parallel only with a CPU per shard.
+
+Run from the backend directory:
+    
+    python -m benchmarks.gallery_shards --sizes 100000 --shards 2 4 --clients 8
+"""
+import argparse
+import os
+import signal
+import threading
+import time
+import numpy as np
+from gallery_index import GalleryIndex
+from gallery_shards import ShardedGallery
+from benchmarks.suite import summarize
+from benchmarks.synthetic import synthetic_gallery, synthetic_probes
+
+def run_searches(gallery, probes, clients):
+    """Search every probe from `clients` threads; returns (top-1 usernames, latencies, elapsed)"""
+    found = [None] * len(probes)
+    latencies = [0.0] * len(probes)
+    
+    def client(offset):
+        for i in range(offset, len(probes), clients):
+            start = time.perf_counter()
+            matches = gallery.search(probes[i], k=1)
+            latencies[i] = time.perf_counter() - start
+            found[i] = matches[0][0] if matches else None
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return found, latencies, time.perf_counter() - start
+
+def report(size, label, truth, found, latencies, elapsed, partial='-'):
+    r = summarize(latencies, elapsed)
+    agreement = np.mean([a == b for a, b in zip(found, truth)])
+    print(f"{size:>8} {label:>12} {r['throughput']:>8.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+          f"{agreement:>7.3f} {partial:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000])
+    parser.add_argument('--shards', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--deadline', type=float, default=0.25, help='GALLERY_SHARD_DEADLINE (seconds)')
+    args = parser.parse_args()
+    
+    print(f"{'gallery':>8} {'search':>12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'top-1':>7} {'partial':>8}")
+    for size in args.sizes:
+        gallery = synthetic_gallery(size)
+        encodings = {f'user{i}': row for i, row in enumerate(gallery)}
+        probes, _ = synthetic_probes(gallery, args.queries)
+        
+        local = GalleryIndex()
+        local.load(encodings)
+        truth, latencies, elapsed = run_searches(local, probes, args.clients)
+        report(size, 'in-process', truth, truth, latencies, elapsed)
+        
+        for count in args.shards:
+            sharded = ShardedGallery(shards=count, shard_by='hash', addresses='', deadline=args.deadline)
+            try:
+                sharded.start()
+                sharded.load(encodings)
+                found, latencies, elapsed = run_searches(sharded, probes, args.clients)
+                report(size, f'{count} shards', truth, found, latencies, elapsed, sharded.stats['partial'])
+                
+                # One shard stalls for the whole run
+                stalled = sharded._shards[0]
+                os.kill(stalled.process.pid, signal.SIGSTOP)
+                try:
+                    before = sharded.stats['partial']
+                    found, latencies, elapsed = run_searches(sharded, probes, args.clients)
+                    report(size, f'{count}, 1 slow', truth, found, latencies, elapsed, sharded.stats['partial'] - before)
+                finally:
+                    os.kill(stalled.process.pid, signal.SIGCONT)
+            finally:
+                sharded.close()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""Hit rate and match cost of single-frame vs. burst (multi-template) enrollment.
+
+Each synthetic identity is enrolled once from a single frame and once
+from a burst of frames with varied pose, scale and lighting (one of them
+motion-blurred), then authenticated with further varied frames. Enrolled
+identities sit in a gallery padded with synthetic distractors.
+
+Run from the backend directory:
+    
+    python -m benchmarks.multi_template --identities 30 --burst 5 --probes 10
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from config import Config
+from face_engine import FaceEngine
+from gallery_index import GalleryIndex
+from benchmarks.synthetic import synthetic_face_image, synthetic_gallery
+
+def varied_frame(width, height, seed, rng, blur=False):
+    """A frame of one identity with random placement, scale, tilt and lighting"""
+    center = (width // 2 + int(rng.integers(-40, 41)), height // 2 + int(rng.integers(-30, 31)))
+    image = synthetic_face_image(width, height, scale=rng.uniform(0.85, 1.15), seed=seed, center=center)
+    rotation = cv2.getRotationMatrix2D(center, rng.uniform(-8, 8), 1.0)
+    image = cv2.warpAffine(image, rotation, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    image = cv2.convertScaleAbs(image, alpha=rng.uniform(0.75, 1.25), beta=rng.uniform(-25, 25))
+    if blur:
+        kernel = np.zeros((15, 15), np.float32)
+        kernel[7] = 1 / 15
+        image = cv2.filter2D(image, -1, kernel)
+    return image
+
+def encode(engine, image, registration=True):
+    image = cv2.imencode('.jpg', image)[1].tobytes()
+    if registration:
+        success, _, encoding = engine.process_image_for_registration(image)
+    else:
+        success, _, encoding = engine.encode_probe(image)
+    return encoding if success else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--identities', type=int, default=30)
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--probes', type=int, default=10)
+    parser.add_argument('--distractors', type=int, default=10000)
+    parser.add_argument('--resolution', default='640x480')
+    args = parser.parse_args()
+    
+    width, height = (int(v) for v in args.resolution.split('x'))
+    engine = FaceEngine()
+    rng = np.random.default_rng(0)
+    distractors = {f'synthetic_{i}': row for i, row in enumerate(synthetic_gallery(args.distractors))}
+    
+    single, burst, burst_templates = {}, {}, {}
+    probes = []
+    seed = 0
+    while len(single) < args.identities:
+        seed += 1
+        first = encode(engine, varied_frame(width, height, seed, rng))
+        if first is None:
+            continue
+        frames = [varied_frame(width, height, seed, rng, blur=i == 1) for i in range(args.burst - 1)]
+        encodings = [first] + [e for e in (encode(engine, frame) for frame in frames) if e is not None]
+        templates, centroid, _ = FaceEngine.select_templates(encodings)
+        
+        name = f'user_{seed}'
+        single[name] = first
+        burst[name] = centroid
+        burst_templates[name] = templates
+        for _ in range(args.probes):
+            probes.append((name, encode(engine, varied_frame(width, height, seed, rng), registration=False)))
+    
+    galleries = {
+        'single': GalleryIndex(),
+        'burst': GalleryIndex()
+    }
+    galleries['single'].load(dict(distractors, **single))
+    galleries['burst'].load(dict(distractors, **burst), burst_templates)
+    
+    print(f"{args.identities} identities, burst of {args.burst}, {len(probes)} probes, "
+          f"gallery {len(galleries['single'])}, threshold {Config.FACE_MATCH_THRESHOLD}")
+    print(f"{'enrollment':>11} {'templates':>10} {'hit rate':>9} {'top-1':>7} {'mean sim':>9} {'search ms':>10}")
+    for name, gallery in galleries.items():
+        hits = top1 = 0
+        similarities = []
+        times = []
+        for expected, probe in probes:
+            if probe is None:
+                continue
+            start = time.perf_counter()
+            matches = gallery.search(probe, k=1)
+            times.append((time.perf_counter() - start) * 1000)
+            username, similarity = matches[0]
+            top1 += username == expected
+            hits += username == expected and similarity >= Config.FACE_MATCH_THRESHOLD
+            similarities.append(similarity if username == expected else 0.0)
+        templates = np.mean([len(t) for t in burst_templates.values()]) if name == 'burst' else 1
+        print(f"{name:>11} {templates:>10.1f} {hits / len(times):>9.3f} {top1 / len(times):>7.3f} "
+              f"{np.mean(similarities):>9.3f} {np.median(times):>10.3f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
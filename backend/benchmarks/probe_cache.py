@@ -0,0 +1,80 @@
+"""Latency of repeated and retried authentication frames with the probe cache.
+
+Sends authenticate_user (mongomock stand-in) four kinds of traffic:
+unique frames, byte-identical retries, near-identical frames (the same
+scene with fresh sensor noise, re-encoded) and retries right after a
+gallery change. The cache is run off, exact-only and with
+PROBE_CACHE_PERCEPTUAL.
+
+Run from the backend directory:
+    
+    python -m benchmarks.probe_cache --requests 100
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from config import Config
+from benchmarks.stand_in import use_stand_in
+from benchmarks.synthetic import synthetic_face_image, synthetic_gallery
+
+def noisy_jpeg(image, rng, amplitude=3):
+    noise = rng.integers(-amplitude, amplitude + 1, image.shape)
+    return cv2.imencode('.jpg', np.clip(image.astype(int) + noise, 0, 255).astype(np.uint8))[1].tobytes()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--gallery-size', type=int, default=10000)
+    args = parser.parse_args()
+    
+    Config.GALLERY_SNAPSHOT_DIR = ''
+    use_stand_in()
+    from auth_manager import AuthManager
+    from probe_cache import ProbeCache
+    manager = AuthManager()
+    gallery = synthetic_gallery(args.gallery_size)
+    manager.db.add_users([(f'user{i}', '', '', gallery[i]) for i in range(args.gallery_size)])
+    
+    rng = np.random.default_rng(0)
+    scenes = [synthetic_face_image(640, 480, seed=seed) for seed in range(1, 9)]
+    manager.register_user('probe', '', '', cv2.imencode('.jpg', scenes[0])[1].tobytes())
+    manager.gallery_sync.reload()
+    
+    def traffic(kind):
+        if kind == 'unique':
+            # Different scenes, and the same scenes moved by a few pixels
+            return [
+                noisy_jpeg(np.roll(scenes[i % len(scenes)], 4 * (i // len(scenes)), axis=1), rng)
+                for i in range(args.requests)
+            ]
+        if kind == 'near-identical':
+            return [noisy_jpeg(scenes[0], rng) for _ in range(args.requests)]
+        return [cv2.imencode('.jpg', scenes[0])[1].tobytes()] * args.requests
+    
+    modes = {'off': None, 'exact': ProbeCache(perceptual=False), 'perceptual': ProbeCache(perceptual=True)}
+    print(f"{'traffic':>16} " + ' '.join(f"{mode + ' mean ms':>18}" for mode in modes))
+    for kind in ('unique', 'identical', 'near-identical', 'gallery change'):
+        frames = traffic(kind)
+        row = []
+        for mode, cache in modes.items():
+            manager.probe_cache = cache
+            if cache is not None:
+                cache.clear()
+            times = []
+            for i, frame in enumerate(frames):
+                if kind == 'gallery change' and i % 2 == 0:
+                    # Every other retry follows a registration elsewhere
+                    manager.gallery.add(f'other{i}', gallery[i % len(gallery)])
+                start = time.perf_counter()
+                manager.authenticate_user(frame)
+                times.append((time.perf_counter() - start) * 1000)
+            row.append(np.mean(times))
+        print(f"{kind:>16} " + ' '.join(f"{value:>18.3f}" for value in row))
+    
+    for mode in ('exact', 'perceptual'):
+        print(f"{mode}: {modes[mode].status()}")
+    manager.audit.close()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
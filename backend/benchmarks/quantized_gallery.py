@@ -0,0 +1,142 @@
+"""Memory, scan speed and match decisions of the quantized gallery vs. float32.
+
+For each gallery size, compares the 'exact' backend (float32 rows in
+memory) with 'quantized' (uint8 codes in memory, float rows memory-mapped
+and only read to re-score the shortlist):
+    
+    memory   anonymous (unreclaimable) and file-backed resident memory
+             added by loading the gallery, measured in a fresh process;
+             'float64' is the encodings as decoded from the database
+    scan     one probe against the whole gallery: the float32 fused score
+             vs. the integer scan that builds the shortlist
+    search   end-to-end GalleryIndex.search(k=1) latency
+    changed  genuine and impostor probes whose decision (matched user,
+             or no match below --threshold) differs from float scoring,
+             with the re-scoring and from the integer scores alone
+
+Run from the backend directory:
+    
+    python -m benchmarks.quantized_gallery --sizes 100000 1000000 --queries 200
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+from config import Config
+from face_engine import FaceEngine
+from gallery_index import GalleryIndex
+from search_backend import ExactSearch, QuantizedSearch
+from benchmarks.synthetic import synthetic_gallery, synthetic_probes
+
+def resident_kib():
+    """(anonymous, file-backed) resident memory of this process in KiB"""
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('RssAnon:', 'RssFile:')):
+                key, value = line.split()[:2]
+                values[key] = int(value)
+    return values['RssAnon:'], values['RssFile:']
+
+def measure_memory(args):
+    """Load one gallery in this (child) process and print what the load added"""
+    gallery = synthetic_gallery(args.measure_size)
+    encodings = {f'user{i}': row for i, row in enumerate(gallery)}
+    del gallery
+    if args.measure == 'float64':
+        before = resident_kib()
+        index = {username: row.astype(np.float64) for username, row in encodings.items()}
+    else:
+        backend = QuantizedSearch() if args.measure == 'quantized' else ExactSearch()
+        index = GalleryIndex(backend=backend)
+        before = resident_kib()
+        index.load(encodings)
+    after = resident_kib()
+    print(json.dumps({'anon': (after[0] - before[0]) / 1024, 'file': (after[1] - before[1]) / 1024}))
+
+def memory(size, mode):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.quantized_gallery', '--measure', mode, '--measure-size', str(size)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+def timed(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def decisions(index, probes, threshold):
+    """Matched username (None below the threshold) for each probe"""
+    found = []
+    for probe in probes:
+        matches = index.search(probe, k=1)
+        found.append(matches[0][0] if matches and matches[0][1] >= threshold else None)
+    return found
+
+def approximate_decisions(index, probes, threshold):
+    """Decisions from the integer scan's approximate scores alone, without re-scoring"""
+    found = []
+    for probe in probes:
+        scores = index._backend.approximate_scores(probe)
+        best = int(np.argmax(scores))
+        found.append(index._usernames[best] if scores[best] >= threshold else None)
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--threshold', type=float, default=Config.FACE_MATCH_THRESHOLD)
+    parser.add_argument('--measure', choices=['float64', 'exact', 'quantized'], help=argparse.SUPPRESS)
+    parser.add_argument('--measure-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.measure:
+        measure_memory(args)
+        return
+    
+    for size in args.sizes:
+        print(f"gallery of {size} users, {args.queries} genuine and {args.queries} impostor probes")
+        for mode in ('float64', 'exact', 'quantized'):
+            used = memory(size, mode)
+            print(f"  memory {mode:>9}: {used['anon']:>8.1f} MiB anonymous {used['file']:>8.1f} MiB file-backed")
+        
+        gallery = synthetic_gallery(size)
+        encodings = {f'user{i}': row for i, row in enumerate(gallery)}
+        exact = GalleryIndex(backend=ExactSearch())
+        exact.load(encodings)
+        quantized = GalleryIndex(backend=QuantizedSearch())
+        quantized.load(encodings)
+        del encodings
+        
+        genuine, _ = synthetic_probes(gallery, args.queries)
+        impostors, _ = synthetic_probes(synthetic_gallery(args.queries, seed=7), args.queries)
+        probe = genuine[0]
+        
+        scan_float = timed(lambda: FaceEngine.compare_faces_batch(
+            probe, exact._matrix[:size], exact._norms[:size], exact._means[:size], exact._stds[:size]
+        ), 5)
+        scan_int = timed(lambda: quantized._backend.candidates(probe), 5)
+        print(f"  scan: float32 {scan_float:.1f} ms, uint8 {scan_int:.1f} ms ({scan_float / scan_int:.2f}x)")
+        
+        search_float = timed(lambda: exact.search(probe, k=1), 5)
+        search_int = timed(lambda: quantized.search(probe, k=1), 5)
+        print(f"  search: exact {search_float:.1f} ms, quantized {search_int:.1f} ms "
+              f"(re-scoring {quantized._backend.rescore} rows)")
+        
+        for label, probes in (('genuine', genuine), ('impostor', impostors)):
+            truth = decisions(exact, probes, args.threshold)
+            rescored = decisions(quantized, probes, args.threshold)
+            approximate = approximate_decisions(quantized, probes, args.threshold)
+            accepted = sum(decision is not None for decision in truth)
+            print(f"  {label:>8}: {accepted}/{len(probes)} accepted at {args.threshold}; changed "
+                  f"{sum(a != b for a, b in zip(truth, rescored))} with re-scoring, "
+                  f"{sum(a != b for a, b in zip(truth, approximate))} from integer scores alone")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""Verbatim copies of superseded FaceEngine code paths, kept as benchmark baselines."""
+import cv2
+import numpy as np
+
+def legacy_lbp_features(image):
+    """Per-cell calcHist/normalize loop replaced by the vectorized v1 extractor"""
+    h, w = image.shape
+    cell_h, cell_w = h // 4, w // 4
+    features = []
+    
+    for i in range(4):
+        for j in range(4):
+            cell = image[i*cell_h:(i+1)*cell_h, j*cell_w:(j+1)*cell_w]
+            hist = cv2.calcHist([cell], [0], None, [16], [0, 256])
+            hist = cv2.normalize(hist, hist).flatten()
+            features.extend(hist)
+    
+    return features
+
+def legacy_features(face_roi):
+    """Original list-building encoder with float64 Sobel, for an equalized face ROI"""
+    features = []
+    hist = cv2.calcHist([face_roi], [0], None, [64], [0, 256])
+    features.extend(cv2.normalize(hist, hist).flatten())
+    features.extend(legacy_lbp_features(face_roi))
+    sobelx = cv2.Sobel(face_roi, cv2.CV_64F, 1, 0, ksize=3)
+    sobely = cv2.Sobel(face_roi, cv2.CV_64F, 0, 1, ksize=3)
+    magnitude = np.sqrt(sobelx**2 + sobely**2)
+    grad, _ = np.histogram(magnitude, bins=32, range=(0, 255))
+    features.extend((grad / (grad.sum() + 1e-6)).tolist())
+    return np.array(features)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""Local MongoDB stand-in for benchmarks: mongomock plus simulated round-trip time.
+
+Requires `pip install mongomock`. use_async_stand_in() gives the async
+API (async_database.py) a motor-style view of the same data, whose round
+trips wait on the event loop instead of blocking a thread.
+"""
+import asyncio
+import itertools
+import time
+import mongomock
+import database
+
+class _LatencyCollection:
+    """Collection proxy that sleeps for one round trip on every call"""
+    
+    def __init__(self, collection, rtt):
+        self._collection = collection
+        self._rtt = rtt
+    
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        
+        def call(*args, **kwargs):
+            time.sleep(self._rtt)
+            return attr(*args, **kwargs)
+        return call
+
+class _LatencyDatabase:
+    def __init__(self, db, rtt):
+        self._db = db
+        self._rtt = rtt
+    
+    def __getattr__(self, name):
+        return _LatencyCollection(getattr(self._db, name), self._rtt)
+    
+    def __getitem__(self, name):
+        return self.__getattr__(name)
+
+class _LatencyClient:
+    def __init__(self, client, rtt):
+        self._client = client
+        self._rtt = rtt
+    
+    def __getitem__(self, name):
+        return _LatencyDatabase(self._client[name], self._rtt)
+
+def use_stand_in(rtt_ms=0.0):
+    """Point database.Database at one shared in-memory client with the given RTT"""
+    client = mongomock.MongoClient()
+    database.MongoClient = lambda *args, **kwargs: _LatencyClient(client, rtt_ms / 1000)
+    return client
+
+def set_rtt(rtt_ms):
+    """Change the simulated round-trip time for clients created afterwards"""
+    client = database.MongoClient()._client
+    database.MongoClient = lambda *args, **kwargs: _LatencyClient(client, rtt_ms / 1000)
+
+class _AsyncCursor:
+    """Motor-style cursor: chainable, with to_list() and async iteration"""
+    
+    def __init__(self, cursor, rtt):
+        self._cursor = cursor
+        self._rtt = rtt
+        self._batch_size = 101
+    
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+    
+    def limit(self, limit):
+        self._cursor = self._cursor.limit(limit)
+        return self
+    
+    def batch_size(self, batch_size):
+        self._batch_size = batch_size
+        return self
+    
+    async def to_list(self, length=None):
+        await asyncio.sleep(self._rtt)
+        return list(itertools.islice(self._cursor, length))
+    
+    async def __aiter__(self):
+        # One round trip per batch
+        while True:
+            await asyncio.sleep(self._rtt)
+            batch = list(itertools.islice(self._cursor, self._batch_size))
+            for document in batch:
+                yield document
+            if len(batch) < self._batch_size:
+                return
+
+class _AsyncCollection:
+    """Collection proxy whose calls are coroutines that wait one round trip"""
+    
+    def __init__(self, collection, rtt):
+        self._collection = collection
+        self._rtt = rtt
+    
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        if name in ('find', 'aggregate'):
+            return lambda *args, **kwargs: _AsyncCursor(attr(*args, **kwargs), self._rtt)
+        
+        async def call(*args, **kwargs):
+            await asyncio.sleep(self._rtt)
+            return attr(*args, **kwargs)
+        return call
+
+class _AsyncDatabase(_LatencyDatabase):
+    def __getattr__(self, name):
+        return _AsyncCollection(getattr(self._db, name), self._rtt)
+
+class _AsyncClient(_LatencyClient):
+    def __getitem__(self, name):
+        return _AsyncDatabase(self._client[name], self._rtt)
+
+def use_async_stand_in(rtt_ms=0.0):
+    """Point async_database.AsyncDatabase at the use_stand_in() data with the given RTT"""
+    import async_database
+    client = database.MongoClient()._client
+    async_database.AsyncIOMotorClient = lambda *args, **kwargs: _AsyncClient(client, rtt_ms / 1000)
+    return client
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""Time to first request for each STARTUP_WARMUP mode.
+
+Starts the API in a fresh process per run (mongomock stand-in with a
+simulated round-trip time and a seeded gallery) and measures, from the
+moment that process starts importing app.py:
+    
+    bound    /api/health answers (the port is open)
+    first    the first POST /api/authenticate has been answered
+    ready    /api/ready reports warm-up finished
+    next     latency of the second POST /api/authenticate
+
+'eager' is how the API used to start: everything is loaded before the
+port opens. The gallery is seeded before the clock starts, which already
+imports NumPy and OpenCV.
+
+Run from the backend directory:
+    
+    python -m benchmarks.startup_time --gallery-size 2000 --rtt-ms 1
+"""
+import argparse
+import http.client
+import json
+import logging
+import socket
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+def serve(args):
+    """Seed the stand-in, then import and serve the app (runs in the child process)"""
+    from config import Config
+    from benchmarks.stand_in import use_stand_in
+    from benchmarks.synthetic import synthetic_gallery
+    
+    Config.GALLERY_SNAPSHOT_DIR = ''
+    Config.PROBE_CACHE_ENABLED = False
+    Config.STARTUP_WARMUP = args.serve
+    use_stand_in(args.rtt_ms)
+    import database
+    gallery = synthetic_gallery(args.gallery_size)
+    database.Database(create_indexes=False).add_users(
+        [(f'user{i}', '', '', gallery[i]) for i in range(args.gallery_size)]
+    )
+    print(time.time(), flush=True)
+    
+    import app as api
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    api.create_app()
+    make_server('127.0.0.1', args.port, api.app, threaded=True).serve_forever()
+
+def measure(args, mode, jpeg):
+    port = free_port()
+    child = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.startup_time', '--serve', mode, '--port', str(port),
+         '--gallery-size', str(args.gallery_size), '--rtt-ms', str(args.rtt_ms)],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        start = float(child.stdout.readline())
+        while True:
+            try:
+                request(port, 'GET', '/api/health')
+                break
+            except OSError:
+                time.sleep(0.005)
+        bound = time.time() - start
+        
+        headers = {'Content-Type': 'image/jpeg'}
+        status, _ = request(port, 'POST', '/api/authenticate', jpeg, headers)
+        first = time.time() - start
+        
+        while True:
+            status, body = request(port, 'GET', '/api/ready')
+            if status == 200:
+                break
+            time.sleep(0.005)
+        ready = time.time() - start
+        
+        next_start = time.perf_counter()
+        request(port, 'POST', '/api/authenticate', jpeg, headers)
+        return {
+            'bound': bound,
+            'first': first,
+            'ready': ready,
+            'next': time.perf_counter() - next_start,
+            'phases': json.loads(body)['seconds']
+        }
+    finally:
+        child.terminate()
+        child.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['eager', 'background', 'lazy'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--gallery-size', type=int, default=2000)
+    parser.add_argument('--rtt-ms', type=float, default=1.0)
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args)
+        return
+    
+    from benchmarks.synthetic import synthetic_face_image
+    jpeg = cv2.imencode('.jpg', synthetic_face_image(640, 480, seed=1))[1].tobytes()
+    
+    print(f"{'mode':>10} {'bound ms':>9} {'first ms':>9} {'ready ms':>9} {'next ms':>8}  warm-up phases (s)")
+    for mode in args.modes:
+        runs = [measure(args, mode, jpeg) for _ in range(args.repeats)]
+        row = {key: np.median([run[key] for run in runs]) * 1000 for key in ('bound', 'first', 'ready', 'next')}
+        print(
+            f"{mode:>10} {row['bound']:>9.1f} {row['first']:>9.1f} {row['ready']:>9.1f} {row['next']:>8.1f}  "
+            f"{runs[-1]['phases']}"
+        )
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""Per-frame cost of streaming authentication vs. authenticating each frame.
+
+A synthetic camera shows one enrolled face drifting slowly across the
+frame, then cuts to a second enrolled face. Every frame is authenticated
+once with process_image_for_authentication and once through a
+StreamSession, which reuses tracking and confident matches.
+
+Run from the backend directory:
+    
+    python -m benchmarks.stream_session --resolution 1280x720 --frames 120
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from face_engine import FaceEngine
+from gallery_index import GalleryIndex
+from stream_session import StreamSession
+from benchmarks.synthetic import synthetic_face_image, synthetic_gallery
+
+def enrollable_seeds(engine, width, height, count):
+    """Identities whose synthetic faces pass registration"""
+    seeds = []
+    seed = 0
+    while len(seeds) < count:
+        jpeg = cv2.imencode('.jpg', synthetic_face_image(width, height, seed=seed))[1].tobytes()
+        if engine.process_image_for_registration(jpeg)[0]:
+            seeds.append(seed)
+        seed += 1
+    return seeds
+
+def camera(width, height, seeds, frames):
+    """JPEG frames of each identity in turn, drifting a few pixels per frame"""
+    per_identity = frames // len(seeds)
+    for seed in seeds:
+        for i in range(per_identity):
+            center = (width // 2 - 40 + (i * 3) % 80, height // 2 + int(10 * np.sin(i / 6)))
+            image = synthetic_face_image(width, height, seed=seed, center=center)
+            yield seed, cv2.imencode('.jpg', image)[1].tobytes()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolution', default='1280x720')
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--gallery-size', type=int, default=10000)
+    args = parser.parse_args()
+    
+    width, height = (int(v) for v in args.resolution.split('x'))
+    engine = FaceEngine()
+    seeds = enrollable_seeds(engine, width, height, 2)
+    
+    gallery = GalleryIndex()
+    gallery.load({f'synthetic_{i}': row for i, row in enumerate(synthetic_gallery(args.gallery_size))})
+    for seed in seeds:
+        _, _, encoding = engine.process_image_for_registration(
+            cv2.imencode('.jpg', synthetic_face_image(width, height, seed=seed))[1].tobytes()
+        )
+        gallery.add(f'user_{seed}', encoding)
+    
+    frames = list(camera(width, height, seeds, args.frames))
+    session = StreamSession(gallery)
+    session.process(frames[0][1])
+    session = StreamSession(gallery)
+    
+    single, stream = [], []
+    correct = {'single': 0, 'stream': 0}
+    for seed, jpeg in frames:
+        start = time.perf_counter()
+        _, _, _, username = engine.process_image_for_authentication(jpeg, gallery)
+        single.append((time.perf_counter() - start) * 1000)
+        correct['single'] += username == f'user_{seed}'
+        
+        start = time.perf_counter()
+        event = session.process(jpeg)
+        stream.append((time.perf_counter() - start) * 1000)
+        correct['stream'] += event['username'] == f'user_{seed}'
+    
+    print(f"{args.resolution}, {len(frames)} frames, {len(seeds)} identities, gallery {len(gallery)}")
+    print(f"{'path':>8} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'correct':>8}")
+    for name, times in (('single', single), ('stream', stream)):
+        print(f"{name:>8} {np.percentile(times, 50):>8.2f} {np.percentile(times, 95):>8.2f} "
+              f"{np.mean(times):>8.2f} {correct[name]:>5}/{len(frames)}")
+    print(f"stream stages: {session.summary()['stages']}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
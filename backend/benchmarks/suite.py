@@ -0,0 +1,254 @@
+"""Benchmark suite for the face pipeline and the HTTP API.
+
+Times every stage on synthetic data and writes the results as JSON so
+runs can be compared between commits:
+    
+    decode_image           JPEG bytes -> BGR frame
+    detect_faces           Haar face detection (grayscale conversion included)
+    validate_face          eye check inside the face box
+    extract_face_encoding  normalisation + feature extraction
+    compare_faces          one probe against one template
+    gallery_search         one probe against the whole gallery (top-1)
+    authenticate_user      AuthManager end to end (decode ... audit enqueue)
+    http_authenticate      POST /api/authenticate through the Flask test client
+    http_load              concurrent clients against a threaded local server
+
+Each stage reports throughput, p50/p95/p99/mean latency and the peak
+Python-heap allocation of one call (tracemalloc, which sees NumPy
+buffers but not OpenCV's internal ones). MongoDB is the mongomock
+stand-in, optionally with a simulated round-trip time.
+
+Run from the backend directory:
+    
+    python -m benchmarks.suite --gallery-size 10000 --output bench.json
+    python -m benchmarks.suite --baseline bench.json --tolerance 0.10
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import cv2
+import numpy as np
+from config import Config
+from face_engine import FaceEngine, FrameContext
+from benchmarks.stand_in import use_stand_in
+from benchmarks.synthetic import synthetic_face_image, synthetic_gallery
+
+def summarize(latencies, elapsed=None):
+    """Latency percentiles (ms) and throughput for a list of per-call seconds"""
+    latencies = np.asarray(latencies) * 1000
+    elapsed = elapsed if elapsed is not None else latencies.sum() / 1000
+    return {
+        'iterations': int(len(latencies)),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 4),
+        'mean_ms': round(float(latencies.mean()), 4)
+    }
+
+def measure(fn, iterations, setup=None, warmup=3, memory_iterations=5):
+    """Time fn(*setup()) per call; setup runs outside the timed region"""
+    setup = setup or (lambda: ())
+    for _ in range(warmup):
+        fn(*setup())
+    
+    latencies = []
+    for _ in range(iterations):
+        args = setup()
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    result = summarize(latencies)
+    
+    # Separate pass: tracemalloc slows allocation-heavy code down
+    peak = 0
+    for _ in range(memory_iterations):
+        args = setup()
+        tracemalloc.start()
+        fn(*args)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    result['peak_memory_kib'] = round(peak / 1024, 1)
+    return result
+
+def load_test(port, body, clients, duration):
+    """Closed-loop HTTP clients posting raw JPEGs, returns the stage summary"""
+    latencies = [[] for _ in range(clients)]
+    statuses = {}
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    
+    def client(i):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            connection.request('POST', '/api/authenticate', body, {'Content-Type': 'image/jpeg'})
+            response = connection.getresponse()
+            response.read()
+            latencies[i].append(time.perf_counter() - start)
+            with lock:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        connection.close()
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    result = summarize([t for per_client in latencies for t in per_client], time.perf_counter() - start)
+    result['clients'] = clients
+    result['status_codes'] = {str(code): count for code, count in sorted(statuses.items())}
+    return result
+
+def enrollable_frame(engine, width, height):
+    """A synthetic frame that passes registration, so authentication can match it"""
+    for seed in range(1, 200):
+        jpeg = cv2.imencode('.jpg', synthetic_face_image(width, height, seed=seed))[1].tobytes()
+        if engine.process_image_for_registration(jpeg)[0]:
+            return jpeg
+    raise RuntimeError('No enrollable synthetic face found')
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    width, height = (int(v) for v in args.resolution.split('x'))
+    engine = FaceEngine()
+    jpeg = enrollable_frame(engine, width, height)
+    image = engine.decode_image(jpeg)
+    box = engine.detect_faces(image)[0][0]
+    encoding = engine.extract_face_encoding(image, box)
+    gallery = synthetic_gallery(args.gallery_size)
+    
+    def fresh_frame():
+        frame = FrameContext(image)
+        frame.gray
+        return frame, box
+    
+    stages = {}
+    n = args.iterations
+    stages['decode_image'] = measure(engine.decode_image, n, lambda: (jpeg,))
+    stages['detect_faces'] = measure(engine.detect_faces, n, lambda: (FrameContext(image),))
+    stages['validate_face'] = measure(engine.validate_face, n, fresh_frame)
+    stages['extract_face_encoding'] = measure(engine.extract_face_encoding, n, fresh_frame)
+    stages['compare_faces'] = measure(engine.compare_faces, n * 10, lambda: (encoding, gallery[0]))
+    
+    # Everything below goes through AuthManager and the mongomock stand-in
+    # The same frame is sent every time: measure the pipeline, not the probe cache
+    Config.PROBE_CACHE_ENABLED = False
+    Config.GALLERY_SNAPSHOT_DIR = ''
+    Config.STARTUP_WARMUP = 'eager'
+    use_stand_in(args.rtt_ms)
+    import app as api
+    
+    api.create_app()
+    manager = api.startup.get()
+    manager.db.add_users([(f'user{i}', '', '', gallery[i]) for i in range(args.gallery_size)])
+    manager.register_user('probe', '', '', jpeg)
+    manager.gallery_sync.reload()
+    
+    stages['gallery_search'] = measure(manager.gallery.search, n * 10, lambda: (encoding, 1))
+    stages['authenticate_user'] = measure(manager.authenticate_user, n, lambda: (jpeg,))
+    
+    client = api.app.test_client()
+    post = lambda: client.post('/api/authenticate', data=jpeg, content_type='image/jpeg')
+    stages['http_authenticate'] = measure(post, n)
+    
+    if args.load_seconds > 0:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, api.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stages['http_load'] = load_test(server.server_port, jpeg, args.clients, args.load_seconds)
+        server.shutdown()
+    
+    manager.audit.flush()
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'resolution': args.resolution,
+            'gallery_size': args.gallery_size,
+            'rtt_ms': args.rtt_ms,
+            'feature_version': Config.FEATURE_VERSION,
+            'search_mode': Config.GALLERY_SEARCH_MODE,
+            'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        },
+        'stages': stages
+    }
+
+def compare(results, baseline, tolerance):
+    """Print p50 and throughput changes vs. a baseline run, returns the regressed stages"""
+    regressions = []
+    print(f"\nvs. baseline {baseline['meta'].get('commit')} ({baseline['meta']['timestamp']}):")
+    for key in ('resolution', 'gallery_size', 'rtt_ms', 'cpu_count', 'feature_version', 'search_mode'):
+        if results['meta'].get(key) != baseline['meta'].get(key):
+            print(f"  note: {key} differs ({baseline['meta'].get(key)} -> {results['meta'].get(key)})")
+    print(f"{'stage':>22} {'p50 ms':>10} {'base':>10} {'change':>8}")
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            continue
+        change = stage['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:>22} {stage['p50_ms']:>10.4f} {base['p50_ms']:>10.4f} {change:>+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolution', default='640x480')
+    parser.add_argument('--gallery-size', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help='Simulated MongoDB round-trip time')
+    parser.add_argument('--clients', type=int, default=4, help='Concurrent clients for http_load')
+    parser.add_argument('--load-seconds', type=float, default=5.0, help='http_load duration, 0 to skip')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p50 slowdown before flagging')
+    args = parser.parse_args()
+    
+    results = run(args)
+    
+    print(f"{'stage':>22} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KiB':>10}")
+    for name, stage in results['stages'].items():
+        peak = stage.get('peak_memory_kib')
+        print(f"{name:>22} {stage['throughput']:>10.1f} {stage['p50_ms']:>10.4f} {stage['p95_ms']:>10.4f} "
+              f"{stage['p99_ms']:>10.4f} {peak if peak is not None else '-':>10}")
+    print(f"peak RSS {results['meta']['peak_rss_mib']} MiB")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
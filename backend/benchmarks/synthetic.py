@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+# Layout of FaceEngine.extract_face_encoding: 64 histogram bins,
+# 16 grid cells x 16 bins and 32 gradient-magnitude bins
+ENCODING_DIM = 64 + 16 * 16 + 32
+
+def synthetic_gallery(size, dim=ENCODING_DIM, prototypes=64, seed=0):
+    """Generate face-like encodings: non-negative and clustered around shared prototypes"""
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(2.0, 0.05, size=(prototypes, dim)).astype(np.float32)
+    labels = rng.integers(prototypes, size=size)
+    
+    gallery = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 65536):
+        stop = min(start + 65536, size)
+        noise = rng.gamma(2.0, 0.03, size=(stop - start, dim)).astype(np.float32)
+        gallery[start:stop] = centers[labels[start:stop]] + noise
+    
+    return gallery
+
+def synthetic_probes(gallery, count, noise=0.15, seed=1):
+    """Perturb randomly chosen gallery rows to simulate new captures of enrolled users"""
+    rng = np.random.default_rng(seed)
+    truth = rng.integers(len(gallery), size=count)
+    jitter = rng.normal(1.0, noise, size=(count, gallery.shape[1]))
+    probes = np.clip(gallery[truth] * jitter, 0, None)
+    return probes, truth
+
+def synthetic_face_image(width=640, height=480, scale=1.0, seed=0, center=None):
+    """Draw a frontal, face-like BGR frame that the Haar cascades pick up.
+    
+    The seed fixes the identity: skin tone, facial proportions and a skin
+    texture pattern all vary with it.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), rng.integers(150, 200), np.uint8)
+    image = (image + rng.normal(0, 4, image.shape)).clip(0, 255).astype(np.uint8)
+    
+    s = int(min(width, height) * 0.25 * scale)
+    cx, cy = center or (width // 2, height // 2)
+    skin = tuple(int(v) for v in rng.integers(170, 230, 3))
+    shadow = tuple(int(v * 0.8) for v in skin)
+    aspect, eye_gap, eye_size, nose, mouth = rng.uniform(0.9, 1.1, size=5)
+    
+    # Head and hair
+    head = np.zeros((height, width), np.uint8)
+    cv2.ellipse(head, (cx, cy), (int(s * 0.8 * aspect), s), 0, 0, 360, 255, -1)
+    texture = cv2.resize(rng.normal(0, 12, (16, 16)), (width, height), interpolation=cv2.INTER_CUBIC)
+    skin_layer = np.clip(np.array(skin, np.float64) + texture[..., None], 0, 255).astype(np.uint8)
+    image[head > 0] = skin_layer[head > 0]
+    cv2.ellipse(image, (cx, cy - int(s * 0.9)), (int(s * 0.85 * aspect), int(s * 0.4)), 0, 180, 360, (30, 30, 30), -1)
+    
+    # Eyebrows and eyes
+    eye_y, eye_dx = cy - int(s * 0.25), int(s * 0.35 * eye_gap)
+    for side in (-1, 1):
+        eye_x = cx + side * eye_dx
+        cv2.ellipse(image, (eye_x, eye_y - int(s * 0.2)), (int(s * 0.22), int(s * 0.05)), 0, 0, 360, (40, 40, 40), -1)
+        cv2.ellipse(image, (eye_x, eye_y), (int(s * 0.16 * eye_size), int(s * 0.08 * eye_size)), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(image, (eye_x, eye_y), int(s * 0.07 * eye_size), (20, 20, 20), -1)
+    
+    # Nose and mouth
+    cv2.ellipse(image, (cx, cy + int(s * 0.12)), (int(s * 0.08 * nose), int(s * 0.18 * nose)), 0, 0, 360, shadow, -1)
+    cv2.ellipse(image, (cx, cy + int(s * 0.5)), (int(s * 0.3 * mouth), int(s * 0.08)), 0, 0, 360, (60, 40, 120), -1)
+    
+    return cv2.GaussianBlur(image, (0, 0), max(1, s / 60))
\ No newline at end of file
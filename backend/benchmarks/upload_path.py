@@ -0,0 +1,66 @@
+"""Request size and server-side parse + decode time per image upload format.
+
+Feeds identical JPEG frames to app.read_image_request as a base64 data URL
+in JSON (the original format), as multipart/form-data and as a raw
+image/jpeg body, then decodes them with FaceEngine.decode_image.
+
+Run from the backend directory:
+    
+    python -m benchmarks.upload_path --resolutions 640x480 1280x720 1920x1080
+"""
+import argparse
+import base64
+import json
+import time
+import uuid
+import cv2
+import numpy as np
+from benchmarks.synthetic import synthetic_face_image
+
+def request_bodies(jpeg):
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()
+    boundary = uuid.uuid4().hex
+    multipart = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="frame.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + jpeg + f'\r\n--{boundary}--\r\n'.encode()
+    return (
+        ('json+base64', json.dumps({'image': data_url}).encode(), 'application/json'),
+        ('multipart', multipart, f'multipart/form-data; boundary={boundary}'),
+        ('raw jpeg', jpeg, 'image/jpeg'),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolutions', nargs='+', default=['640x480', '1280x720', '1920x1080'])
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+    
+    import app as api
+    from face_engine import FaceEngine
+    
+    engine = FaceEngine()
+    print(f"{'frame':>10} {'format':>12} {'bytes':>9} {'parse ms':>9} {'decode ms':>10} {'total ms':>9}")
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.split('x'))
+        jpeg = cv2.imencode('.jpg', synthetic_face_image(width, height), [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+        
+        for name, body, content_type in request_bodies(jpeg):
+            parse, decode = [], []
+            for _ in range(args.repeats):
+                with api.app.test_request_context('/api/authenticate', method='POST', data=body, content_type=content_type):
+                    start = time.perf_counter()
+                    _, image = api.read_image_request()
+                    parsed = time.perf_counter()
+                    frame = engine.decode_image(image)
+                    decoded = time.perf_counter()
+                    del image
+                assert frame is not None
+                parse.append((parsed - start) * 1000)
+                decode.append((decoded - parsed) * 1000)
+            
+            parse_ms, decode_ms = np.median(parse), np.median(decode)
+            print(f"{resolution:>10} {name:>12} {len(body):>9} {parse_ms:>9.3f} {decode_ms:>10.3f} {parse_ms + decode_ms:>9.3f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Batch enrollment of many users at once.
+
+Used by the /api/register/batch endpoint and as an offline importer:
+    
+    python bulk_enroll.py path/to/images/ --workers 8
+    python bulk_enroll.py manifest.csv --workers 8
+
+A directory is enrolled one user per image, named after the file stem.
+A CSV manifest needs `username` and `image` columns (image paths are
+relative to the CSV) and may add `full_name` and `email`.
+"""
+import argparse
+import csv
+import os
+import time
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from database import Database
+from face_engine import FaceEngine
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Per-process engine, created by the pool initializer
+_engine = None
+
+def _init_worker():
+    global _engine
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    _engine = FaceEngine()
+
+def _process_entry(entry):
+    """Run registration processing for one entry inside a pool worker"""
+    try:
+        image = entry.get('image')
+        if image is None:
+            with open(entry['path'], 'rb') as f:
+                image = f.read()
+        return _engine.process_image_for_registration(image)
+    except Exception as e:
+        return False, f"Failed to process image: {e}", None
+
+def _clean_username(entry):
+    """Stripped username of an entry, or '' when it is missing or not a string"""
+    username = entry.get('username')
+    return username.strip() if isinstance(username, str) else ''
+
+def load_entries(source):
+    """Build enrollment entries from an image directory or a CSV manifest"""
+    if os.path.isdir(source):
+        return [
+            {'username': os.path.splitext(name)[0], 'path': os.path.join(source, name)}
+            for name in sorted(os.listdir(source))
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        return [
+            {
+                'username': row['username'],
+                'full_name': row.get('full_name', ''),
+                'email': row.get('email', ''),
+                'path': os.path.join(base, row['image'])
+            }
+            for row in csv.DictReader(f)
+        ]
+
+class BulkEnroller:
+    """Process registration images across a process pool and insert users in chunks"""
+    
+    def __init__(self, db, workers=None, chunk_size=None):
+        self.db = db
+        self.workers = workers or Config.BULK_WORKERS
+        self.chunk_size = chunk_size or Config.BULK_INSERT_CHUNK_SIZE
+        self._pool = None
+    
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self._pool
+    
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+    
+    def enroll(self, entries, gallery=None):
+        """Enroll entries ({username, image or path, full_name, email}) and report per-entry failures"""
+        start = time.perf_counter()
+        failures = []
+        
+        # Reject malformed entries, empty, repeated and already registered usernames up front
+        pending = []
+        seen = set()
+        existing = self.db.get_existing_usernames(
+            _clean_username(entry) for entry in entries if isinstance(entry, dict)
+        )
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                failures.append({'username': None, 'source': f'users[{i}]', 'message': 'Each user must be an object'})
+                continue
+            username = _clean_username(entry)
+            source = entry.get('path', username or f'users[{i}]')
+            if not username:
+                failures.append({'username': username, 'source': source, 'message': 'Username cannot be empty'})
+            elif username in seen or username in existing:
+                failures.append({'username': username, 'source': source, 'message': 'Username already exists'})
+            elif entry.get('image') is None and entry.get('path') is None:
+                failures.append({'username': username, 'source': source, 'message': 'Image is required'})
+            else:
+                seen.add(username)
+                pending.append(dict(entry, username=username))
+        
+        # Detection, validation and encoding run in the worker processes, one chunk at a time;
+        # each chunk is inserted as soon as it is encoded, so a late failure keeps the earlier ones
+        inserted = {}
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start:start + self.chunk_size]
+            try:
+                results = list(self._get_pool().map(
+                    _process_entry, chunk, chunksize=max(1, len(chunk) // (self.workers * 4))
+                ))
+            except Exception as e:
+                # A crashed worker breaks the whole pool: fail this chunk and start a new pool for the next
+                self.close()
+                failures.extend(
+                    {'username': entry['username'], 'source': entry.get('path', entry['username']),
+                     'message': f'Failed to process image: {e}'}
+                    for entry in chunk
+                )
+                continue
+            
+            users = []
+            encodings = {}
+            for entry, (success, message, encoding) in zip(chunk, results):
+                if success:
+                    users.append((entry['username'], entry.get('full_name', ''), entry.get('email', ''), encoding))
+                    encodings[entry['username']] = encoding
+                else:
+                    failures.append({'username': entry['username'], 'source': entry.get('path', entry['username']), 'message': message})
+            
+            chunk_inserted, errors = self.db.add_users(users, self.chunk_size)
+            for username, error in errors.items():
+                failures.append({'username': username, 'source': username, 'message': f'Failed to register user: {error}'})
+            
+            if gallery is not None:
+                for username in chunk_inserted:
+                    gallery.add(username, encodings[username])
+            inserted.update(chunk_inserted)
+        
+        elapsed = time.perf_counter() - start
+        return {
+            'total': len(entries),
+            'registered': len(inserted),
+            'failed': len(failures),
+            'failures': failures,
+            'workers': self.workers,
+            'elapsed_seconds': round(elapsed, 3),
+            'images_per_second': round(len(pending) / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-enroll users from an image directory or CSV manifest')
+    parser.add_argument('source', help='Directory of images or CSV manifest')
+    parser.add_argument('--workers', type=int, default=Config.BULK_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=Config.BULK_INSERT_CHUNK_SIZE)
+    args = parser.parse_args()
+    
+    entries = load_entries(args.source)
+    print(f"📥 Enrolling {len(entries)} users with {args.workers} workers...")
+    
+    enroller = BulkEnroller(Database(), args.workers, args.chunk_size)
+    try:
+        report = enroller.enroll(entries)
+    finally:
+        enroller.close()
+    
+    for failure in report['failures']:
+        print(f"❌ {failure['source']}: {failure['message']}")
+    print(f"✅ Registered {report['registered']}/{report['total']} users, {report['failed']} failed")
+    print(f"⏱️  {report['elapsed_seconds']}s, {report['images_per_second']} images/s with {report['workers']} workers")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -14,9 +14,108 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
     # Face Recognition Configuration
-    FACE_DETECTION_CONFIDENCE = 0.6
-    FACE_MATCH_THRESHOLD = 0.6
+    FACE_DETECTION_MODE = os.getenv('FACE_DETECTION_MODE', 'full')  # 'full', or 'downscaled' (faster on wide frames; may detect differently)
+    FACE_DETECTION_MAX_WIDTH = int(os.getenv('FACE_DETECTION_MAX_WIDTH', 640))  # With 'downscaled', wider frames are downscaled first...
+    FACE_DETECTION_DOWNSCALE_WIDTH = int(os.getenv('FACE_DETECTION_DOWNSCALE_WIDTH', 320))  # ...to this width
+    FACE_DETECTION_MIN_SIZE = (100, 100)  # Smallest face, in full-resolution pixels
+    FACE_DETECTION_SCALE_FACTOR = 1.1
+    FACE_DETECTION_MIN_NEIGHBORS = 5
+    FACE_DETECTION_REFINE_MARGIN = 0.2  # ROI padding around a coarse box, as a fraction of its size
+    FACE_DETECTION_CONFIDENCE = 0.6  # Min IoU between coarse and refined boxes to accept the refinement
+    FACE_MATCH_THRESHOLD = float(os.getenv('FACE_MATCH_THRESHOLD', 0.6))  # Tuned for v1 features; retune for v2
     IMAGE_SIZE = (100, 100)
+    FEATURE_VERSION = os.getenv('FEATURE_VERSION', 'v1')  # 'v1' legacy, 'v2' uniform LBP
+    ENCODING_DTYPE = os.getenv('ENCODING_DTYPE', 'float32')  # Stored encoding precision: 'float32' or 'float16'
+    
+    # Multi-Template Enrollment Configuration
+    REGISTRATION_MAX_FRAMES = 10  # Frames accepted in one registration burst
+    MAX_TEMPLATES_PER_USER = int(os.getenv('MAX_TEMPLATES_PER_USER', 5))
+    TEMPLATE_CONSISTENCY_THRESHOLD = FACE_MATCH_THRESHOLD  # Frames scoring below this against the burst's medoid are dropped
+    TEMPLATE_DEDUP_SIMILARITY = 0.97  # Frames at least this similar to a kept template are skipped
+    TEMPLATE_SHORTLIST = 10  # Users whose templates are scored after the centroid pass
+    
+    # Gallery Search Configuration
+    GALLERY_SEARCH_MODE = os.getenv('GALLERY_SEARCH_MODE', 'exact')  # 'exact', 'ivf' or 'quantized'
+    IVF_NLIST = int(os.getenv('IVF_NLIST', 0))  # 0 = sqrt(gallery size)
+    IVF_NPROBE = int(os.getenv('IVF_NPROBE', 8))  # Lists scanned per query (recall/latency knob)
+    GALLERY_QUANTIZED_RESCORE = int(os.getenv('GALLERY_QUANTIZED_RESCORE', 32))  # Rows re-scored exactly after the uint8 scan
+    GALLERY_ROWS_DIR = os.getenv('GALLERY_ROWS_DIR', '')  # Where 'quantized' keeps the memory-mapped float rows ('' = temp dir)
+    
+    # Gallery Sync Configuration (multiple workers sharing one database)
+    GALLERY_SYNC_INTERVAL = float(os.getenv('GALLERY_SYNC_INTERVAL', 2.0))  # Seconds between polls
+    GALLERY_USE_CHANGE_STREAM = os.getenv('GALLERY_USE_CHANGE_STREAM', 'true').lower() == 'true'
+    GALLERY_SYNC_GAP_TIMEOUT = 30  # Seconds to wait for a missing change before reloading
+    GALLERY_CHANGE_RETENTION = 7 * 24 * 3600  # Seconds gallery changes are kept
+    
+    # Gallery Snapshot Configuration (memory-mapped cold start, off unless a directory is set)
+    GALLERY_SNAPSHOT_DIR = os.getenv('GALLERY_SNAPSHOT_DIR', '')  # e.g. 'snapshots', on a local disk shared by the host's workers
+    GALLERY_SNAPSHOT_REFRESH = int(os.getenv('GALLERY_SNAPSHOT_REFRESH', 10000))  # Changes before a new snapshot is written
+    GALLERY_SNAPSHOT_HEADROOM = 0.25  # Spare rows in the snapshot, as a fraction of its users
+    
+    # Gallery Sharding Configuration (see gallery_shards.py; 0 keeps the gallery in-process)
+    SITE = os.getenv('SITE', '')  # This deployment's site, stored with the users it registers
+    GALLERY_SHARDS = int(os.getenv('GALLERY_SHARDS', 0))  # Local shard worker processes
+    GALLERY_SHARD_ADDRESSES = os.getenv('GALLERY_SHARD_ADDRESSES', '')  # host:port,... of separately started shard workers (overrides GALLERY_SHARDS)
+    GALLERY_SHARD_AUTHKEY = os.getenv('GALLERY_SHARD_AUTHKEY', '')  # Shared secret for GALLERY_SHARD_ADDRESSES
+    GALLERY_SHARD_BY = os.getenv('GALLERY_SHARD_BY', 'hash').lower()  # 'hash' (of the username) or 'site'
+    GALLERY_SHARD_SITES = [site for site in os.getenv('GALLERY_SHARD_SITES', '').split(',') if site]  # Sites pinned to shards 0, 1, ...; others are hashed
+    GALLERY_SHARD_DEADLINE = float(os.getenv('GALLERY_SHARD_DEADLINE', 0.25))  # Seconds a search waits for shards before merging without them
+    GALLERY_SHARD_MAX_IN_FLIGHT = 32  # Unanswered requests before a shard is skipped outright
+    GALLERY_SHARD_LOAD_CHUNK = 5000  # Usernames per database read when a shard loads its partition
+    
+    # Audit Logging Configuration
+    AUDIT_ASYNC = os.getenv('AUDIT_ASYNC', 'true').lower() == 'true'  # Write login attempts off the request path
+    AUDIT_QUEUE_SIZE = 10000  # Pending attempts before callers are slowed down
+    AUDIT_BATCH_SIZE = 500  # Flush when this many attempts are pending...
+    AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))  # ...or after this many seconds
+    AUDIT_ENQUEUE_TIMEOUT = 0.05  # Seconds to wait for queue space before writing synchronously
+    
+    # Login History Configuration
+    LOGIN_ATTEMPT_RETENTION = int(os.getenv('LOGIN_ATTEMPT_RETENTION', 90 * 24 * 3600))  # Seconds attempts are kept (0 keeps them forever)
+    HISTORY_PAGE_SIZE = 50  # Default /api/history page size...
+    HISTORY_MAX_PAGE_SIZE = 500  # ...and the largest allowed; use /api/history/export for more
+    
+    # Statistics Configuration (/api/statistics)
+    STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 5.0))  # Seconds a statistics response is reused
+    STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', 3600))  # Seconds between counter reconciles
+    STATS_RECONCILE_WINDOW = 2 * 24 * 3600  # Seconds of recent attempts recounted by each reconcile
+    STATS_MAX_POINTS = 24 * 31  # Max buckets in one success-rate series
+    
+    # Bulk Enrollment Configuration
+    BULK_WORKERS = int(os.getenv('BULK_WORKERS', os.cpu_count() or 1))  # Offline importer only; /api/register/batch uses ENGINE_WORKERS
+    BULK_INSERT_CHUNK_SIZE = 500  # Documents per insert_many call
+    BULK_MAX_BATCH = 100  # Max users per /api/register/batch request
+    
+    # Engine Pool Configuration (detection and encoding on the request path)
+    ENGINE_POOL_BACKEND = os.getenv('ENGINE_POOL_BACKEND', 'thread')  # 'thread' or 'process'
+    ENGINE_WORKERS = int(os.getenv('ENGINE_WORKERS', os.cpu_count() or 1))
+    ENGINE_QUEUE_SIZE = int(os.getenv('ENGINE_QUEUE_SIZE', 32))  # Requests waiting for a worker before 503
+    ENGINE_CV_THREADS = int(os.getenv('ENGINE_CV_THREADS', 1))  # cv2.setNumThreads for each worker
+    ENGINE_WARMUP_TIMEOUT = float(os.getenv('ENGINE_WARMUP_TIMEOUT', 60.0))  # Seconds warm-up waits for the workers to start
+    
+    # Probe Cache Configuration (repeated /api/authenticate frames)
+    PROBE_CACHE_ENABLED = os.getenv('PROBE_CACHE_ENABLED', 'true').lower() == 'true'
+    PROBE_CACHE_TTL = float(os.getenv('PROBE_CACHE_TTL', 30.0))  # Seconds a probe is remembered
+    PROBE_CACHE_MAX_BYTES = int(os.getenv('PROBE_CACHE_MAX_BYTES', 16 * 1024 * 1024))  # Memory bound, least recently used go first
+    PROBE_CACHE_PERCEPTUAL = os.getenv('PROBE_CACHE_PERCEPTUAL', 'false').lower() == 'true'  # Also reuse near-identical frames...
+    PROBE_CACHE_FRAME_TOLERANCE = 3.0  # ...whose 24x32 thumbnails differ nowhere by more than this many grey levels
+    
+    # Streaming Authentication Configuration (/api/authenticate/stream)
+    STREAM_MAX_SESSIONS = int(os.getenv('STREAM_MAX_SESSIONS', 8))  # Open WebSocket sessions per worker
+    STREAM_TRACK_WIDTH = 320  # Frame width used for template tracking
+    STREAM_TRACK_THRESHOLD = 0.5  # Min template match score to keep tracking instead of re-detecting
+    STREAM_SAME_FACE_THRESHOLD = 0.97  # Min match score against the last encoded face to reuse its result...
+    STREAM_REUSE_CONFIDENCE = 0.75  # ...if that result matched with at least this similarity...
+    STREAM_REVERIFY_INTERVAL = float(os.getenv('STREAM_REVERIFY_INTERVAL', 2.0))  # ...and is younger than this (seconds)
+    
+    # Metrics Configuration (/api/metrics)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'false').lower() == 'true'  # Per-request Server-Timing header
+    
+    # Startup Configuration (see startup.py)
+    STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'background').lower()  # 'background', 'eager' or 'lazy'
+    STARTUP_PRELOAD = os.getenv('STARTUP_PRELOAD', 'false').lower() == 'true'  # Preload in the master, warm up after fork
+    STARTUP_WAIT = float(os.getenv('STARTUP_WAIT', 10.0))  # Seconds a request waits for warm-up before 503
     
     # Server Configuration
     HOST = '0.0.0.0'
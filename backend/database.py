@@ -1,37 +1,174 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from bson.binary import Binary
+from datetime import datetime, timedelta
 import numpy as np
 from config import Config
 
+# Attempt counter buckets and how their start is rendered in ids
+STATS_BUCKET_FORMATS = {'hour': '%Y-%m-%dT%H', 'day': '%Y-%m-%d'}
+
+# Fields returned when listing users
+USER_LIST_PROJECTION = {
+    '_id': 0,
+    'username': 1,
+    'full_name': 1,
+    'email': 1,
+    'created_at': 1,
+    'last_login': 1
+}
+
 class Database:
-    def __init__(self):
-        self.client = MongoClient(Config.MONGO_URI)
+    def __init__(self, create_indexes=True):
+        # Connects on first use, so a Database can be built before a server forks
+        self.client = MongoClient(Config.MONGO_URI, connect=False)
         self.db = self.client[Config.DB_NAME]
         self.users = self.db.users
         self.login_attempts = self.db.login_attempts
-        self._create_indexes()
+        self.gallery_meta = self.db.gallery_meta
+        self.gallery_changes = self.db.gallery_changes
+        self.stats = self.db.stats
+        if create_indexes:
+            self.create_indexes()
     
-    def _create_indexes(self):
+    def create_indexes(self):
         """Create database indexes for better performance"""
         self.users.create_index("username", unique=True)
-        self.login_attempts.create_index([("timestamp", -1)])
+        self._create_attempt_retention_index()
+        # Keyset pagination over all attempts and over one user's attempts
+        self.login_attempts.create_index([("timestamp", -1), ("_id", -1)])
+        self.login_attempts.create_index([("username", 1), ("timestamp", -1), ("_id", -1)])
+        self.gallery_changes.create_index("version", unique=True)
+        self.gallery_changes.create_index(
+            "timestamp", expireAfterSeconds=Config.GALLERY_CHANGE_RETENTION
+        )
+        self.stats.create_index([("bucket", 1), ("start", 1)])
     
-    def add_user(self, username, full_name, email, face_encoding):
-        """Add a new user with face encoding"""
+    def _create_attempt_retention_index(self):
+        """Expire login attempts after LOGIN_ATTEMPT_RETENTION seconds (0 keeps them)"""
+        retention = Config.LOGIN_ATTEMPT_RETENTION
+        options = {'expireAfterSeconds': retention} if retention else {}
         try:
-            user_data = {
-                'username': username,
-                'full_name': full_name,
-                'email': email,
-                'face_encoding': face_encoding.tolist(),  # Convert numpy array to list
-                'created_at': datetime.utcnow(),
-                'last_login': None,
-                'is_active': True
-            }
+            self.login_attempts.create_index([("timestamp", -1)], **options)
+        except OperationFailure as e:
+            if not retention:
+                print(f"Login attempt retention left unchanged: {e}")
+                return
+            # The index exists with another expiry (or none); change it in place
+            try:
+                self.db.command('collMod', 'login_attempts', index={
+                    'keyPattern': {'timestamp': -1},
+                    'expireAfterSeconds': retention
+                })
+            except OperationFailure as e:
+                # MongoDB < 5.1 cannot add an expiry to an index that has none;
+                # drop the { timestamp: -1 } index by hand to enable retention
+                print(f"Login attempt retention not applied: {e}")
+    
+    @staticmethod
+    def _user_document(username, full_name, email, face_encoding, face_templates=None):
+        """Build the stored document for a new user"""
+        document = {
+            'username': username,
+            'full_name': full_name,
+            'email': email,
+            **Database._encode_face_encoding(face_encoding),
+            'created_at': datetime.utcnow(),
+            'last_login': None,
+            'is_active': True
+        }
+        if Config.SITE:
+            document['site'] = Config.SITE
+        if face_templates is not None and len(face_templates) > 1:
+            # face_encoding holds the centroid; the templates refine matches
+            templates = np.ascontiguousarray(face_templates, dtype=document['encoding_dtype'])
+            document['face_templates'] = Binary(templates.tobytes())
+            document['template_count'] = int(templates.shape[0])
+        return document
+    
+    @staticmethod
+    def _encode_face_encoding(face_encoding, dtype=None):
+        """Pack an encoding as a compact binary blob plus its layout fields"""
+        dtype = np.dtype(dtype or Config.ENCODING_DTYPE)
+        if dtype not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported encoding dtype: {dtype}")
+        
+        face_encoding = np.ascontiguousarray(face_encoding, dtype=dtype)
+        return {
+            'face_encoding': Binary(face_encoding.tobytes()),
+            'encoding_dtype': dtype.name,
+            'encoding_dim': int(face_encoding.shape[0]),
+            'feature_version': Config.FEATURE_VERSION
+        }
+    
+    @staticmethod
+    def _decode_face_encoding(user):
+        """Read an encoding back from a user document (binary or legacy list)"""
+        encoding = user['face_encoding']
+        if isinstance(encoding, (bytes, bytearray)):
+            # Zero-copy view over the BSON bytes
+            return np.frombuffer(encoding, dtype=user.get('encoding_dtype', 'float32'))
+        return np.array(encoding)
+    
+    @staticmethod
+    def _decode_face_templates(user):
+        """Read a user's template matrix (template_count x encoding_dim)"""
+        templates = np.frombuffer(user['face_templates'], dtype=user.get('encoding_dtype', 'float32'))
+        return templates.reshape(user['template_count'], -1)
+    
+    def add_user(self, username, full_name, email, face_encoding, face_templates=None):
+        """Add a new user with face encoding (a centroid when templates are given)"""
+        try:
+            user_data = self._user_document(username, full_name, email, face_encoding, face_templates)
             result = self.users.insert_one(user_data)
-            return True, str(result.inserted_id)
         except Exception as e:
             return False, str(e)
+        
+        # The user exists now; a failure below only delays other workers' galleries
+        # (until their next full reload) and the user counter (until the next reconcile)
+        try:
+            self._record_gallery_changes('add', [username])
+            self._count_users(1)
+        except Exception as e:
+            print(f"Error recording registration of {username}: {e}")
+        return True, str(result.inserted_id)
+    
+    def add_users(self, users, chunk_size=None):
+        """Add many users with insert_many, one chunk at a time.
+        
+        `users` is a list of (username, full_name, email, face_encoding)
+        tuples. Chunks are written in order; within a chunk a failed
+        document (e.g. a duplicate username) does not stop the others.
+        Returns ({username: inserted_id}, {username: error message}).
+        """
+        chunk_size = chunk_size or Config.BULK_INSERT_CHUNK_SIZE
+        inserted = {}
+        errors = {}
+        
+        for start in range(0, len(users), chunk_size):
+            chunk = [self._user_document(*user) for user in users[start:start + chunk_size]]
+            try:
+                result = self.users.insert_many(chunk, ordered=False)
+                failed = {}
+            except BulkWriteError as e:
+                failed = {err['index']: err['errmsg'] for err in e.details.get('writeErrors', [])}
+            except Exception as e:
+                failed = {i: str(e) for i in range(len(chunk))}
+            
+            for i, doc in enumerate(chunk):
+                if i in failed:
+                    errors[doc['username']] = failed[i]
+                else:
+                    inserted[doc['username']] = str(doc['_id'])
+        
+        self._record_gallery_changes('add', inserted)
+        self._count_users(len(inserted))
+        return inserted, errors
+    
+    def get_existing_usernames(self, usernames):
+        """Return which of the given usernames are already taken (active or not)"""
+        cursor = self.users.find({'username': {'$in': list(usernames)}}, {'_id': 0, 'username': 1})
+        return {user['username'] for user in cursor}
     
     def get_user_by_username(self, username):
         """Get user by username"""
@@ -39,30 +176,103 @@ class Database:
     
     def get_all_users(self):
         """Get all active users"""
-        users = list(self.users.find({'is_active': True}, {
-            '_id': 0,
-            'username': 1,
-            'full_name': 1,
-            'email': 1,
-            'created_at': 1,
-            'last_login': 1
-        }))
+        users = list(self.users.find({'is_active': True}, USER_LIST_PROJECTION))
         return users
     
+    def _feature_version_filter(self):
+        """Match encodings comparable with Config.FEATURE_VERSION"""
+        if Config.FEATURE_VERSION == 'v1':
+            # Documents written before versioning hold v1 encodings
+            return {'$in': ['v1', None]}
+        return Config.FEATURE_VERSION
+    
     def get_all_face_encodings(self):
-        """Get all face encodings with usernames"""
-        users = self.users.find({'is_active': True}, {
+        """Get all face encodings of the configured feature version with usernames"""
+        return self._find_face_encodings({})
+    
+    def get_face_encodings(self, usernames):
+        """Get the face encodings of specific active users"""
+        return self._find_face_encodings({'username': {'$in': list(usernames)}})
+    
+    def _find_face_encodings(self, query):
+        users = self.users.find(dict({
+            'is_active': True,
+            'feature_version': self._feature_version_filter()
+        }, **query), {
             'username': 1,
-            'face_encoding': 1
+            'face_encoding': 1,
+            'encoding_dtype': 1
         })
         
         encodings = {}
         for user in users:
             if 'face_encoding' in user:
-                encodings[user['username']] = np.array(user['face_encoding'])
+                encodings[user['username']] = self._decode_face_encoding(user)
         
         return encodings
     
+    def get_user_sites(self, usernames=None):
+        """Get the site active users were registered at (all of them, or specific users), '' if none"""
+        query = {'is_active': True}
+        if usernames is not None:
+            query['username'] = {'$in': list(usernames)}
+        
+        users = self.users.find(query, {'username': 1, 'site': 1})
+        return {user['username']: user.get('site', '') for user in users}
+    
+    def get_face_encoding_sites(self):
+        """Get the site ('' if none) of every user get_all_face_encodings returns, without the encodings"""
+        users = self.users.find({
+            'is_active': True,
+            'feature_version': self._feature_version_filter(),
+            'face_encoding': {'$exists': True}
+        }, {'username': 1, 'site': 1})
+        return {user['username']: user.get('site', '') for user in users}
+    
+    def get_face_templates(self, usernames=None):
+        """Get the template sets of multi-template users (all of them, or specific users)"""
+        query = {
+            'is_active': True,
+            'feature_version': self._feature_version_filter(),
+            'face_templates': {'$exists': True}
+        }
+        if usernames is not None:
+            query['username'] = {'$in': list(usernames)}
+        
+        users = self.users.find(query, {
+            'username': 1,
+            'face_templates': 1,
+            'template_count': 1,
+            'encoding_dtype': 1
+        })
+        return {user['username']: self._decode_face_templates(user) for user in users}
+    
+    def migrate_face_encodings(self, dtype=None, batch_size=1000):
+        """Convert legacy list-of-doubles encodings to binary blobs, returns documents migrated"""
+        legacy = self.users.find(
+            {'face_encoding': {'$type': 'array'}},
+            {'face_encoding': 1, 'feature_version': 1}
+        )
+        
+        migrated = 0
+        batch = []
+        for user in legacy:
+            fields = self._encode_face_encoding(np.array(user['face_encoding']), dtype)
+            # Keep the version the encoding was extracted with
+            fields['feature_version'] = user.get('feature_version', 'v1')
+            batch.append(UpdateOne(
+                {'_id': user['_id'], 'face_encoding': {'$type': 'array'}},
+                {'$set': fields}
+            ))
+            if len(batch) == batch_size:
+                migrated += self.users.bulk_write(batch, ordered=False).modified_count
+                batch = []
+        
+        if batch:
+            migrated += self.users.bulk_write(batch, ordered=False).modified_count
+        
+        return migrated
+    
     def update_last_login(self, username):
         """Update user's last login time"""
         self.users.update_one(
@@ -72,12 +282,64 @@ class Database:
     
     def delete_user(self, username):
         """Soft delete a user"""
-        result = self.users.update_one(
-            {'username': username},
-            {'$set': {'is_active': False}}
-        )
+        result = self.users.update_one(*self._deactivation(username))
+        if result.modified_count > 0:
+            self._record_gallery_changes('remove', [username])
+            self._count_users(-1)
         return result.modified_count > 0
     
+    @staticmethod
+    def _deactivation(username):
+        """(filter, update) that soft deletes a user"""
+        return {'username': username}, {'$set': {'is_active': False}}
+    
+    def _record_gallery_changes(self, op, usernames):
+        """Bump the gallery version and log one change per username"""
+        usernames = list(usernames)
+        if not usernames:
+            return None
+        
+        meta = self.gallery_meta.find_one_and_update(**self._gallery_version_bump(len(usernames)))
+        self.gallery_changes.insert_many(self._gallery_change_documents(op, usernames, meta['version']))
+        return meta['version']
+    
+    @staticmethod
+    def _gallery_version_bump(count):
+        """find_one_and_update arguments reserving `count` gallery versions"""
+        return {
+            'filter': {'_id': 'gallery'},
+            'update': {'$inc': {'version': count}},
+            'upsert': True,
+            'return_document': ReturnDocument.AFTER
+        }
+    
+    @staticmethod
+    def _gallery_change_documents(op, usernames, version):
+        """Change log entries for usernames, the last one at `version`"""
+        first = version - len(usernames) + 1
+        now = datetime.utcnow()
+        return [
+            {'version': first + i, 'op': op, 'username': username, 'timestamp': now}
+            for i, username in enumerate(usernames)
+        ]
+    
+    def get_gallery_version(self):
+        """Current gallery version (0 before the first change)"""
+        meta = self.gallery_meta.find_one({'_id': 'gallery'})
+        return meta['version'] if meta else 0
+    
+    def get_gallery_changes(self, since_version, limit=1000):
+        """Gallery changes newer than since_version, oldest first"""
+        return list(self.gallery_changes.find(
+            {'version': {'$gt': since_version}},
+            {'_id': 0, 'version': 1, 'op': 1, 'username': 1}
+        ).sort('version', 1).limit(limit))
+    
+    def get_oldest_gallery_change_version(self):
+        """Oldest change still retained in the change log, or None"""
+        change = self.gallery_changes.find_one({}, {'version': 1}, sort=[('version', 1)])
+        return change['version'] if change else None
+    
     def log_login_attempt(self, username, success, confidence):
         """Log a login attempt"""
         attempt_data = {
@@ -87,23 +349,215 @@ class Database:
             'timestamp': datetime.utcnow()
         }
         self.login_attempts.insert_one(attempt_data)
+        self._count_attempts([attempt_data])
     
-    def get_login_history(self, limit=50):
-        """Get recent login history"""
+    def log_login_attempts(self, attempts):
+        """Log a batch of prepared login attempt documents"""
+        if not attempts:
+            return
+        try:
+            self.login_attempts.insert_many(attempts, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every attempt without a write error was inserted, and is counted now
+            errors = e.details.get('writeErrors', [])
+            failed = {err['index'] for err in errors}
+            self._count_attempts([attempt for i, attempt in enumerate(attempts) if i not in failed])
+            # Retried batches keep their _ids; duplicates were written (and counted) by an earlier try
+            if any(err.get('code') != 11000 for err in errors):
+                raise
+            return
+        self._count_attempts(attempts)
+    
+    def update_last_logins(self, last_logins):
+        """Update many users' last login times ({username: timestamp}) in one round trip"""
+        if last_logins:
+            self.users.bulk_write([
+                # Never move last_login backwards when workers flush out of order
+                UpdateOne(
+                    {'username': username, '$or': [
+                        {'last_login': None},
+                        {'last_login': {'$lt': timestamp}}
+                    ]},
+                    {'$set': {'last_login': timestamp}}
+                )
+                for username, timestamp in last_logins.items()
+            ], ordered=False)
+    
+    @staticmethod
+    def _history_query(username=None, success=None, before=None):
+        """Filter for attempts older than the `before` (timestamp, _id) position"""
+        query = {}
+        if username is not None:
+            query['username'] = username
+        if success is not None:
+            query['success'] = success
+        if before is not None:
+            timestamp, attempt_id = before
+            query['$or'] = [
+                {'timestamp': {'$lt': timestamp}},
+                {'timestamp': timestamp, '_id': {'$lt': attempt_id}}
+            ]
+        return query
+    
+    def get_login_history(self, limit=50, username=None, success=None, before=None):
+        """Get one page of login history, newest first.
+        
+        Attempts include their `_id`; pass the last one's (timestamp, _id)
+        as `before` to get the next page.
+        """
         history = list(self.login_attempts.find(
-            {},
-            {'_id': 0}
-        ).sort('timestamp', -1).limit(limit))
+            self._history_query(username, success, before)
+        ).sort([('timestamp', -1), ('_id', -1)]).limit(limit))
         return history
     
+    def iter_login_history(self, username=None, success=None, before=None, batch_size=1000):
+        """Iterate over all matching login history, newest first, without loading it at once"""
+        return self.login_attempts.find(
+            self._history_query(username, success, before),
+            {'_id': 0}
+        ).sort([('timestamp', -1), ('_id', -1)]).batch_size(batch_size)
+    
+    @staticmethod
+    def bucket_start(bucket, timestamp):
+        """Start of the hour or day bucket holding a timestamp"""
+        if bucket == 'hour':
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    @staticmethod
+    def _bucket_id(bucket, start):
+        return f"{bucket}:{start.strftime(STATS_BUCKET_FORMATS[bucket])}"
+    
+    def _count_users(self, delta):
+        """Adjust the active user counter"""
+        if delta:
+            self.stats.update_one(*self._user_count_update(delta), upsert=True)
+    
+    @staticmethod
+    def _user_count_update(delta):
+        """(filter, update) adjusting the active user counter"""
+        return {'_id': 'users'}, {'$inc': {'active': delta}}
+    
+    def _count_attempts(self, attempts):
+        """Add written attempts to their hourly and daily counters in one round trip"""
+        counts = {}
+        for attempt in attempts:
+            for bucket in STATS_BUCKET_FORMATS:
+                start = self.bucket_start(bucket, attempt['timestamp'])
+                total, successful = counts.get((bucket, start), (0, 0))
+                counts[(bucket, start)] = (total + 1, successful + bool(attempt['success']))
+        
+        if counts:
+            self.stats.bulk_write([
+                UpdateOne(
+                    {'_id': self._bucket_id(bucket, start)},
+                    {
+                        '$inc': {'total': total, 'successful': successful},
+                        '$setOnInsert': {'bucket': bucket, 'start': start}
+                    },
+                    upsert=True
+                )
+                for (bucket, start), (total, successful) in counts.items()
+            ], ordered=False)
+    
+    def get_attempt_series(self, bucket, since):
+        """Hourly or daily attempt counters starting at or after `since`, oldest first"""
+        return list(self.stats.find(
+            {'bucket': bucket, 'start': {'$gte': since}},
+            {'_id': 0, 'start': 1, 'total': 1, 'successful': 1}
+        ).sort('start', 1))
+    
+    def reconcile_stats(self, since=None):
+        """Recompute the counters from the raw collections.
+        
+        Buckets starting on or after the day of `since` are rebuilt from
+        login_attempts (all of them when `since` is None, but never those
+        older than LOGIN_ATTEMPT_RETENTION) and the active user count is
+        recounted. Returns the number of buckets corrected.
+        """
+        if since is not None:
+            since = self.bucket_start('day', since)
+        if Config.LOGIN_ATTEMPT_RETENTION:
+            # Buckets older than the retention window outlive the attempts they counted
+            horizon = self.bucket_start(
+                'day', datetime.utcnow() - timedelta(seconds=Config.LOGIN_ATTEMPT_RETENTION)
+            ) + timedelta(days=1)
+            since = horizon if since is None else max(since, horizon)
+        match = {} if since is None else {'timestamp': {'$gte': since}}
+        
+        corrected = 0
+        for bucket, fmt in STATS_BUCKET_FORMATS.items():
+            counted = {
+                row['_id']: (row['total'], row['successful'])
+                for row in self.login_attempts.aggregate([
+                    {'$match': match},
+                    {'$group': {
+                        '_id': {'$dateToString': {'format': fmt, 'date': '$timestamp'}},
+                        'total': {'$sum': 1},
+                        'successful': {'$sum': {'$cond': ['$success', 1, 0]}}
+                    }}
+                ])
+            }
+            
+            query = {'bucket': bucket}
+            if since is not None:
+                query['start'] = {'$gte': since}
+            stored = {
+                doc['_id']: (doc['total'], doc['successful'])
+                for doc in self.stats.find(query, {'total': 1, 'successful': 1})
+            }
+            
+            ops = []
+            for key, (total, successful) in counted.items():
+                start = datetime.strptime(key, fmt)
+                bucket_id = self._bucket_id(bucket, start)
+                if stored.pop(bucket_id, None) != (total, successful):
+                    ops.append(ReplaceOne(
+                        {'_id': bucket_id},
+                        {'bucket': bucket, 'start': start, 'total': total, 'successful': successful},
+                        upsert=True
+                    ))
+            if ops:
+                self.stats.bulk_write(ops, ordered=False)
+            # Whatever is left has no attempts behind it
+            if stored:
+                self.stats.delete_many({'_id': {'$in': list(stored)}})
+            corrected += len(ops) + len(stored)
+        
+        active = self.users.count_documents({'is_active': True})
+        self.stats.update_one({'_id': 'users'}, {'$set': {'active': active}}, upsert=True)
+        return corrected
+    
+    def has_stats(self):
+        """Whether the counters have been seeded"""
+        return self.stats.find_one({'_id': 'users'}, {'_id': 1}) is not None
+    
+    def acquire_lease(self, name, seconds):
+        """Claim a named lease shared by all workers; True if this caller holds it now"""
+        now = datetime.utcnow()
+        try:
+            self.stats.find_one_and_update(
+                {'_id': f'lease:{name}', '$or': [{'until': {'$lt': now}}, {'until': {'$exists': False}}]},
+                {'$set': {'until': now + timedelta(seconds=seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Someone else holds an unexpired lease
+            return False
+    
     def get_user_stats(self):
-        """Get user statistics"""
-        total_users = self.users.count_documents({'is_active': True})
-        total_attempts = self.login_attempts.count_documents({})
-        successful_attempts = self.login_attempts.count_documents({'success': True})
+        """Get user statistics from the maintained counters"""
+        users = self.stats.find_one({'_id': 'users'}) or {}
+        totals = next(self.stats.aggregate([
+            {'$match': {'bucket': 'day'}},
+            {'$group': {'_id': None, 'total': {'$sum': '$total'}, 'successful': {'$sum': '$successful'}}}
+        ]), {'total': 0, 'successful': 0})
+        total_attempts = totals['total']
+        successful_attempts = totals['successful']
         
         return {
-            'total_users': total_users,
+            'total_users': users.get('active', 0),
             'total_attempts': total_attempts,
             'successful_attempts': successful_attempts,
             'failed_attempts': total_attempts - successful_attempts
@@ -0,0 +1,148 @@
+"""Pool of FaceEngine workers for the request path.
+
+Each worker owns its own FaceEngine, and so its own Haar cascades, which
+are not safe to share between concurrent detectMultiScale calls. With
+the 'thread' backend the workers are threads: OpenCV releases the GIL,
+so detection and feature extraction run in parallel and binary uploads
+are handed over without a copy. The 'process' backend runs the same
+workers in separate processes for deployments where the Python parts
+of the pipeline become the bottleneck.
+
+Requests beyond the busy workers wait in a bounded queue of
+ENGINE_QUEUE_SIZE; past that, submit() raises EngineOverloaded and the
+API answers 503 instead of letting latency grow without bound.
+"""
+import threading
+import time
+import cv2
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import Config
+from face_engine import FaceEngine
+import metrics
+
+ENGINE_POOL_BACKENDS = ('thread', 'process')
+
+# Per-worker engine, created by the pool initializer
+_worker = threading.local()
+
+def _init_worker(cv_threads):
+    # Process-wide for the thread backend, per worker for the process backend
+    cv2.setNumThreads(cv_threads)
+    _worker.engine = FaceEngine()
+
+def _call_engine(method, image, submitted):
+    # Stage timings travel back with the result (they may come from another process)
+    with metrics.collect(deferred=True) as timings:
+        metrics.observe_stage('engine_queue', time.time() - submitted)
+        result = getattr(_worker.engine, method)(image)
+    return result, list(timings or ())
+
+def _warm_worker(barrier):
+    # Hold each worker until all have started, so none picks up a second call
+    if barrier is not None:
+        barrier.wait()
+
+class EngineOverloaded(Exception):
+    """Raised when every worker is busy and the queue is full"""
+
+class EnginePool:
+    """Bounded pool of FaceEngine workers backed by threads or processes"""
+    
+    def __init__(self, workers=None, backend=None, queue_size=None, cv_threads=None):
+        self.workers = workers or Config.ENGINE_WORKERS
+        self.backend = (backend or Config.ENGINE_POOL_BACKEND).lower()
+        self.queue_size = Config.ENGINE_QUEUE_SIZE if queue_size is None else queue_size
+        self.cv_threads = Config.ENGINE_CV_THREADS if cv_threads is None else cv_threads
+        
+        if self.backend not in ENGINE_POOL_BACKENDS:
+            raise ValueError(f"Unknown engine pool backend: {self.backend}")
+        
+        # Created on first use, so a pool built before a server forks is not shared by its workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        
+        # One slot per running or queued request
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._stats_lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'in_flight': 0}
+    
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                executor = ThreadPoolExecutor if self.backend == 'thread' else ProcessPoolExecutor
+                self._executor = executor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.cv_threads,)
+                )
+            return self._executor
+    
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _release(self, future):
+        self._slots.release()
+        self._count('in_flight', -1)
+        self._count('completed')
+    
+    def submit(self, method, image):
+        """Queue a FaceEngine call, returns a future or raises EngineOverloaded"""
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise EngineOverloaded('Face engine is at capacity, please retry shortly')
+        
+        if self.backend == 'process' and isinstance(image, memoryview):
+            # Buffers over request data cannot be pickled
+            image = image.tobytes()
+        
+        self._count('in_flight')
+        try:
+            future = self._get_executor().submit(_call_engine, method, image, time.time())
+        except Exception:
+            self._slots.release()
+            self._count('in_flight', -1)
+            raise
+        self._count('submitted')
+        future.add_done_callback(self._release)
+        return future
+    
+    @staticmethod
+    def wait(future):
+        """Result of a submitted call, recording the worker's stage timings here"""
+        result, timings = future.result()
+        metrics.record(timings)
+        return result
+    
+    def process_image_for_registration(self, image):
+        """Detect, validate and encode a registration image on a worker"""
+        return self.wait(self.submit('process_image_for_registration', image))
+    
+    def encode_probe(self, image):
+        """Detect and encode an authentication image on a worker"""
+        return self.wait(self.submit('encode_probe', image))
+    
+    def warm_up(self, timeout=None):
+        """Start every worker now, loading its engine, instead of on the first requests"""
+        timeout = Config.ENGINE_WARMUP_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        executor = self._get_executor()
+        # Process pools start a worker per call while none is idle (all at once under fork)
+        barrier = threading.Barrier(self.workers, timeout=timeout) if self.backend == 'thread' else None
+        for future in [executor.submit(_warm_worker, barrier) for _ in range(self.workers)]:
+            # Raises TimeoutError, so a stuck warm-up fails instead of hanging
+            future.result(timeout=max(deadline - time.monotonic(), 0))
+    
+    def status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict({
+            'backend': self.backend,
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'cv_threads': self.cv_threads
+        }, **stats)
+    
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
\ No newline at end of file
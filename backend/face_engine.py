@@ -2,6 +2,92 @@ import cv2
 import numpy as np
 from config import Config
 import base64
+import threading
+from metrics import timed_stage
+
+# Feature set versions accepted by extract_face_encoding. Encodings of
+# different versions have different layouts and must not be compared.
+FEATURE_VERSIONS = ('v1', 'v2')
+
+# LBP(8,1) neighbours, clockwise from the top-left pixel
+_LBP_NEIGHBOURS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+def _uniform_lbp_labels():
+    """Map each 8-bit LBP code to one of 58 uniform patterns, or 58 if non-uniform"""
+    labels = np.full(256, 58, dtype=np.uint8)
+    next_label = 0
+    for code in range(256):
+        rotated = ((code >> 1) | ((code & 1) << 7))
+        if bin(code ^ rotated).count('1') <= 2:
+            labels[code] = next_label
+            next_label += 1
+    return labels
+
+_UNIFORM_LBP_LABELS = _uniform_lbp_labels()
+
+def _grid_histograms(labels, bins, grid=4):
+    """L2-normalized histograms of `labels` over a grid x grid layout of cells.
+    
+    All cells are counted with a single np.bincount by offsetting each cell's
+    bin indices, which matches a per-cell cv2.calcHist + cv2.normalize.
+    """
+    h, w = labels.shape
+    cell_h, cell_w = h // grid, w // grid
+    cells = labels[:grid * cell_h, :grid * cell_w].reshape(grid, cell_h, grid, cell_w)
+    cells = cells.transpose(0, 2, 1, 3).reshape(grid * grid, cell_h * cell_w)
+    
+    offsets = (np.arange(grid * grid) * bins)[:, None]
+    counts = np.bincount((cells + offsets).ravel(), minlength=grid * grid * bins)
+    counts = counts.reshape(grid * grid, bins).astype(np.float64)
+    
+    norms = np.linalg.norm(counts, axis=1, keepdims=True)
+    np.divide(counts, norms, out=counts, where=norms > 0)
+    return counts.astype(np.float32).ravel()
+
+def _box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+class FrameContext:
+    """Per-frame buffers shared by detection, validation and encoding.
+    
+    The BGR frame is converted to grayscale once, on first use, and face
+    ROIs are views into that buffer; the resized and equalized face used
+    for encoding is cached per face box.
+    """
+    
+    def __init__(self, image):
+        self.image = image
+        self._gray = None
+        self._normalized = {}
+    
+    @property
+    def gray(self):
+        if self._gray is None:
+            if self.image.ndim == 2:
+                self._gray = self.image
+            else:
+                self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+    
+    def face_roi(self, face_coords):
+        """Grayscale view of a face box (no copy)"""
+        x, y, w, h = face_coords
+        return self.gray[y:y+h, x:x+w]
+    
+    def normalized_face(self, face_coords):
+        """Face ROI resized to Config.IMAGE_SIZE and histogram-equalized"""
+        key = tuple(int(v) for v in face_coords)
+        face = self._normalized.get(key)
+        if face is None:
+            face = cv2.resize(self.face_roi(face_coords), Config.IMAGE_SIZE)
+            face = cv2.equalizeHist(face, dst=face)
+            self._normalized[key] = face
+        return face
 
 class FaceEngine:
     def __init__(self):
@@ -12,26 +98,87 @@ class FaceEngine:
         self.eye_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_eye.xml'
         )
+        
+        # Per-thread float32 scratch buffers for gradient features
+        self._scratch = threading.local()
     
+    @staticmethod
+    def _context(image):
+        """Wrap a raw frame in a FrameContext (pass contexts through)"""
+        if isinstance(image, FrameContext):
+            return image
+        return FrameContext(image)
+    
+    @timed_stage('detect')
     def detect_faces(self, image):
-        """Detect faces in an image"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        """Detect faces in an image (ndarray or FrameContext)"""
+        gray = self._context(image).gray
         
+        if Config.FACE_DETECTION_MODE == 'downscaled' and gray.shape[1] > Config.FACE_DETECTION_MAX_WIDTH:
+            faces = self._detect_downscaled(gray)
+        else:
+            faces = self._run_face_cascade(gray, Config.FACE_DETECTION_MIN_SIZE)
+        
+        return faces, gray
+    
+    def _run_face_cascade(self, gray, min_size, max_size=None):
         faces = self.face_cascade.detectMultiScale(
             gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(100, 100),
+            scaleFactor=Config.FACE_DETECTION_SCALE_FACTOR,
+            minNeighbors=Config.FACE_DETECTION_MIN_NEIGHBORS,
+            minSize=tuple(min_size),
+            maxSize=tuple(max_size or (0, 0)),
             flags=cv2.CASCADE_SCALE_IMAGE
         )
+        return np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+    
+    def _detect_downscaled(self, gray):
+        """Find faces on a downscaled frame, then refine each box at full resolution"""
+        height, width = gray.shape
+        scale = Config.FACE_DETECTION_DOWNSCALE_WIDTH / width
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+        # The cascade window is 24x24, so tiny minimum sizes cannot be honoured
+        min_size = [max(24, int(v * scale)) for v in Config.FACE_DETECTION_MIN_SIZE]
+        coarse = self._run_face_cascade(small, min_size)
+        
+        faces = []
+        for box in coarse:
+            x, y, w, h = (box / scale).astype(np.int32)
+            faces.append(self._refine_face(gray, (x, y, w, h)))
+        return np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+    
+    def _refine_face(self, gray, box):
+        """Re-detect a mapped-back box inside a small full-resolution ROI.
+        
+        The refined box is used when it overlaps the coarse one by at least
+        Config.FACE_DETECTION_CONFIDENCE (IoU); otherwise the coarse box,
+        mapped to full resolution, is kept.
+        """
+        x, y, w, h = box
+        margin = int(max(w, h) * Config.FACE_DETECTION_REFINE_MARGIN)
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        x1, y1 = min(x + w + margin, gray.shape[1]), min(y + h + margin, gray.shape[0])
+        
+        candidates = self._run_face_cascade(
+            gray[y0:y1, x0:x1],
+            (int(w * 0.7), int(h * 0.7)),
+            (x1 - x0, y1 - y0)
+        )
         
-        return faces, gray
+        best, best_iou = None, Config.FACE_DETECTION_CONFIDENCE
+        for cx, cy, cw, ch in candidates:
+            refined = (cx + x0, cy + y0, cw, ch)
+            iou = _box_iou(refined, box)
+            if iou >= best_iou:
+                best, best_iou = refined, iou
+        
+        return best if best is not None else box
     
+    @timed_stage('validate')
     def validate_face(self, image, face_coords):
         """Validate that the detected face has eyes (liveness check)"""
-        x, y, w, h = face_coords
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        face_roi = gray[y:y+h, x:x+w]
+        face_roi = self._context(image).face_roi(face_coords)
         
         eyes = self.eye_cascade.detectMultiScale(
             face_roi,
@@ -43,68 +190,76 @@ class FaceEngine:
         # Check if at least 2 eyes are detected
         return len(eyes) >= 2
     
-    def extract_face_encoding(self, image, face_coords):
+    @timed_stage('encode')
+    def extract_face_encoding(self, image, face_coords, feature_version=None):
         """Extract face encoding from detected face"""
-        x, y, w, h = face_coords
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Extract face ROI
-        face_roi = gray[y:y+h, x:x+w]
-        
-        # Resize to standard size
-        face_roi = cv2.resize(face_roi, Config.IMAGE_SIZE)
-        
-        # Apply histogram equalization for better features
-        face_roi = cv2.equalizeHist(face_roi)
+        # Resized, equalized face ROI shared through the frame context
+        face_roi = self._context(image).normalized_face(face_coords)
         
-        # Extract multiple features
-        features = []
+        return self.encode_normalized_face(face_roi, feature_version)
+    
+    def encode_normalized_face(self, face_roi, feature_version=None):
+        """Build the feature vector for an already resized and equalized face ROI"""
+        version = feature_version or Config.FEATURE_VERSION
+        if version not in FEATURE_VERSIONS:
+            raise ValueError(f"Unknown feature version: {version}")
         
         # 1. Histogram features
-        hist = cv2.calcHist([face_roi], [0], None, [64], [0, 256])
-        hist = cv2.normalize(hist, hist).flatten()
-        features.extend(hist)
+        hist = _grid_histograms(face_roi >> 2, 64, grid=1)
         
-        # 2. LBP-like features (simplified)
-        lbp_features = self._extract_lbp_features(face_roi)
-        features.extend(lbp_features)
+        # 2. Texture features: grid intensity histograms (v1) or uniform LBP (v2)
+        if version == 'v1':
+            texture_features = self._extract_lbp_features(face_roi)
+        else:
+            texture_features = self._extract_uniform_lbp_features(face_roi)
         
         # 3. HOG-like features (simplified)
         hog_features = self._extract_gradient_features(face_roi)
-        features.extend(hog_features)
         
-        return np.array(features)
+        return np.concatenate([hist, texture_features, hog_features])
     
     def _extract_lbp_features(self, image):
-        """Extract Local Binary Pattern-like features"""
-        # Divide image into grid
-        h, w = image.shape
-        cell_h, cell_w = h // 4, w // 4
-        features = []
-        
-        for i in range(4):
-            for j in range(4):
-                cell = image[i*cell_h:(i+1)*cell_h, j*cell_w:(j+1)*cell_w]
-                hist = cv2.calcHist([cell], [0], None, [16], [0, 256])
-                hist = cv2.normalize(hist, hist).flatten()
-                features.extend(hist)
-        
-        return features
+        """Extract Local Binary Pattern-like features (v1: 4x4 grid of 16-bin intensity histograms)"""
+        return _grid_histograms(image >> 4, 16)
+    
+    def _extract_uniform_lbp_features(self, image):
+        """Extract uniform LBP features (v2: 4x4 grid of 59-bin LBP(8,1) histograms)"""
+        center = image[1:-1, 1:-1]
+        h, w = center.shape
+        codes = np.zeros((h, w), dtype=np.uint8)
+        for bit, (dy, dx) in enumerate(_LBP_NEIGHBOURS):
+            neighbour = image[1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+            codes |= cv2.compare(neighbour, center, cv2.CMP_GE) & (1 << bit)
+        
+        return _grid_histograms(cv2.LUT(codes, _UNIFORM_LBP_LABELS), 59)
+    
+    def _gradient_buffers(self, shape):
+        """Reusable float32 Sobel/magnitude buffers for this thread"""
+        buffers = getattr(self._scratch, 'gradient', None)
+        if buffers is None or buffers[0].shape != shape:
+            buffers = tuple(np.empty(shape, dtype=np.float32) for _ in range(3))
+            self._scratch.gradient = buffers
+        return buffers
     
     def _extract_gradient_features(self, image):
         """Extract gradient-based features"""
-        # Calculate gradients
-        sobelx = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
-        sobely = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
+        sobelx, sobely, magnitude = self._gradient_buffers(image.shape)
+        
+        # Calculate gradients in float32 into the scratch buffers
+        cv2.Sobel(image, cv2.CV_32F, 1, 0, dst=sobelx, ksize=3)
+        cv2.Sobel(image, cv2.CV_32F, 0, 1, dst=sobely, ksize=3)
         
-        # Calculate magnitude and angle
-        magnitude = np.sqrt(sobelx**2 + sobely**2)
+        # Calculate magnitude without squared temporaries
+        cv2.magnitude(sobelx, sobely, magnitude=magnitude)
         
-        # Create histogram of magnitudes
-        hist, _ = np.histogram(magnitude, bins=32, range=(0, 255))
+        # Create histogram of magnitudes: 32 equal bins over [0, 255], as
+        # np.histogram would build them, but counted with one bincount
+        in_range = magnitude[magnitude <= 255]
+        bins = np.minimum((in_range * (32 / 255)).astype(np.intp), 31)
+        hist = np.bincount(bins, minlength=32)
         hist = hist / (hist.sum() + 1e-6)
         
-        return hist.tolist()
+        return hist
     
     def compare_faces(self, encoding1, encoding2):
         """Compare two face encodings and return similarity score"""
@@ -133,12 +288,111 @@ class FaceEngine:
         
         return similarity
     
+    @staticmethod
+    def template_stats(templates):
+        """Precompute the per-template norms, means and standard deviations"""
+        templates = np.atleast_2d(np.asarray(templates, dtype=np.float64))
+        norms = np.linalg.norm(templates, axis=1)
+        means = templates.mean(axis=1)
+        stds = templates.std(axis=1)
+        return norms, means, stds
+    
+    @staticmethod
+    def compare_faces_batch(probe, gallery_matrix, norms=None, means=None, stds=None):
+        """Score one encoding against every row of gallery_matrix at once.
+        
+        Computes the same 0.4 cosine + 0.3 correlation + 0.3 Euclidean fused
+        score as compare_faces, but derives all three terms from a single
+        matrix-vector product and the templates' precomputed statistics
+        (see template_stats). With float32 templates the scores agree with
+        compare_faces to within 1e-4 absolute. A constant template (zero
+        standard deviation) gets a correlation term of 0 instead of NaN.
+        """
+        probe = np.asarray(probe, dtype=np.float64).ravel()
+        if len(gallery_matrix) == 0:
+            return np.zeros(0)
+        
+        if norms is None or means is None or stds is None:
+            norms, means, stds = FaceEngine.template_stats(gallery_matrix)
+        
+        # The only O(N * D) step: raw dot products against all templates
+        dots = gallery_matrix @ probe.astype(gallery_matrix.dtype, copy=False)
+        return FaceEngine.fused_similarity(probe, dots, norms, means, stds)
+    
+    @staticmethod
+    def fused_similarity(probe, dots, norms, means, stds):
+        """Fused scores from a probe's dot products with templates and their statistics"""
+        probe = np.asarray(probe, dtype=np.float64).ravel()
+        dots = np.asarray(dots, dtype=np.float64)
+        n = probe.shape[0]
+        probe_norm = np.linalg.norm(probe)
+        probe_mean = probe.mean()
+        probe_std = probe.std()
+        
+        # 1. Cosine similarity
+        cosine_sim = dots / ((norms + 1e-6) * (probe_norm + 1e-6))
+        
+        # 2. Correlation coefficient
+        denom = n * stds * probe_std
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = np.where(denom > 0, (dots - n * means * probe_mean) / denom, 0.0)
+        
+        # 3. Euclidean distance (inverted and normalized)
+        sq_dist = np.maximum(norms ** 2 + probe_norm ** 2 - 2 * dots, 0.0)
+        euclidean_sim = 1 - np.sqrt(sq_dist) / np.sqrt(n)
+        
+        # Combine metrics (weighted average)
+        similarity = 0.4 * cosine_sim + 0.3 * correlation + 0.3 * euclidean_sim
+        
+        return np.clip(similarity, 0.0, 1.0)
+    
+    @staticmethod
+    def select_templates(encodings, max_templates=None):
+        """Pick a compact, diverse template set from a burst of encodings.
+        
+        The medoid (the encoding most similar to all others) is kept first;
+        encodings scoring below TEMPLATE_CONSISTENCY_THRESHOLD against it are
+        dropped as bad frames. The rest are added farthest-first, skipping
+        near-duplicates, up to max_templates. Returns (templates, centroid,
+        number of frames dropped as inconsistent).
+        """
+        max_templates = max_templates or Config.MAX_TEMPLATES_PER_USER
+        encodings = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        if len(encodings) == 1:
+            return encodings, encodings[0].copy(), 0
+        
+        stats = FaceEngine.template_stats(encodings)
+        similarity = np.stack([FaceEngine.compare_faces_batch(e, encodings, *stats) for e in encodings])
+        medoid = int(np.argmax(similarity.sum(axis=1)))
+        consistent = np.flatnonzero(similarity[medoid] >= Config.TEMPLATE_CONSISTENCY_THRESHOLD)
+        
+        selected = [medoid]
+        while len(selected) < max_templates:
+            remaining = [i for i in consistent if i not in selected]
+            if not remaining:
+                break
+            # Farthest-first: the frame least like anything already kept
+            closest = similarity[np.ix_(remaining, selected)].max(axis=1)
+            best = int(np.argmin(closest))
+            if closest[best] >= Config.TEMPLATE_DEDUP_SIMILARITY:
+                break
+            selected.append(remaining[best])
+        
+        templates = encodings[selected]
+        return templates, templates.mean(axis=0), len(encodings) - len(consistent)
+    
+    @timed_stage('decode')
     def decode_image(self, base64_string):
-        """Decode base64 image string to numpy array"""
+        """Decode a base64 image string (or raw encoded image bytes) to numpy array"""
         try:
-            # Remove header if present
-            if ',' in base64_string:
-                base64_string = base64_string.split(',')[1]
+            # Raw JPEG/PNG bytes, e.g. read from disk by the bulk importer
+            if isinstance(base64_string, (bytes, bytearray, memoryview)):
+                return cv2.imdecode(np.frombuffer(base64_string, np.uint8), cv2.IMREAD_COLOR)
+            
+            # Remove header if present (slice instead of split: no list of copies)
+            comma = base64_string.find(',', 0, 100)
+            if comma != -1:
+                base64_string = base64_string[comma + 1:]
             
             # Decode base64
             img_data = base64.b64decode(base64_string)
@@ -157,8 +411,11 @@ class FaceEngine:
         if image is None:
             return False, "Failed to decode image", None
         
+        # Share grayscale and ROI buffers across the pipeline
+        frame = FrameContext(image)
+        
         # Detect faces
-        faces, gray = self.detect_faces(image)
+        faces, gray = self.detect_faces(frame)
         
         if len(faces) == 0:
             return False, "No face detected. Please ensure your face is visible.", None
@@ -167,43 +424,77 @@ class FaceEngine:
             return False, "Multiple faces detected. Please ensure only one person is in frame.", None
         
         # Validate face (check for eyes)
-        if not self.validate_face(image, faces[0]):
+        if not self.validate_face(frame, faces[0]):
             return False, "Face validation failed. Please face the camera directly.", None
         
         # Extract face encoding
-        encoding = self.extract_face_encoding(image, faces[0])
+        encoding = self.extract_face_encoding(frame, faces[0])
         
         return True, "Face processed successfully", encoding
     
-    def process_image_for_authentication(self, base64_image, stored_encodings):
-        """Process image for authentication"""
+    def process_image_for_authentication(self, base64_image, gallery):
+        """Process image for authentication against a GalleryIndex"""
+        success, message, input_encoding = self.encode_probe(base64_image)
+        if not success:
+            return False, message, 0.0, None
+        
+        return self.match_probe(input_encoding, gallery)
+    
+    def encode_probe(self, base64_image):
+        """Detect and encode the single face in an authentication image"""
         # Decode image
         image = self.decode_image(base64_image)
         if image is None:
-            return False, "Failed to decode image", 0.0, None
+            return False, "Failed to decode image", None
+        
+        # Share grayscale and ROI buffers across the pipeline
+        frame = FrameContext(image)
         
         # Detect faces
-        faces, gray = self.detect_faces(image)
+        faces, gray = self.detect_faces(frame)
         
         if len(faces) == 0:
-            return False, "No face detected", 0.0, None
+            return False, "No face detected", None
         
         if len(faces) > 1:
-            return False, "Multiple faces detected", 0.0, None
+            return False, "Multiple faces detected", None
         
         # Extract face encoding
-        input_encoding = self.extract_face_encoding(image, faces[0])
+        return True, "Face processed successfully", self.extract_face_encoding(frame, faces[0])
+    
+    @staticmethod
+    def frame_signature(base64_image):
+        """Perceptual signature of a whole frame: (64-bit DCT hash, 24x32 thumbnail), or None.
+        
+        Computed from a 1/8-scale grayscale decode, so it costs a fraction
+        of decode_image and needs no detection.
+        """
+        try:
+            if not isinstance(base64_image, (bytes, bytearray, memoryview)):
+                comma = base64_image.find(',', 0, 100)
+                base64_image = base64.b64decode(base64_image[comma + 1:])
+            small = cv2.imdecode(np.frombuffer(base64_image, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        except Exception:
+            return None
+        if small is None:
+            return None
+        
+        thumbnail = cv2.resize(small, (32, 24), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(thumbnail)[:8, :8].ravel()
+        # Compare against the median of the AC terms so overall brightness does not matter
+        return np.packbits(low > np.median(low[1:])).tobytes(), thumbnail
+    
+    @staticmethod
+    def match_probe(input_encoding, gallery):
+        """Match a probe encoding against a GalleryIndex"""
+        # Score the probe against the whole gallery in one batched pass
+        candidates = gallery.search(input_encoding, k=1)
         
-        # Compare with all stored encodings
         best_match = None
         best_similarity = 0.0
         
-        for username, stored_encoding in stored_encodings.items():
-            similarity = self.compare_faces(input_encoding, stored_encoding)
-            
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_match = username
+        if candidates:
+            best_match, best_similarity = candidates[0]
         
         # Check if best match exceeds threshold
         if best_match and best_similarity >= Config.FACE_MATCH_THRESHOLD:
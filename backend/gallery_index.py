@@ -0,0 +1,298 @@
+import tempfile
+import threading
+import numpy as np
+from config import Config
+from face_engine import FaceEngine
+from search_backend import create_search_backend
+
+class GalleryIndex:
+    """Resident in-memory index of enrolled face encodings.
+    
+    Encodings are kept as rows of one contiguous float32 matrix with a
+    parallel array of usernames, and each row's norm, mean and standard
+    deviation are precomputed for FaceEngine.compare_faces_batch. Rows are
+    appended in place and removed by swapping in the last row, so add and
+    remove never rebuild the matrix.
+    
+    Candidate generation is delegated to a search backend (see
+    search_backend.py); whatever it shortlists is ranked with the exact
+    fused similarity. A backend that keeps its own compact copy of the
+    rows (the 'quantized' one) only needs them read for that ranking, so
+    the float rows are then kept in a memory-mapped temporary file in
+    GALLERY_ROWS_DIR that the OS pages in on demand.
+    
+    Users enrolled from several frames are indexed by their centroid and
+    also keep their template set (with precomputed statistics) on the
+    side. A search scores centroids first, then re-scores the best
+    TEMPLATE_SHORTLIST users by their best-matching template.
+    
+    `generation` is bumped by every change, so callers can tell whether
+    a match decision they kept is still current.
+    """
+    
+    def __init__(self, dim=None, initial_capacity=1024, backend=None):
+        self._lock = threading.RLock()
+        self._backend = backend or create_search_backend()
+        self._dim = dim
+        self._capacity = initial_capacity
+        self._size = 0
+        self._matrix = None
+        self._norms = None
+        self._means = None
+        self._stds = None
+        self._usernames = []
+        self._rows = {}
+        self._templates = {}
+        self.generation = 0
+    
+    def __len__(self):
+        return self._size
+    
+    def __contains__(self, username):
+        return username in self._rows
+    
+    @property
+    def usernames(self):
+        return list(self._usernames)
+    
+    def _new_matrix(self, capacity, dim):
+        if self._backend.resident_rows:
+            return np.zeros((capacity, dim), dtype=np.float32)
+        with tempfile.TemporaryFile(dir=Config.GALLERY_ROWS_DIR or None) as f:
+            # The mapping keeps the (already unlinked) file open
+            return np.memmap(f, dtype=np.float32, mode='w+', shape=(capacity, dim))
+    
+    def _allocate(self, dim, capacity):
+        """Allocate (or grow) the backing storage"""
+        matrix = self._new_matrix(capacity, dim)
+        stats = np.zeros((3, capacity), dtype=np.float64)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            stats[0, :self._size] = self._norms[:self._size]
+            stats[1, :self._size] = self._means[:self._size]
+            stats[2, :self._size] = self._stds[:self._size]
+        self._dim = dim
+        self._capacity = capacity
+        self._matrix = matrix
+        self._norms, self._means, self._stds = stats
+    
+    def load(self, encodings, templates=None):
+        """Replace the index contents with {username: encoding} (and {username: templates})"""
+        with self._lock:
+            self._matrix = None
+            self._norms = None
+            self._means = None
+            self._stds = None
+            self._size = 0
+            self._usernames = []
+            self._rows = {}
+            self._templates = {}
+            self.generation += 1
+            
+            if not encodings:
+                return
+            
+            dim = len(next(iter(encodings.values())))
+            self._allocate(dim, max(self._capacity, len(encodings)))
+            for row, (username, encoding) in enumerate(encodings.items()):
+                encoding = np.asarray(encoding).ravel()
+                if encoding.shape[0] != dim:
+                    raise ValueError(
+                        f"Encoding for {username} has dimension {encoding.shape[0]}, expected {dim}"
+                    )
+                self._matrix[row] = encoding
+                self._usernames.append(username)
+                self._rows[username] = row
+            self._size = len(self._usernames)
+            
+            # Row statistics in blocks rather than one call per row
+            for start in range(0, self._size, 65536):
+                end = min(start + 65536, self._size)
+                self._norms[start:end], self._means[start:end], self._stds[start:end] = (
+                    FaceEngine.template_stats(self._matrix[start:end])
+                )
+            
+            for username, user_templates in (templates or {}).items():
+                if username in self._rows:
+                    self._write_templates(username, user_templates)
+            self._backend.rebuild(self._matrix[:self._size])
+    
+    def load_arrays(self, usernames, matrix, stats, templates=None):
+        """Adopt prebuilt storage as the index (e.g. a memory-mapped snapshot).
+        
+        `matrix` holds one row per username followed by spare rows, and
+        `stats` the matching (3, capacity) norms, means and standard
+        deviations. The arrays are used in place, not copied, and must be
+        writable (a copy-on-write memmap is fine).
+        """
+        with self._lock:
+            self._dim = matrix.shape[1]
+            self._capacity = len(matrix)
+            self._size = len(usernames)
+            self._matrix = matrix
+            self._norms, self._means, self._stds = stats
+            self._usernames = list(usernames)
+            self._rows = {username: row for row, username in enumerate(self._usernames)}
+            self._templates = {}
+            self.generation += 1
+            for username, user_templates in (templates or {}).items():
+                if username in self._rows:
+                    self._write_templates(username, user_templates)
+            self._backend.rebuild(self._matrix[:self._size])
+    
+    def export(self):
+        """Copy of the index: (usernames, float32 rows, norms/means/stds as 3 x size, templates)"""
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return [], None, None, {}
+            matrix = np.array(self._matrix[:size], dtype=np.float32)
+            stats = np.stack([self._norms[:size], self._means[:size], self._stds[:size]])
+            templates = {username: t[0] for username, t in self._templates.items()}
+            return list(self._usernames), matrix, stats, templates
+    
+    def _write_templates(self, username, templates):
+        if templates is None or len(templates) < 2:
+            self._templates.pop(username, None)
+            return
+        templates = np.array(templates, dtype=np.float32, ndmin=2)
+        self._templates[username] = (templates,) + FaceEngine.template_stats(templates)
+    
+    def _write_row(self, username, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32).ravel()
+        if encoding.shape[0] != self._dim:
+            raise ValueError(
+                f"Encoding for {username} has dimension {encoding.shape[0]}, expected {self._dim}"
+            )
+        
+        row = self._rows.get(username)
+        is_new = row is None
+        if is_new:
+            if self._size == self._capacity:
+                self._allocate(self._dim, self._capacity * 2)
+            row = self._size
+            self._size += 1
+            self._usernames.append(username)
+            self._rows[username] = row
+        
+        self._matrix[row] = encoding
+        norms, means, stds = FaceEngine.template_stats(self._matrix[row])
+        self._norms[row] = norms[0]
+        self._means[row] = means[0]
+        self._stds[row] = stds[0]
+        return row, is_new
+    
+    def add(self, username, encoding, templates=None):
+        """Insert or replace a single user's encoding (centroid) and templates"""
+        with self._lock:
+            if self._matrix is None:
+                self._allocate(len(encoding), self._capacity)
+            row, is_new = self._write_row(username, encoding)
+            self._write_templates(username, templates)
+            self.generation += 1
+            
+            if self._backend.needs_rebuild(self._size):
+                self._backend.rebuild(self._matrix[:self._size])
+            else:
+                if not is_new:
+                    self._backend.remove(row)
+                self._backend.add(row, self._matrix[row])
+    
+    def remove(self, username):
+        """Remove a user's encoding, returns False if it was not indexed"""
+        with self._lock:
+            row = self._rows.pop(username, None)
+            if row is None:
+                return False
+            self._templates.pop(username, None)
+            self.generation += 1
+            
+            self._backend.remove(row)
+            last = self._size - 1
+            if row != last:
+                # Move the last row into the hole to keep storage contiguous
+                moved = self._usernames[last]
+                self._matrix[row] = self._matrix[last]
+                self._norms[row] = self._norms[last]
+                self._means[row] = self._means[last]
+                self._stds[row] = self._stds[last]
+                self._usernames[row] = moved
+                self._rows[moved] = row
+                self._backend.move(last, row)
+            
+            self._usernames.pop()
+            self._size = last
+            return True
+    
+    def get_encoding(self, username):
+        """Get the stored encoding for a user"""
+        with self._lock:
+            row = self._rows.get(username)
+            if row is None:
+                return None
+            return self._matrix[row].copy()
+    
+    def get_templates(self, username):
+        """Get a user's template set (None for single-template users)"""
+        with self._lock:
+            templates = self._templates.get(username)
+            return None if templates is None else templates[0].copy()
+    
+    def search(self, encoding, k=5):
+        """Return the top-k (username, similarity) matches for a probe"""
+        with self._lock:
+            if not self._templates:
+                return self._search_centroids(encoding, k)
+            
+            # Refine the best centroid matches against their template sets
+            matches = self._search_centroids(encoding, max(k, Config.TEMPLATE_SHORTLIST))
+            shortlisted = [self._templates[username] for username, _ in matches if username in self._templates]
+            if not shortlisted:
+                return matches[:k]
+            
+            # Score every shortlisted template in one batched pass
+            scores = FaceEngine.compare_faces_batch(
+                encoding,
+                *(np.concatenate(parts) for parts in zip(*shortlisted))
+            )
+            offsets = np.cumsum([0] + [len(templates[0]) for templates in shortlisted[:-1]])
+            best = iter(np.maximum.reduceat(scores, offsets).tolist())
+            
+            refined = [
+                (username, max(similarity, next(best)) if username in self._templates else similarity)
+                for username, similarity in matches
+            ]
+            refined.sort(key=lambda match: match[1], reverse=True)
+            return refined[:k]
+    
+    def _search_centroids(self, encoding, k):
+        with self._lock:
+            if self._size == 0:
+                return []
+            
+            rows = self._backend.candidates(encoding)
+            if rows is None:
+                rows = slice(0, self._size)
+            elif len(rows) == 0:
+                return []
+            
+            # Exact fused similarity over the shortlist (or the whole gallery)
+            scores = FaceEngine.compare_faces_batch(
+                encoding,
+                self._matrix[rows],
+                self._norms[rows],
+                self._means[rows],
+                self._stds[rows]
+            )
+            if isinstance(rows, slice):
+                rows = np.arange(self._size)
+            
+            n = len(scores)
+            k = min(k, n)
+            if k < n:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(n)
+            top = top[np.argsort(scores[top])[::-1]]
+            
+            return [(self._usernames[rows[i]], float(scores[i])) for i in top]
\ No newline at end of file
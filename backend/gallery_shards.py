@@ -0,0 +1,522 @@
+"""Identity gallery partitioned across shard worker processes.
+
+With GALLERY_SHARDS > 0 the gallery is split into that many shards,
+each a GalleryIndex in its own process, so no single process holds or
+scans every encoding. ShardedGallery takes the place of the local
+GalleryIndex (same load/add/remove/search interface), so the gallery
+sync, registration and FaceEngine.match_probe work unchanged.
+
+Users are assigned to a shard by a hash of their username or, with
+GALLERY_SHARD_BY=site, by the site they were registered at (see
+Config.SITE), which keeps each site's users together. Sites listed in
+GALLERY_SHARD_SITES are pinned to shards 0, 1, ... in order; other
+sites, and users without one, are hashed.
+
+A search sends the probe to every non-empty shard. Each returns its own
+top-k by fused similarity (template refinement included) and the
+coordinator merges them; FACE_MATCH_THRESHOLD is applied to the merged
+best match as before. Shards that have not answered within
+GALLERY_SHARD_DEADLINE are left out of that search, which can then
+miss the true best match (a false reject, never a false accept); a
+shard with GALLERY_SHARD_MAX_IN_FLIGHT unanswered requests is skipped
+without waiting. Both are counted in face_gallery_shard_misses_total.
+
+The coordinator starts its shards as local subprocesses. To run them
+elsewhere, start each one separately and list them in
+GALLERY_SHARD_ADDRESSES (with a shared GALLERY_SHARD_AUTHKEY):
+    
+    python gallery_shards.py --listen 0.0.0.0:6100
+
+On a full reload the coordinator reads only usernames and sites and
+tells each shard which users it holds; the shard reads their encodings
+from MongoDB itself (with its own MONGO_URI and DB_NAME, which must name
+the same database), so no process but the shard holds its partition.
+Local shards belong to one coordinator: with several API workers, start
+the shards once and give every worker the same GALLERY_SHARD_ADDRESSES
+instead of one set of shards per worker; a shard skips reloads at a
+version it already has and applies each synced change once (see
+ShardState), so the workers do not undo each other. The gallery snapshot
+(gallery_snapshot.py) is not used when sharding.
+"""
+import argparse
+import heapq
+import itertools
+import os
+import subprocess
+import sys
+import threading
+import zlib
+from concurrent.futures import Future, wait
+from multiprocessing.connection import Client, Listener
+import numpy as np
+from config import Config
+from database import Database
+from gallery_index import GalleryIndex
+import metrics
+
+GALLERY_SHARD_KEYS = ('hash', 'site')
+
+# The shard's own database connection, for 'load_from_database'
+_db = None
+_db_lock = threading.Lock()
+
+def _database():
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = Database(create_indexes=False)
+        return _db
+
+class ShardError(Exception):
+    """A shard failed a request or is no longer connected"""
+
+class ShardState:
+    """A shard's gallery plus the gallery versions it reflects.
+    
+    Coordinators sharing the shard each send it the same changes; a
+    change carries its gallery version and is applied only if it is newer
+    than the shard's last load and than the last change applied for that
+    user, so each takes effect once and stale ones are ignored. Changes
+    without a version (registrations on a coordinator) always apply. A
+    load from the database at a version the shard already has is skipped;
+    changes arriving during a load are replayed on top of it.
+    """
+    
+    def __init__(self, gallery=None):
+        self.gallery = gallery if gallery is not None else GalleryIndex()
+        self.version = None
+        self._versions = {}
+        self._replay = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+    
+    def load(self, usernames, matrix, templates):
+        with self._load_lock, self._lock:
+            self.gallery.load(dict(zip(usernames, matrix)), templates)
+            self.version = None
+            self._versions = {}
+        return len(self.gallery)
+    
+    def load_from_database(self, usernames, chunk_size, version):
+        with self._load_lock:
+            with self._lock:
+                if version is not None and self.version is not None and self.version >= version:
+                    return len(self.gallery)
+                self._replay = []
+            try:
+                db = _database()
+                encodings, templates = {}, {}
+                for start in range(0, len(usernames), chunk_size):
+                    chunk = usernames[start:start + chunk_size]
+                    encodings.update(db.get_face_encodings(chunk))
+                    templates.update(db.get_face_templates(chunk))
+                with self._lock:
+                    self.gallery.load(encodings, templates)
+                    self.version = version
+                    self._versions = {}
+                    for change in self._replay:
+                        self._apply(*change)
+            finally:
+                with self._lock:
+                    self._replay = None
+        return len(self.gallery)
+    
+    def change(self, op, username, version, *args):
+        """Apply an add or remove unless the shard already has a newer change for the user"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((op, username, version) + args)
+            return self._apply(op, username, version, *args)
+    
+    def _apply(self, op, username, version, *args):
+        if version is not None:
+            if self.version is not None and version <= self.version:
+                return False
+            if version <= self._versions.get(username, 0):
+                return False
+            self._versions[username] = version
+        return getattr(self.gallery, op)(username, *args)
+
+def _handle(state, op, args):
+    """Run one coordinator request against the shard"""
+    if op == 'load':
+        return state.load(*args)
+    if op == 'load_from_database':
+        return state.load_from_database(*args)
+    if op in ('add', 'remove'):
+        return state.change(op, *args)
+    if op in ('search', 'get_encoding', 'get_templates'):
+        return getattr(state.gallery, op)(*args)
+    raise ValueError(f"Unknown shard request: {op}")
+
+def serve(conn, state):
+    """Answer requests from one coordinator connection, in order, until it closes"""
+    while True:
+        try:
+            request_id, op, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (request_id, True, _handle(state, op, args))
+        except Exception as e:
+            reply = (request_id, False, str(e))
+        try:
+            conn.send(reply)
+        except OSError:
+            return
+
+def _log_failure(future):
+    # Updates are not waited for; a failed one leaves the shard behind until the next reload
+    error = future.exception()
+    if error is not None:
+        print(f"Gallery shard update failed: {error}")
+
+class _Shard:
+    """Coordinator end of one shard: requests are pipelined and replies resolve futures"""
+    
+    def __init__(self, index, conn, process=None):
+        self.index = index
+        self.process = process
+        self.size = 0
+        self._conn = conn
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.alive = True
+        self._reader = threading.Thread(target=self._read, name=f'gallery-shard-{index}', daemon=True)
+        self._reader.start()
+    
+    @property
+    def in_flight(self):
+        return len(self._pending)
+    
+    def request(self, op, *args):
+        """Send a request, returns a future for the shard's reply"""
+        future = Future()
+        with self._lock:
+            if not self.alive:
+                future.set_exception(ShardError(f"Gallery shard {self.index} is not connected"))
+                return future
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self._conn.send((request_id, op, args))
+            except (OSError, ValueError) as e:
+                del self._pending[request_id]
+                future.set_exception(ShardError(f"Gallery shard {self.index}: {e}"))
+        return future
+    
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, result = self._conn.recv()
+            except Exception:
+                # Closed by the shard, or by close()
+                break
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(ShardError(f"Gallery shard {self.index}: {result}"))
+        
+        with self._lock:
+            self.alive = False
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ShardError(f"Gallery shard {self.index} disconnected"))
+    
+    def close(self):
+        with self._lock:
+            self.alive = False
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self._reader.join(timeout=5)
+        self._conn.close()
+
+class ShardedGallery:
+    """Coordinator for a gallery split across shard workers.
+    
+    Keeps only which shard holds each user; encodings live in the
+    shards. Updates are sent without waiting for the shard (each shard
+    applies its requests in order, so a later search already sees
+    them); load() and load_from_database() wait until every shard has
+    its partition. Usernames and sites for GALLERY_SHARD_BY=site are read
+    from `db` (Database.get_face_encoding_sites and get_user_sites); a
+    user added without a site was registered here, at Config.SITE.
+    Changes from the gallery sync carry their version (see ShardState),
+    so coordinators can share shards.
+    """
+    
+    def __init__(self, db=None, shards=None, shard_by=None, addresses=None, deadline=None):
+        self.db = db
+        addresses = Config.GALLERY_SHARD_ADDRESSES if addresses is None else addresses
+        self.addresses = [address.strip() for address in addresses.split(',') if address.strip()]
+        self.count = len(self.addresses) or shards or Config.GALLERY_SHARDS
+        self.shard_by = (shard_by or Config.GALLERY_SHARD_BY).lower()
+        self.deadline = Config.GALLERY_SHARD_DEADLINE if deadline is None else deadline
+        if self.shard_by not in GALLERY_SHARD_KEYS:
+            raise ValueError(f"Unknown gallery shard key: {self.shard_by}")
+        if self.count < 1:
+            raise ValueError("A sharded gallery needs at least one shard")
+        
+        self._shards = []
+        self._owners = {}
+        self._sites = {}
+        self._pinned = {site: i % self.count for i, site in enumerate(Config.GALLERY_SHARD_SITES)}
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'searches': 0, 'partial': 0, 'timeouts': 0, 'skipped': 0, 'errors': 0}
+        self.generation = 0
+    
+    def __len__(self):
+        return len(self._owners)
+    
+    def __contains__(self, username):
+        return username in self._owners
+    
+    @property
+    def usernames(self):
+        return list(self._owners)
+    
+    def start(self):
+        """Start the local shard processes, or connect to GALLERY_SHARD_ADDRESSES"""
+        if self._shards:
+            return
+        if self.addresses:
+            if not Config.GALLERY_SHARD_AUTHKEY:
+                raise ValueError("GALLERY_SHARD_ADDRESSES needs GALLERY_SHARD_AUTHKEY")
+            authkey = Config.GALLERY_SHARD_AUTHKEY.encode()
+            try:
+                for i, address in enumerate(self.addresses):
+                    host, port = address.rsplit(':', 1)
+                    self._shards.append(_Shard(i, Client((host, int(port)), authkey=authkey)))
+            except Exception:
+                self.close()
+                raise
+            return
+        
+        # Each local shard listens on a free port and exits when this process disconnects
+        authkey = os.urandom(16).hex()
+        processes = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--listen', '127.0.0.1:0', '--once'],
+                stdout=subprocess.PIPE, text=True,
+                env=dict(os.environ, GALLERY_SHARD_AUTHKEY=authkey)
+            )
+            for _ in range(self.count)
+        ]
+        try:
+            for i, process in enumerate(processes):
+                address = process.stdout.readline().strip()
+                process.stdout.close()
+                if not address:
+                    raise ShardError(f"Gallery shard {i} failed to start")
+                host, port = address.rsplit(':', 1)
+                self._shards.append(_Shard(i, Client((host, int(port)), authkey=authkey.encode()), process))
+        except Exception:
+            # Leave nothing half started, so start() can be retried
+            self.close()
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait()
+            raise
+    
+    def close(self):
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+    
+    def _shard_for(self, username):
+        key = username
+        if self.shard_by == 'site':
+            site = self._sites.get(username, '')
+            if site in self._pinned:
+                return self._pinned[site]
+            key = site or username
+        return zlib.crc32(key.encode('utf-8')) % self.count
+    
+    def _lookup_sites(self, usernames=None):
+        return self.db.get_user_sites(usernames) if self.db is not None else {}
+    
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _partition(self, usernames):
+        """{username: shard} and each shard's usernames"""
+        owners = {username: self._shard_for(username) for username in usernames}
+        parts = [[] for _ in self._shards]
+        for username, shard in owners.items():
+            parts[shard].append(username)
+        return owners, parts
+    
+    def load_from_database(self, version=None):
+        """Replace the gallery with the database's at `version`, each shard reading its own users.
+        
+        Shards already loaded at `version` or later (by another coordinator) keep their gallery.
+        """
+        with self._lock:
+            sites = self.db.get_face_encoding_sites()
+            self._sites = sites if self.shard_by == 'site' else {}
+            owners, parts = self._partition(sites)
+            futures = [
+                shard.request('load_from_database', usernames, Config.GALLERY_SHARD_LOAD_CHUNK, version)
+                for shard, usernames in zip(self._shards, parts)
+            ]
+            self._finish_load(owners, futures)
+    
+    def load(self, encodings, templates=None):
+        """Replace the gallery with {username: encoding} (and {username: templates}), split across the shards"""
+        templates = templates or {}
+        with self._lock:
+            self._sites = self._lookup_sites() if self.shard_by == 'site' else {}
+            owners, parts = self._partition(encodings)
+            futures = [
+                shard.request(
+                    'load',
+                    usernames,
+                    np.array([encodings[username] for username in usernames], dtype=np.float32),
+                    {username: templates[username] for username in usernames if username in templates}
+                )
+                for shard, usernames in zip(self._shards, parts)
+            ]
+            self._finish_load(owners, futures)
+    
+    def _finish_load(self, owners, futures):
+        for future in futures:
+            future.result()
+        # Sizes follow this coordinator's own view, which every change below keeps in step
+        for shard in self._shards:
+            shard.size = 0
+        for shard in owners.values():
+            self._shards[shard].size += 1
+        self._owners = owners
+        self.generation += 1
+    
+    def add(self, username, encoding, templates=None, site=None, version=None):
+        """Insert or replace a single user's encoding (centroid) and templates on their shard"""
+        site = Config.SITE if site is None else site
+        with self._lock:
+            if self.shard_by == 'site':
+                self._sites[username] = site
+            shard = self._shard_for(username)
+            previous = self._owners.get(username)
+            if previous is not None and previous != shard:
+                # Re-registered at another site
+                self._update(previous, 'remove', username, version)
+            if previous != shard:
+                self._shards[shard].size += 1
+            self._owners[username] = shard
+            self.generation += 1
+            self._update(shard, 'add', username, version, encoding, templates)
+    
+    def remove(self, username, version=None):
+        """Remove a user from their shard, returns False if it was not indexed"""
+        with self._lock:
+            shard = self._owners.pop(username, None)
+            self._sites.pop(username, None)
+            if shard is None:
+                return False
+            self.generation += 1
+            self._update(shard, 'remove', username, version)
+            return True
+    
+    def _update(self, shard, op, username, version, *args):
+        if op == 'remove':
+            self._shards[shard].size -= 1
+        self._shards[shard].request(op, username, version, *args).add_done_callback(_log_failure)
+    
+    def get_encoding(self, username):
+        """Get the stored encoding for a user (from their shard)"""
+        return self._fetch('get_encoding', username)
+    
+    def get_templates(self, username):
+        """Get a user's template set (None for single-template users)"""
+        return self._fetch('get_templates', username)
+    
+    def _fetch(self, op, username):
+        shard = self._owners.get(username)
+        if shard is None:
+            return None
+        return self._shards[shard].request(op, username).result(timeout=max(self.deadline, 5.0))
+    
+    def search(self, encoding, k=5):
+        """Return the top-k (username, similarity) matches over the shards that answer in time"""
+        probe = np.asarray(encoding)
+        requests = []
+        missed = False
+        for shard in self._shards:
+            if shard.size <= 0:
+                continue
+            if not shard.alive or shard.in_flight >= Config.GALLERY_SHARD_MAX_IN_FLIGHT:
+                self._miss(shard, 'skipped')
+                missed = True
+                continue
+            requests.append((shard, shard.request('search', probe, k)))
+        
+        done, _ = wait([future for _, future in requests], timeout=self.deadline)
+        matches = []
+        for shard, future in requests:
+            if future not in done:
+                self._miss(shard, 'timeouts')
+                missed = True
+            elif future.exception() is not None:
+                self._miss(shard, 'errors')
+                missed = True
+            else:
+                matches.extend(future.result())
+        
+        self._count('searches')
+        if missed:
+            self._count('partial')
+        return heapq.nlargest(k, matches, key=lambda match: match[1])
+    
+    def _miss(self, shard, reason):
+        self._count(reason)
+        metrics.inc('face_gallery_shard_misses_total', shard=str(shard.index), reason=reason)
+    
+    def status(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict({
+            'shards': self.count,
+            'shard_by': self.shard_by,
+            'deadline': self.deadline,
+            'sizes': [shard.size for shard in self._shards],
+            'connected': sum(shard.alive for shard in self._shards),
+            'in_flight': sum(shard.in_flight for shard in self._shards)
+        }, **stats)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve one gallery shard to ShardedGallery coordinators')
+    parser.add_argument('--listen', default='127.0.0.1:6100', help='host:port to listen on (port 0 picks a free one)')
+    parser.add_argument('--once', action='store_true', help='Exit when the first coordinator disconnects')
+    args = parser.parse_args()
+    
+    if not Config.GALLERY_SHARD_AUTHKEY:
+        parser.error('GALLERY_SHARD_AUTHKEY must be set')
+    host, port = args.listen.rsplit(':', 1)
+    state = ShardState()
+    with Listener((host, int(port)), authkey=Config.GALLERY_SHARD_AUTHKEY.encode()) as listener:
+        # The bound address is the only thing written to stdout
+        print(f"{listener.address[0]}:{listener.address[1]}", flush=True)
+        sys.stdout = sys.stderr
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"Rejected gallery shard connection: {e}")
+                continue
+            if args.once:
+                serve(conn, state)
+                return
+            # Coordinators (one per API worker) share the shard's gallery
+            threading.Thread(target=serve, args=(conn, state), daemon=True).start()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""Versioned on-disk gallery snapshots for fast worker cold starts.
+
+A snapshot is written to GALLERY_SNAPSHOT_DIR as raw files plus a manifest:
+    
+    gallery.json                     version, feature version, dimension,
+                                     username table (row = position) and
+                                     template table (username -> offset, count)
+    gallery-<version>-<id>.f32       float32 matrix, capacity x dim
+    gallery-<version>-<id>.stats     float64 norms, means and stds, 3 x capacity
+    gallery-<version>-<id>.tpl       float32 templates of multi-template users
+
+The matrix and stats files have GALLERY_SNAPSHOT_HEADROOM spare rows
+(left as sparse zeros), so registrations after start-up write into the
+mapping instead of copying the whole gallery. Workers open the files with
+np.memmap in copy-on-write mode: every process on the host shares the
+same page-cache pages, and only rows a worker changes become private.
+
+The manifest is replaced atomically, so readers never see a half-written
+snapshot. Writers hold a lock on gallery.lock, so one worker per host
+writes a given version while the others skip it, and only copy the
+gallery in memory while it is locked. To write one from the database ahead of a deploy:
+    
+    python gallery_snapshot.py [--dir snapshots]
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+from config import Config
+
+MANIFEST = 'gallery.json'
+LOCK = 'gallery.lock'
+
+def snapshot_capacity(size):
+    """Rows to reserve for a snapshot of `size` users"""
+    return size + max(int(size * Config.GALLERY_SNAPSHOT_HEADROOM), 1024)
+
+def write_snapshot(gallery, version, directory=None, lock=None, wait=False):
+    """Write the gallery as it reflects `version`, returns the manifest.
+    
+    One process per host writes at a time; unless `wait`, the others get
+    None at once instead of waiting for it. None is also returned for an
+    empty gallery, and the current manifest when it already has `version`.
+    Only the in-memory copy of the gallery is taken under `lock` (the
+    caller's lock keeping the gallery and `version`, which may then be a
+    callable, consistent); the files are written after it is released.
+    """
+    directory = directory or Config.GALLERY_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    
+    with _publish_lock(directory, blocking=wait) as acquired:
+        if not acquired:
+            return None
+        current = read_manifest(directory)
+        if (current is not None and current['feature_version'] == Config.FEATURE_VERSION
+                and current['version'] >= (version() if callable(version) else version)):
+            # Another worker already published this version or a newer one
+            return current
+        
+        with lock or contextlib.nullcontext():
+            version = version() if callable(version) else version
+            usernames, rows, row_stats, templates = gallery.export()
+        if not usernames:
+            return None
+        
+        prefix = f'gallery-{version:012d}-{uuid.uuid4().hex[:8]}'
+        files = {'matrix': prefix + '.f32', 'stats': prefix + '.stats', 'templates': prefix + '.tpl'}
+        capacity, dim = snapshot_capacity(len(usernames)), rows.shape[1]
+        matrix = np.memmap(
+            os.path.join(directory, files['matrix']), dtype=np.float32, mode='w+', shape=(capacity, dim)
+        )
+        matrix[:len(usernames)] = rows
+        matrix.flush()
+        stats = np.memmap(
+            os.path.join(directory, files['stats']), dtype=np.float64, mode='w+', shape=(3, capacity)
+        )
+        stats[:, :len(usernames)] = row_stats
+        stats.flush()
+        del matrix, stats, rows, row_stats
+        
+        # Templates are appended back to back; the table records where each user's start
+        template_table = {}
+        offset = 0
+        with open(os.path.join(directory, files['templates']), 'wb') as f:
+            for username, user_templates in templates.items():
+                np.ascontiguousarray(user_templates, dtype=np.float32).tofile(f)
+                template_table[username] = [offset, len(user_templates)]
+                offset += len(user_templates)
+        
+        manifest = {
+            'version': version,
+            'feature_version': Config.FEATURE_VERSION,
+            'dim': dim,
+            'capacity': capacity,
+            'count': len(usernames),
+            'created_at': datetime.utcnow().isoformat(),
+            'files': files,
+            'usernames': usernames,
+            'templates': template_table
+        }
+        
+        tmp_path = os.path.join(directory, f'.{MANIFEST}.{uuid.uuid4().hex[:8]}')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(directory, MANIFEST))
+        
+        _remove_stale(directory, version)
+    return manifest
+
+@contextlib.contextmanager
+def _publish_lock(directory, blocking=True):
+    """Hold the directory's lock file (shared by every process on the host) exclusively.
+    
+    Yields False instead when not `blocking` and another process holds it.
+    """
+    with open(os.path.join(directory, LOCK), 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            # Locks the file's first byte; LK_LOCK gives up after about 10 seconds, so keep trying
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        yield False
+                        return
+            try:
+                yield True
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _remove_files(directory, names):
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+def _remove_stale(directory, version):
+    """Delete files of older snapshots (open mappings stay valid on POSIX)"""
+    for path in glob.glob(os.path.join(directory, 'gallery-*')):
+        try:
+            if int(os.path.basename(path).split('-')[1]) < version:
+                os.remove(path)
+        except (ValueError, IndexError, OSError):
+            pass
+
+def read_manifest(directory=None):
+    """Read the current manifest, or None if there is no snapshot"""
+    path = os.path.join(directory or Config.GALLERY_SNAPSHOT_DIR, MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def open_snapshot(directory=None):
+    """Map the current snapshot, or None if missing or unusable with this configuration"""
+    directory = directory or Config.GALLERY_SNAPSHOT_DIR
+    manifest = read_manifest(directory)
+    if manifest is None or manifest['feature_version'] != Config.FEATURE_VERSION:
+        return None
+    
+    files = manifest['files']
+    capacity, dim = manifest['capacity'], manifest['dim']
+    try:
+        # Copy-on-write: shared page cache until a row is changed
+        matrix = np.memmap(
+            os.path.join(directory, files['matrix']), dtype=np.float32, mode='c', shape=(capacity, dim)
+        )
+        stats = np.memmap(
+            os.path.join(directory, files['stats']), dtype=np.float64, mode='c', shape=(3, capacity)
+        )
+        templates = {}
+        if manifest['templates']:
+            stored = np.memmap(os.path.join(directory, files['templates']), dtype=np.float32, mode='r').reshape(-1, dim)
+            templates = {
+                username: stored[offset:offset + count]
+                for username, (offset, count) in manifest['templates'].items()
+            }
+    except (OSError, ValueError) as e:
+        print(f"Gallery snapshot unreadable, ignoring it: {e}")
+        return None
+    
+    return {
+        'version': manifest['version'],
+        'usernames': manifest['usernames'],
+        'matrix': matrix,
+        'stats': stats,
+        'templates': templates
+    }
+
+def main():
+    from database import Database
+    from gallery_index import GalleryIndex
+    
+    parser = argparse.ArgumentParser(description='Write a gallery snapshot from the database')
+    parser.add_argument('--dir', default=Config.GALLERY_SNAPSHOT_DIR or 'snapshots')
+    args = parser.parse_args()
+    
+    db = Database()
+    start = time.perf_counter()
+    version = db.get_gallery_version()
+    gallery = GalleryIndex()
+    gallery.load(db.get_all_face_encodings(), db.get_face_templates())
+    manifest = write_snapshot(gallery, version, args.dir, wait=True)
+    if manifest is None:
+        print("⚠️  Gallery is empty, no snapshot written")
+    else:
+        print(f"✅ Wrote snapshot of {manifest['count']} users at version {manifest['version']} "
+              f"in {time.perf_counter() - start:.2f}s")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
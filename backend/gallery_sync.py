@@ -0,0 +1,251 @@
+import threading
+import time
+from config import Config
+from metrics import timed_stage
+from gallery_shards import ShardedGallery
+from gallery_snapshot import open_snapshot, write_snapshot
+
+class GallerySync:
+    """Keeps a worker's GalleryIndex in step with the shared database.
+    
+    Every registration and deletion bumps the gallery version in MongoDB
+    and appends a change (see Database._record_gallery_changes). Each
+    worker remembers the version its index reflects and applies newer
+    changes as add/remove deltas instead of reloading the gallery. A
+    background thread tails a change stream on the change log when the
+    deployment supports one (replica sets) and polls otherwise.
+    
+    On start-up the gallery is mapped from the on-disk snapshot (see
+    gallery_snapshot.py) when there is one, and only the changes made since
+    its version are fetched; preload() maps it ahead of time, before the
+    database is reachable. A fresh snapshot is written after each full
+    reload and whenever GALLERY_SNAPSHOT_REFRESH changes have accumulated
+    (in `snapshot_dir`, GALLERY_SNAPSHOT_DIR by default; '' disables them).
+    """
+    
+    def __init__(self, db, gallery, interval=None, snapshot_dir=None):
+        self.db = db
+        self.gallery = gallery
+        self.interval = Config.GALLERY_SYNC_INTERVAL if interval is None else interval
+        self.snapshot_dir = Config.GALLERY_SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir
+        self.version = 0
+        self.latest_version = 0
+        self.mode = 'polling'
+        self.last_sync = None
+        self.last_current = None
+        self.full_reloads = 0
+        self.snapshot_version = None
+        self.loaded_from = None
+        self.cold_start_seconds = None
+        self._preloaded = False
+        self._gap_since = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def load(self):
+        """Cold start: catch up from the snapshot, or reload from the database"""
+        start = time.perf_counter()
+        if (self._preloaded or self.preload()) and self._catch_up():
+            self.loaded_from = 'snapshot'
+        else:
+            self.reload()
+            self.loaded_from = 'database'
+        self._preloaded = False
+        self.cold_start_seconds = round(time.perf_counter() - start, 3)
+    
+    def preload(self):
+        """Map the on-disk snapshot without touching the database; True if mapped.
+        
+        Safe in a server's master process before it forks: the workers
+        share the mapped pages and only check and catch up in load().
+        """
+        snapshot = open_snapshot(self.snapshot_dir) if self.snapshot_dir else None
+        if snapshot is None:
+            return False
+        
+        with self._lock:
+            self.gallery.load_arrays(
+                snapshot['usernames'], snapshot['matrix'], snapshot['stats'], snapshot['templates']
+            )
+            self.version = self.latest_version = self.snapshot_version = snapshot['version']
+            self._gap_since = None
+        self._preloaded = True
+        return True
+    
+    def _catch_up(self):
+        """Apply changes since the mapped snapshot if the change log still covers it; True if done"""
+        latest = self.db.get_gallery_version()
+        oldest = self.db.get_oldest_gallery_change_version()
+        if self.version > latest:
+            # Written against another database
+            return False
+        if self.version < latest and (oldest is None or oldest > self.version + 1):
+            # Changes since the snapshot have expired from the log
+            return False
+        
+        with self._lock:
+            self.latest_version = latest
+        
+        # Catch up on the documents changed since the snapshot
+        while self.sync():
+            pass
+        return True
+    
+    @timed_stage('gallery_reload')
+    def reload(self):
+        """Full reload of the gallery from the database"""
+        with self._lock:
+            # Read the version first: changes racing with the load are re-applied later
+            version = self.db.get_gallery_version()
+            if isinstance(self.gallery, ShardedGallery):
+                # Each shard reads its own partition
+                self.gallery.load_from_database(version)
+            else:
+                self.gallery.load(self.db.get_all_face_encodings(), self.db.get_face_templates())
+            self.version = version
+            self.latest_version = version
+            self.full_reloads += 1
+            self._gap_since = None
+            self.last_sync = self.last_current = time.time()
+        
+        if self.snapshot_dir:
+            self.save_snapshot()
+    
+    def save_snapshot(self):
+        """Write the current gallery to disk for the next cold start"""
+        try:
+            manifest = write_snapshot(self.gallery, lambda: self.version, self.snapshot_dir, lock=self._lock)
+            if manifest is not None:
+                self.snapshot_version = manifest['version']
+        except Exception as e:
+            print(f"Failed to write gallery snapshot: {e}")
+    
+    @timed_stage('gallery_sync')
+    def sync(self):
+        """Apply pending changes, returns the number applied"""
+        with self._lock:
+            changes = self.db.get_gallery_changes(self.version)
+            self.latest_version = max(self.db.get_gallery_version(), self.version)
+            self.last_sync = time.time()
+            
+            # Only apply the contiguous run; a gap is a change still being written
+            applied = []
+            expected = self.version + 1
+            for change in changes:
+                if change['version'] != expected:
+                    break
+                applied.append(change)
+                expected += 1
+        
+        if not applied and changes:
+            if self._handle_gap():
+                return 0
+        else:
+            self._gap_since = None
+        
+        if applied:
+            self._apply(applied)
+        
+        with self._lock:
+            if self.version >= self.latest_version:
+                self.last_current = self.last_sync
+        return len(applied)
+    
+    def _handle_gap(self):
+        """Reload when the missing change expired or never arrived; True if reloaded"""
+        oldest = self.db.get_oldest_gallery_change_version()
+        now = time.time()
+        if self._gap_since is None:
+            self._gap_since = now
+        
+        expired = oldest is not None and oldest > self.version + 1
+        if expired or now - self._gap_since > Config.GALLERY_SYNC_GAP_TIMEOUT:
+            self.reload()
+            return True
+        return False
+    
+    def _apply(self, changes):
+        # Only the last change per user matters; adds read the current document
+        final = {}
+        for change in changes:
+            final[change['username']] = (change['op'], change['version'])
+        
+        added = [username for username, (op, _) in final.items() if op == 'add']
+        encodings = self.db.get_face_encodings(added) if added else {}
+        templates = self.db.get_face_templates(added) if added else {}
+        
+        # Shards may be shared with other workers' galleries: they need the user's site and the change's version
+        sharded = isinstance(self.gallery, ShardedGallery)
+        sites = self.db.get_user_sites(added) if sharded and added else {}
+        
+        with self._lock:
+            for username, (op, version) in final.items():
+                extra = {'version': version} if sharded else {}
+                if op == 'add' and username in encodings:
+                    if sharded:
+                        extra['site'] = sites.get(username, '')
+                    self.gallery.add(username, encodings[username], templates.get(username), **extra)
+                else:
+                    self.gallery.remove(username, **extra)
+            self.version = changes[-1]['version']
+    
+    def staleness(self):
+        """How far this worker's gallery is behind the database"""
+        now = time.time()
+        return {
+            'mode': self.mode,
+            'local_version': self.version,
+            'latest_version': self.latest_version,
+            'versions_behind': max(self.latest_version - self.version, 0),
+            'seconds_since_sync': round(now - self.last_sync, 3) if self.last_sync else None,
+            'seconds_stale': round(now - self.last_current, 3) if self.last_current else None,
+            'full_reloads': self.full_reloads,
+            'loaded_from': self.loaded_from,
+            'snapshot_version': self.snapshot_version,
+            'cold_start_seconds': self.cold_start_seconds
+        }
+    
+    def start(self):
+        """Start the background sync thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='gallery-sync', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def _run(self):
+        if Config.GALLERY_USE_CHANGE_STREAM:
+            try:
+                self._watch()
+                return
+            except Exception as e:
+                print(f"Gallery change stream unavailable, polling instead: {e}")
+        
+        self.mode = 'polling'
+        while not self._stop.wait(self.interval):
+            self._safe_sync()
+    
+    def _watch(self):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        with self.db.gallery_changes.watch(pipeline, max_await_time_ms=int(self.interval * 1000)) as stream:
+            self.mode = 'change_stream'
+            self._safe_sync()
+            while not self._stop.is_set():
+                # Wakes on new changes; a timeout still syncs as a safety net
+                stream.try_next()
+                self._safe_sync()
+    
+    def _safe_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"Gallery sync failed: {e}")
+        
+        if self.snapshot_dir and self.version - (self.snapshot_version or 0) >= Config.GALLERY_SNAPSHOT_REFRESH:
+            self.save_snapshot()
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""In-process metrics: stage timing histograms, counters and gauges.
+
+FaceEngine, AuthManager and the background writers time their stages
+with @timed_stage / stage_timer; the results feed the
+`face_stage_seconds` histogram and are exposed in the Prometheus text
+format on /api/metrics. Metrics are per process: with several workers,
+let Prometheus scrape each one (or sum them).
+
+A request can also collect its own stage timings (see collect()) for
+the Server-Timing header. Work done on engine pool workers is collected
+there and handed back to the caller with the result, so it is counted
+in the requesting process even with the process backend.
+
+With METRICS_ENABLED off every hook is a single flag check.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+
+# Seconds; fine-grained below 10 ms where most stages land
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.025,
+    0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0
+)
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+    
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Named histograms, counters and gauges with optional labels"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+    
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+    
+    def histogram(self, name, **labels):
+        """Get (or create) the histogram for name and labels"""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+    
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+    
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def gauge(self, name, help_text, fn):
+        """Register fn() -> number (or {label value: number} for a 'kind' label), read at scrape time"""
+        self.describe(name, 'gauge', help_text)
+        self._gauges[name] = fn
+    
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        
+        def header(name, default_kind):
+            kind, help_text = self._help.get(name, (default_kind, name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+        
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        
+        current = None
+        for (name, labels), histogram in histograms:
+            if name != current:
+                header(name, 'histogram')
+                current = name
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                le = bound if bound == '+Inf' else repr(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total!r}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        
+        current = None
+        for (name, labels), value in counters:
+            if name != current:
+                header(name, 'counter')
+                current = name
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        
+        for name, fn in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {e}")
+                continue
+            header(name, 'gauge')
+            if isinstance(value, dict):
+                for kind, v in sorted(value.items()):
+                    lines.append(f'{name}{_format_labels((("kind", kind),))} {_format_value(v)}')
+            else:
+                lines.append(f'{name} {_format_value(value)}')
+        
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe('face_stage_seconds', 'histogram', 'Time spent in each pipeline stage')
+REGISTRY.describe('face_http_request_seconds', 'histogram', 'HTTP request latency by endpoint')
+REGISTRY.describe('face_http_requests_total', 'counter', 'HTTP requests by endpoint, method and status')
+REGISTRY.describe('face_http_errors_total', 'counter', 'HTTP requests that ended in a 5xx response')
+REGISTRY.describe('face_cache_requests_total', 'counter', 'Cache lookups by cache and result (hit or miss)')
+REGISTRY.describe('face_gallery_shard_misses_total', 'counter', 'Gallery shards left out of a search by shard and reason')
+
+class _Collector(threading.local):
+    # Class default: a missing attribute on a thread-local is slow to look up
+    collector = None
+
+# Stage timings collected for the current thread's request (or pool job)
+_local = _Collector()
+
+# Stage name -> histogram, skipping the label lookup on the hot path
+_stage_histograms = {}
+
+class StageTimings(list):
+    """(stage, seconds) pairs; deferred timings are recorded by whoever receives them"""
+    
+    def __init__(self, deferred=False):
+        super().__init__()
+        self.deferred = deferred
+    
+    def totals(self):
+        """Seconds per stage, summed over repeats, in first-seen order"""
+        totals = {}
+        for stage, seconds in self:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+def observe_stage(stage, seconds):
+    collector = _local.collector
+    if collector is not None:
+        collector.append((stage, seconds))
+        if collector.deferred:
+            return
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = REGISTRY.histogram('face_stage_seconds', stage=stage)
+    histogram.observe(seconds)
+
+def record(timings):
+    """Record stage timings handed back from another thread or process"""
+    for stage, seconds in timings:
+        observe_stage(stage, seconds)
+
+def start_collecting(deferred=False):
+    """Collect this thread's stage timings from now on, returns (timings, token for stop_collecting)"""
+    previous = _local.collector
+    _local.collector = StageTimings(deferred)
+    return _local.collector, previous
+
+def stop_collecting(token):
+    _local.collector = token
+
+@contextmanager
+def collect(deferred=False):
+    """Collect this thread's stage timings, yields a StageTimings (or None when disabled)"""
+    if not Config.METRICS_ENABLED:
+        yield None
+        return
+    timings, token = start_collecting(deferred)
+    try:
+        yield timings
+    finally:
+        stop_collecting(token)
+
+@contextmanager
+def stage_timer(stage):
+    if not Config.METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def timed_stage(stage):
+    """Decorator form of stage_timer"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not Config.METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe_stage(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def inc(name, amount=1, **labels):
+    if Config.METRICS_ENABLED:
+        REGISTRY.inc(name, amount, **labels)
\ No newline at end of file
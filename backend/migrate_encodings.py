@@ -0,0 +1,25 @@
+"""One-time migration of stored face encodings to compact binary blobs.
+    
+    python migrate_encodings.py [--dtype float32|float16] [--batch-size 1000]
+
+Documents that already hold a binary encoding are left untouched, so the
+migration can be re-run safely.
+"""
+import argparse
+import time
+from config import Config
+from database import Database
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert legacy face encodings to binary blobs')
+    parser.add_argument('--dtype', default=Config.ENCODING_DTYPE, choices=['float32', 'float16'])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    
+    db = Database()
+    start = time.perf_counter()
+    migrated = db.migrate_face_encodings(args.dtype, args.batch_size)
+    print(f"✅ Migrated {migrated} encodings to {args.dtype} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,185 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import Config
+import metrics
+
+# Rough per-entry bookkeeping cost on top of the arrays it holds
+ENTRY_OVERHEAD = 512
+
+# Frame hashes are indexed by 16-bit chunk: hashes a few bits apart share one
+HASH_CHUNK_BYTES = 2
+
+class _Entry:
+    __slots__ = ('expires', 'size', 'probe', 'signature', 'decision', 'generation')
+    
+    def __init__(self, expires, probe, signature=None):
+        self.expires = expires
+        self.probe = probe
+        self.signature = signature
+        self.decision = None
+        self.generation = None
+        self.size = ENTRY_OVERHEAD
+        if probe[2] is not None:
+            self.size += probe[2].nbytes
+        if signature is not None:
+            self.size += signature[1].nbytes
+
+class ProbeCache:
+    """LRU + TTL cache of authentication probes, bounded by memory.
+    
+    Retries and kiosks resubmit byte-identical frames, so each entry is
+    keyed by a hash of the uploaded image payload and keeps what the
+    engine made of it: the (success, message, encoding) result, failures
+    included. A repeat skips decoding, detection and encoding.
+    
+    With PROBE_CACHE_PERCEPTUAL, frames that are not byte-identical are
+    also looked up by a perceptual signature of the whole frame (see
+    FaceEngine.frame_signature): a recent frame whose hash shares a
+    16-bit chunk and whose thumbnail nowhere differs by more than
+    PROBE_CACHE_FRAME_TOLERANCE grey levels counts as the same frame.
+    Sensor noise and re-encoding stay well inside that; a face moving or
+    changing does not.
+    
+    The match decision is kept alongside, tagged with the GalleryIndex
+    generation it was made against; any gallery change makes it stale
+    and the probe is matched again.
+    """
+    
+    def __init__(self, max_bytes=None, ttl=None, perceptual=None):
+        self.max_bytes = Config.PROBE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = Config.PROBE_CACHE_TTL if ttl is None else ttl
+        self.perceptual = Config.PROBE_CACHE_PERCEPTUAL if perceptual is None else perceptual
+        self._entries = OrderedDict()
+        self._chunks = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0, 'misses': 0, 'similar_hits': 0, 'decision_hits': 0,
+            'stale': 0, 'evictions': 0, 'expired': 0
+        }
+    
+    @staticmethod
+    def key(image):
+        """Content hash of an image payload (raw bytes or base64 text)"""
+        if isinstance(image, str):
+            image = image.encode()
+        return hashlib.blake2b(image, digest_size=16).digest()
+    
+    @staticmethod
+    def _hash_chunks(signature):
+        frame_hash = signature[0]
+        return [
+            (i, frame_hash[i:i + HASH_CHUNK_BYTES])
+            for i in range(0, len(frame_hash), HASH_CHUNK_BYTES)
+        ]
+    
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= now:
+            self._drop(key)
+            self.stats['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+    
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if entry.signature is not None:
+            for chunk in self._hash_chunks(entry.signature):
+                keys = self._chunks[chunk]
+                keys.discard(key)
+                if not keys:
+                    del self._chunks[chunk]
+    
+    def _put(self, key, entry):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        if entry.signature is not None:
+            for chunk in self._hash_chunks(entry.signature):
+                self._chunks.setdefault(chunk, set()).add(key)
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+    
+    def get_probe(self, key):
+        """Cached (success, message, encoding) for a payload key, or None"""
+        with self._lock:
+            entry = self._get(key, time.monotonic())
+            self.stats['hits' if entry else 'misses'] += 1
+        metrics.inc('face_cache_requests_total', cache='probe', result='hit' if entry else 'miss')
+        return entry.probe if entry else None
+    
+    def get_similar(self, key, signature):
+        """Probe of a recent near-identical frame, cached under `key` too; or None"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for chunk in self._hash_chunks(signature):
+                candidates.update(self._chunks.get(chunk, ()))
+            
+            match = None
+            for candidate in candidates:
+                entry = self._get(candidate, now)
+                if entry is not None and np.abs(entry.signature[1] - signature[1]).max() <= Config.PROBE_CACHE_FRAME_TOLERANCE:
+                    match = entry
+                    break
+            
+            if match is not None:
+                self.stats['similar_hits'] += 1
+                alias = _Entry(now + self.ttl, match.probe, signature)
+                alias.decision = match.decision
+                alias.generation = match.generation
+                self._put(key, alias)
+        metrics.inc('face_cache_requests_total', cache='probe_similar', result='hit' if match else 'miss')
+        return match.probe if match else None
+    
+    def put_probe(self, key, probe, signature=None):
+        """Remember what the engine made of a payload (and its frame signature)"""
+        with self._lock:
+            self._put(key, _Entry(time.monotonic() + self.ttl, probe, signature))
+    
+    def get_decision(self, key, generation):
+        """Match decision made for this probe at gallery `generation`, or None"""
+        with self._lock:
+            entry = self._get(key, time.monotonic())
+            decision = None
+            if entry is not None and entry.decision is not None:
+                if entry.generation == generation:
+                    decision = entry.decision
+                    self.stats['decision_hits'] += 1
+                else:
+                    self.stats['stale'] += 1
+        metrics.inc('face_cache_requests_total', cache='probe_decision', result='hit' if decision else 'miss')
+        return decision
+    
+    def put_decision(self, key, generation, decision):
+        """Keep a match decision with the gallery generation it was made against"""
+        with self._lock:
+            entry = self._get(key, time.monotonic())
+            if entry is not None:
+                entry.decision = decision
+                entry.generation = generation
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chunks.clear()
+            self._bytes = 0
+    
+    def status(self):
+        with self._lock:
+            return dict({
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'perceptual': self.perceptual
+            }, **self.stats)
\ No newline at end of file
@@ -0,0 +1,276 @@
+import numpy as np
+from config import Config
+from face_engine import FaceEngine
+
+def probe_levels(dim):
+    """Largest +-levels for quantized probe weights with 255 * levels * dim within int32"""
+    return (2 ** 31 - 1) // (255 * max(dim, 1))
+
+class ExactSearch:
+    """Brute-force backend: every gallery row is a candidate"""
+    
+    name = 'exact'
+    resident_rows = True
+    
+    def rebuild(self, matrix):
+        pass
+    
+    def needs_rebuild(self, size):
+        return False
+    
+    def add(self, row, vector):
+        pass
+    
+    def remove(self, row):
+        pass
+    
+    def move(self, src, dst):
+        pass
+    
+    def candidates(self, probe):
+        """Return candidate row ids, or None to scan the whole gallery"""
+        return None
+
+
+class IVFSearch:
+    """Inverted-file backend with a spherical k-means coarse quantizer.
+    
+    Rows are assigned to their nearest centroid by cosine similarity. A
+    query only scans the rows in its `nprobe` closest lists, so `nprobe`
+    is the recall/latency knob: 1 is fastest, `nlist` is equivalent to an
+    exact scan. The shortlist is still re-ranked by GalleryIndex with the
+    exact fused similarity.
+    """
+    
+    name = 'ivf'
+    resident_rows = True
+    
+    def __init__(self, nlist=None, nprobe=None, train_iterations=10, train_sample=50000, seed=0):
+        self.nlist = Config.IVF_NLIST if nlist is None else nlist
+        self.nprobe = Config.IVF_NPROBE if nprobe is None else nprobe
+        self.train_iterations = train_iterations
+        self.train_sample = train_sample
+        self.seed = seed
+        self._centroids = None
+        self._lists = []
+        self._arrays = []
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+    
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.atleast_2d(vectors).astype(np.float32)
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-6)
+    
+    def _train(self, unit, nlist):
+        """Spherical k-means on (a sample of) the unit-normalized gallery"""
+        rng = np.random.default_rng(self.seed)
+        if len(unit) > self.train_sample:
+            unit = unit[rng.choice(len(unit), self.train_sample, replace=False)]
+        
+        centroids = unit[rng.choice(len(unit), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            labels = np.argmax(unit @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = unit[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    # Re-seed empty clusters so every list stays useful
+                    centroids[c] = unit[rng.integers(len(unit))]
+            centroids = self._normalize(centroids)
+        
+        return centroids
+    
+    def rebuild(self, matrix):
+        """Train the quantizer on the current gallery and assign every row"""
+        size = len(matrix)
+        nlist = self.nlist or int(np.sqrt(size))
+        nlist = min(nlist, size)
+        if nlist < 2:
+            # Too small to be worth partitioning; behave like ExactSearch
+            self._centroids = None
+            self._lists = []
+            self._arrays = []
+            self._assign = np.zeros(0, dtype=np.int32)
+            self._trained_size = size
+            return
+        
+        unit = self._normalize(matrix)
+        self._centroids = self._train(unit, nlist)
+        
+        # Assign in blocks to bound the size of the score temporary
+        assign = np.empty(size, dtype=np.int32)
+        for start in range(0, size, 65536):
+            block = unit[start:start + 65536]
+            assign[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        
+        self._assign = assign
+        self._lists = [[] for _ in range(nlist)]
+        for row, c in enumerate(assign.tolist()):
+            self._lists[c].append(row)
+        self._arrays = [None] * nlist
+        self._trained_size = size
+    
+    def needs_rebuild(self, size):
+        """Retrain once the gallery has doubled (or halved) since training"""
+        if self._trained_size == 0:
+            return size > 0
+        return size >= 2 * self._trained_size or size * 2 <= self._trained_size
+    
+    def _nearest_list(self, vector):
+        return int(np.argmax(self._centroids @ self._normalize(vector)[0]))
+    
+    def add(self, row, vector):
+        if self._centroids is None:
+            return
+        c = self._nearest_list(vector)
+        if row >= len(self._assign):
+            grown = np.empty(max(row + 1, 2 * len(self._assign)), dtype=np.int32)
+            grown[:len(self._assign)] = self._assign
+            self._assign = grown
+        self._assign[row] = c
+        self._lists[c].append(row)
+        self._arrays[c] = None
+    
+    def remove(self, row):
+        if self._centroids is None:
+            return
+        c = self._assign[row]
+        self._lists[c].remove(row)
+        self._arrays[c] = None
+    
+    def move(self, src, dst):
+        if self._centroids is None:
+            return
+        c = self._assign[src]
+        members = self._lists[c]
+        members[members.index(src)] = dst
+        self._assign[dst] = c
+        self._arrays[c] = None
+    
+    def candidates(self, probe):
+        if self._centroids is None:
+            return None
+        
+        nprobe = min(self.nprobe, len(self._centroids))
+        scores = self._centroids @ self._normalize(probe)[0]
+        nearest = np.argpartition(scores, -nprobe)[-nprobe:]
+        
+        shortlist = []
+        for c in nearest:
+            if self._arrays[c] is None:
+                self._arrays[c] = np.array(self._lists[c], dtype=np.int64)
+            shortlist.append(self._arrays[c])
+        return np.concatenate(shortlist)
+
+
+class QuantizedSearch:
+    """Scalar-quantized backend: uint8 codes scored with integer dot products.
+    
+    Each dimension is mapped linearly onto 0..255 between its minimum and
+    maximum over the gallery when the backend is rebuilt (later rows
+    outside that range are clipped until the gallery has doubled or
+    halved and it is rebuilt). A query quantizes the probe, weighted by
+    each dimension's scale, to int32 and takes its dot products with
+    every row's codes; with the rows' exact norms, means and standard
+    deviations these give approximate fused scores, and the best
+    `rescore` rows are shortlisted for GalleryIndex to re-score exactly.
+    
+    Only the codes are scanned, so GalleryIndex keeps its float rows in a
+    file-backed mapping (`resident_rows`) and pages in just the shortlist.
+    """
+    
+    name = 'quantized'
+    resident_rows = False
+    
+    def __init__(self, rescore=None):
+        self.rescore = Config.GALLERY_QUANTIZED_RESCORE if rescore is None else rescore
+        self._codes = None
+        self._stats = None
+        self._offset = None
+        self._scale = None
+        self._size = 0
+        self._trained_size = 0
+    
+    def _grow(self, capacity):
+        codes = np.zeros((capacity, self._codes.shape[1]), dtype=np.uint8)
+        stats = np.zeros((3, capacity), dtype=np.float32)
+        codes[:self._size] = self._codes[:self._size]
+        stats[:, :self._size] = self._stats[:, :self._size]
+        self._codes, self._stats = codes, stats
+    
+    def _encode(self, vectors):
+        codes = np.rint((np.atleast_2d(vectors) - self._offset) / self._scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+    
+    def rebuild(self, matrix):
+        """Fit the per-dimension ranges to the current gallery and encode every row"""
+        size, dim = matrix.shape
+        self._size = self._trained_size = size
+        if size == 0:
+            self._codes = None
+            return
+        
+        lo = matrix.min(axis=0).astype(np.float64)
+        hi = matrix.max(axis=0).astype(np.float64)
+        self._offset = lo
+        self._scale = np.maximum(hi - lo, 1e-12) / 255
+        self._codes = np.zeros((size, dim), dtype=np.uint8)
+        self._stats = np.zeros((3, size), dtype=np.float32)
+        
+        # Encode in blocks to bound the size of the float temporaries
+        for start in range(0, size, 65536):
+            block = matrix[start:start + 65536]
+            self._codes[start:start + len(block)] = self._encode(block)
+            self._stats[:, start:start + len(block)] = FaceEngine.template_stats(block)
+    
+    def needs_rebuild(self, size):
+        """Refit the ranges once the gallery has doubled (or halved) since they were fitted"""
+        if self._trained_size == 0:
+            return size > 0
+        return size >= 2 * self._trained_size or size * 2 <= self._trained_size
+    
+    def add(self, row, vector):
+        if row >= len(self._codes):
+            self._grow(max(row + 1, 2 * len(self._codes)))
+        self._codes[row] = self._encode(vector)[0]
+        self._stats[:, row] = np.concatenate(FaceEngine.template_stats(vector))
+        self._size += 1
+    
+    def remove(self, row):
+        self._size -= 1
+    
+    def move(self, src, dst):
+        self._codes[dst] = self._codes[src]
+        self._stats[:, dst] = self._stats[:, src]
+    
+    def candidates(self, probe):
+        if self._size <= self.rescore:
+            return None
+        scores = self.approximate_scores(probe)
+        return np.argpartition(scores, -self.rescore)[-self.rescore:]
+    
+    def approximate_scores(self, probe):
+        """Fused scores of every row from the integer dot products"""
+        probe = np.asarray(probe, dtype=np.float64).ravel()
+        weights = probe * self._scale
+        step = max(np.abs(weights).max(), 1e-12) / probe_levels(probe.size)
+        quantized = np.rint(weights / step).astype(np.int32)
+        
+        # Integer dot products against the codes, mapped back to approximate float dots
+        dots = np.einsum('ij,j->i', self._codes[:self._size], quantized) * step + self._offset @ probe
+        norms, means, stds = self._stats[:, :self._size]
+        return FaceEngine.fused_similarity(probe, dots, norms, means, stds)
+
+
+def create_search_backend(mode=None, **kwargs):
+    """Build the search backend selected by Config.GALLERY_SEARCH_MODE"""
+    mode = (mode or Config.GALLERY_SEARCH_MODE).lower()
+    if mode == 'exact':
+        return ExactSearch()
+    if mode == 'ivf':
+        return IVFSearch(**kwargs)
+    if mode == 'quantized':
+        return QuantizedSearch(**kwargs)
+    raise ValueError(f"Unknown gallery search mode: {mode}")
\ No newline at end of file
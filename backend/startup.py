@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from config import Config
+
+STARTUP_WARMUP_MODES = ('background', 'eager', 'lazy')
+
+class NotReady(Exception):
+    """Raised when the AuthManager is still warming up (or failed to)"""
+
+class Startup:
+    """Builds the AuthManager off the import path and reports readiness.
+    
+    Warm-up connects to MongoDB, creates the indexes, loads the gallery
+    and starts the engine workers. create_app() starts it per
+    STARTUP_WARMUP: 'background' runs it in a thread while the server
+    starts accepting requests, 'eager' finishes it before create_app()
+    returns and 'lazy' waits for the first request (or readiness probe)
+    that needs the manager. Requests that arrive during warm-up wait up
+    to STARTUP_WAIT seconds for it and are answered 503 after that.
+    
+    With STARTUP_PRELOAD, create_app() only preloads: it builds the
+    manager and maps the gallery snapshot without connecting or starting
+    threads, which is safe in a server's master process (gunicorn
+    --preload). Workers forked from it share those pages and start their
+    own warm-up right after the fork.
+    """
+    
+    def __init__(self):
+        self.manager = None
+        self.state = 'cold'
+        self.error = None
+        self.seconds = {}
+        self.created = time.perf_counter()
+        self._reset()
+    
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+    
+    def preload(self):
+        """Build the manager and map the gallery snapshot without connecting"""
+        with self._lock:
+            if self.manager is None:
+                from auth_manager import AuthManager
+                start = time.perf_counter()
+                self.manager = AuthManager(start=False)
+                self.manager.preload()
+                self.seconds['preload'] = round(time.perf_counter() - start, 3)
+                if self.state == 'cold':
+                    self.state = 'preloaded'
+                os.register_at_fork(after_in_child=self._after_fork)
+        return self.manager
+    
+    def _after_fork(self):
+        # Threads and locks do not survive a fork; only a preloaded parent's children warm up
+        preloaded = self.state == 'preloaded'
+        self._reset()
+        self.created = time.perf_counter()
+        if preloaded and Config.STARTUP_WARMUP != 'lazy':
+            self.warm_up()
+    
+    def warm_up(self, wait=False):
+        """Connect and start the manager in a background thread (once)"""
+        with self._lock:
+            if self._thread is None and self.state != 'ready':
+                self.state = 'warming'
+                self.error = None
+                self._done.clear()
+                self._thread = threading.Thread(target=self._warm_up, name='warm-up', daemon=True)
+                self._thread.start()
+        if wait:
+            self._done.wait()
+    
+    def _warm_up(self):
+        start = time.perf_counter()
+        try:
+            manager = self.preload()
+            manager.start()
+            self.seconds.update(manager.startup_seconds)
+            self.seconds['warm_up'] = round(time.perf_counter() - start, 3)
+            self.state = 'ready'
+            print(f"Warm-up finished in {self.seconds['warm_up']}s")
+        except Exception as e:
+            print(f"Warm-up failed: {e}")
+            self.error = str(e)
+            self.state = 'failed'
+            with self._lock:
+                # The next request tries again
+                self._thread = None
+        finally:
+            self._done.set()
+    
+    def get(self, timeout=None):
+        """The started AuthManager, warming it up first if needed; raises NotReady"""
+        if self.state != 'ready':
+            self.warm_up()
+            self._done.wait(Config.STARTUP_WAIT if timeout is None else timeout)
+            if self.state != 'ready':
+                raise NotReady(f'Service is {self.state}, please retry shortly')
+        return self.manager
+    
+    def status(self):
+        return {
+            'ready': self.state == 'ready',
+            'state': self.state,
+            'error': self.error,
+            'seconds': dict(self.seconds),
+            'uptime_seconds': round(time.perf_counter() - self.created, 3)
+        }
\ No newline at end of file
@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from config import Config
+import metrics
+
+SERIES_STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+class StatsCache:
+    """Serves /api/statistics from counters instead of scanning login_attempts.
+    
+    The database keeps hourly and daily attempt counters and an active
+    user counter up to date with $inc as attempts and registrations are
+    written (see Database._count_attempts). Responses built from them are
+    cached in-process for STATS_CACHE_TTL seconds, so a polling dashboard
+    costs at most one small query per worker per TTL.
+    
+    Counters can drift if a write fails half way. A background thread
+    rebuilds the buckets of the last STATS_RECONCILE_WINDOW seconds every
+    STATS_RECONCILE_INTERVAL; a lease in the stats collection makes one
+    worker do it for the whole deployment. Counters are seeded from the
+    full collections the first time they are missing.
+    """
+    
+    def __init__(self, db, ttl=None):
+        self.db = db
+        self.ttl = Config.STATS_CACHE_TTL if ttl is None else ttl
+        self.last_reconcile = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _cached(self, key, build):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            metrics.inc('face_cache_requests_total', cache='statistics', result='hit')
+            return entry[1]
+        
+        metrics.inc('face_cache_requests_total', cache='statistics', result='miss')
+        value = build()
+        with self._lock:
+            self._cache[key] = (now + self.ttl, value)
+        return value
+    
+    def get_statistics(self):
+        """Totals for users and login attempts"""
+        return self._cached('totals', self.db.get_user_stats)
+    
+    def get_series(self, bucket, points):
+        """Success-rate series of the last `points` hours or days, oldest first"""
+        return self._cached((bucket, points), lambda: self._build_series(bucket, points))
+    
+    def _build_series(self, bucket, points):
+        step = SERIES_STEPS[bucket]
+        first = self.db.bucket_start(bucket, datetime.utcnow()) - step * (points - 1)
+        counters = {row['start']: row for row in self.db.get_attempt_series(bucket, first)}
+        
+        # Buckets without attempts have no counter document; report them as zero
+        series = []
+        for i in range(points):
+            start = first + step * i
+            row = counters.get(start, {})
+            total = row.get('total', 0)
+            successful = row.get('successful', 0)
+            series.append({
+                'start': start,
+                'total': total,
+                'successful': successful,
+                'success_rate': round(successful / total, 4) if total else None
+            })
+        return series
+    
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+    
+    def reconcile(self, full=False):
+        """Rebuild drifted counters, returns the number of buckets corrected"""
+        since = None if full else datetime.utcnow() - timedelta(seconds=Config.STATS_RECONCILE_WINDOW)
+        corrected = self.db.reconcile_stats(since)
+        self.last_reconcile = time.time()
+        self.invalidate()
+        return corrected
+    
+    def start(self):
+        """Start the background reconcile thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='stats-reconcile', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def _run(self):
+        wait = 0
+        while not self._stop.wait(wait):
+            wait = Config.STATS_RECONCILE_INTERVAL
+            try:
+                seeded = self.db.has_stats()
+                if self.db.acquire_lease('stats_reconcile', Config.STATS_RECONCILE_INTERVAL):
+                    corrected = self.reconcile(full=not seeded)
+                    if corrected:
+                        print(f"Reconciled {corrected} statistics buckets")
+                elif not seeded:
+                    # Another worker is seeding the counters; check back soon
+                    wait = min(wait, 5)
+            except Exception as e:
+                print(f"Statistics reconcile failed: {e}")
\ No newline at end of file
@@ -0,0 +1,179 @@
+import time
+import cv2
+from config import Config
+from face_engine import FaceEngine, FrameContext
+import metrics
+
+class FaceTracker:
+    """Follows one face box between frames by template matching.
+    
+    The template is the face patch from the frame that was last encoded,
+    cut from a copy of the frame downscaled to STREAM_TRACK_WIDTH. Each new
+    frame is searched only in a window around the previous box. The match
+    score therefore also tells how much the face has changed since it was
+    encoded.
+    """
+    
+    def __init__(self, width=None, search_margin=0.5):
+        self.width = width or Config.STREAM_TRACK_WIDTH
+        self.search_margin = search_margin
+        self.box = None
+        self._template = None
+    
+    def _small(self, gray):
+        scale = min(1.0, self.width / gray.shape[1])
+        if scale == 1.0:
+            return gray, scale
+        return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+    
+    def reset(self, gray, box):
+        """Start tracking box, using the current frame as the reference"""
+        small, scale = self._small(gray)
+        x, y, w, h = (int(round(v * scale)) for v in box)
+        self._template = small[y:y+h, x:x+w].copy()
+        self.box = tuple(int(v) for v in box)
+    
+    def clear(self):
+        self.box = None
+        self._template = None
+    
+    def track(self, gray):
+        """Locate the face in a new frame, returns (box or None, match score)"""
+        if self.box is None or self._template is None or self._template.size == 0:
+            return None, 0.0
+        
+        small, scale = self._small(gray)
+        th, tw = self._template.shape
+        x, y = int(round(self.box[0] * scale)), int(round(self.box[1] * scale))
+        pad = int(max(tw, th) * self.search_margin)
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        x1, y1 = min(x + tw + pad, small.shape[1]), min(y + th + pad, small.shape[0])
+        if x1 - x0 < tw or y1 - y0 < th:
+            return None, 0.0
+        
+        scores = cv2.matchTemplate(small[y0:y1, x0:x1], self._template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+        if score < Config.STREAM_TRACK_THRESHOLD:
+            return None, float(score)
+        
+        # Move the box by the (full-resolution) displacement, keep its size
+        _, _, w, h = self.box
+        nx = min(max(int(round((x0 + dx) / scale)), 0), gray.shape[1] - w)
+        ny = min(max(int(round((y0 + dy) / scale)), 0), gray.shape[0] - h)
+        return (nx, ny, w, h), float(score)
+
+
+class StreamSession:
+    """Continuous authentication over a stream of frames from one camera.
+    
+    Built from the same steps as FaceEngine.process_image_for_authentication,
+    but state is kept between frames:
+    
+    - the face box is tracked, so detection only reruns when tracking is lost;
+    - a confident match is reused without re-encoding while the tracked face
+      still matches the frame it was encoded from (up to
+      STREAM_REVERIFY_INTERVAL seconds);
+    - only changes in the outcome are written to the login history.
+    
+    Each session owns its own FaceEngine because the cascades must not be
+    shared between concurrent sessions.
+    """
+    
+    def __init__(self, gallery, audit=None, engine=None):
+        self.gallery = gallery
+        self.audit = audit
+        self.engine = engine or FaceEngine()
+        self.tracker = FaceTracker()
+        self.frames = 0
+        self.dropped = 0
+        self.stages = {'detected': 0, 'tracked': 0, 'reused': 0, 'failed': 0}
+        self._result = None
+        self._encoded_at = 0.0
+        self._logged = None
+    
+    def _reusable(self, score):
+        """Whether the last match still stands for the tracked face"""
+        if self._result is None or not self._result['success']:
+            return False
+        return (
+            score >= Config.STREAM_SAME_FACE_THRESHOLD
+            and self._result['confidence'] >= Config.STREAM_REUSE_CONFIDENCE * 100
+            and time.monotonic() - self._encoded_at < Config.STREAM_REVERIFY_INTERVAL
+        )
+    
+    def _event(self, start, stage, success, message, confidence=0.0, username=None, box=None):
+        self.stages['failed' if box is None else stage] += 1
+        return {
+            'type': 'result',
+            'frame': self.frames,
+            'stage': stage,
+            'success': success,
+            'message': message,
+            'confidence': round(confidence, 2),
+            'username': username,
+            'box': [int(v) for v in box] if box is not None else None,
+            'dropped': self.dropped,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+    
+    def _fail(self, start, stage, message):
+        self.tracker.clear()
+        self._result = None
+        self._log(False, None, 0.0)
+        return self._event(start, stage, False, message)
+    
+    def _log(self, success, username, confidence):
+        # One history entry per change of outcome, not per frame
+        outcome = (success, username)
+        if self.audit is not None and outcome != self._logged:
+            self.audit.record(username if username else 'Unknown', success, confidence)
+        self._logged = outcome
+    
+    def process(self, data, dropped=0):
+        """Authenticate one frame (bytes or base64), returns a result event"""
+        start = time.perf_counter()
+        self.frames += 1
+        self.dropped += dropped
+        
+        image = self.engine.decode_image(data)
+        if image is None:
+            return self._fail(start, 'detected', 'Failed to decode image')
+        
+        frame = FrameContext(image)
+        box, score = self.tracker.track(frame.gray)
+        
+        if box is not None and self._reusable(score):
+            # Same face as the last confident match: skip encoding
+            metrics.inc('face_cache_requests_total', cache='stream_result', result='hit')
+            self.tracker.box = box
+            result = self._result
+            return self._event(start, 'reused', True, result['message'], result['confidence'], result['username'], box)
+        
+        stage = 'tracked'
+        if box is None:
+            stage = 'detected'
+            faces, _ = self.engine.detect_faces(frame)
+            if len(faces) == 0:
+                return self._fail(start, stage, 'No face detected')
+            if len(faces) > 1:
+                return self._fail(start, stage, 'Multiple faces detected')
+            box = faces[0]
+        
+        metrics.inc('face_cache_requests_total', cache='stream_result', result='miss')
+        encoding = self.engine.extract_face_encoding(frame, box)
+        with metrics.stage_timer('match'):
+            success, message, confidence, username = FaceEngine.match_probe(encoding, self.gallery)
+        
+        self.tracker.reset(frame.gray, box)
+        self._result = {'success': success, 'message': message, 'confidence': confidence, 'username': username}
+        self._encoded_at = time.monotonic()
+        self._log(success, username, confidence)
+        return self._event(start, stage, success, message, confidence, username, box)
+    
+    def summary(self):
+        return {
+            'type': 'summary',
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'stages': dict(self.stages)
+        }
\ No newline at end of file
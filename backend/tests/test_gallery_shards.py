@@ -0,0 +1,58 @@
+"""ShardedGallery with local shard subprocesses (--listen/--once) vs. an in-process GalleryIndex."""
+import numpy as np
+import pytest
+from gallery_index import GalleryIndex
+from gallery_shards import ShardedGallery
+
+@pytest.fixture
+def galleries():
+    rng = np.random.default_rng(0)
+    encodings = {f'user{i}': row for i, row in enumerate(rng.random((200, 64)).astype(np.float32))}
+    local = GalleryIndex()
+    local.load(encodings)
+    sharded = ShardedGallery(shards=2, shard_by='hash', addresses='', deadline=5.0)
+    sharded.start()
+    try:
+        sharded.load(encodings)
+        yield local, sharded, encodings
+    finally:
+        sharded.close()
+
+def probes(encodings, count=40):
+    rng = np.random.default_rng(1)
+    rows = np.array(list(encodings.values()))[:count]
+    return rows + rng.normal(0, 0.02, rows.shape).astype(np.float32)
+
+def assert_same_matches(local, sharded, encodings, k=3):
+    for probe in probes(encodings):
+        expected = local.search(probe, k=k)
+        found = sharded.search(probe, k=k)
+        assert [username for username, _ in found] == [username for username, _ in expected]
+        assert np.allclose([score for _, score in found], [score for _, score in expected])
+
+def test_search_merges_both_shards(galleries):
+    local, sharded, encodings = galleries
+    assert len(sharded) == len(local) == 200
+    assert all(size > 0 for size in sharded.status()['sizes'])
+    assert sum(sharded.status()['sizes']) == 200
+    assert_same_matches(local, sharded, encodings)
+    assert sharded.stats['partial'] == 0
+
+def test_removal_on_each_shard(galleries):
+    local, sharded, encodings = galleries
+    # Remove users from both shards
+    owners = {}
+    for username in encodings:
+        owners.setdefault(sharded._owners[username], []).append(username)
+    assert len(owners) == 2
+    removed = [username for usernames in owners.values() for username in usernames[:10]]
+    for username in removed:
+        assert sharded.remove(username)
+        assert local.remove(username)
+    assert not sharded.remove(removed[0])
+    
+    assert len(sharded) == len(local) == 180
+    assert sorted(sharded.status()['sizes']) == sorted(len(usernames) - 10 for usernames in owners.values())
+    assert_same_matches(local, sharded, encodings)
+    for username in removed:
+        assert sharded.get_encoding(username) is None
@@ -0,0 +1,89 @@
+"""GallerySync's polling path against mongomock (no change streams)."""
+import time
+import mongomock
+import numpy as np
+import pytest
+import database
+from config import Config
+from database import Database
+from gallery_index import GalleryIndex
+from gallery_sync import GallerySync
+
+@pytest.fixture
+def client(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(database, 'MongoClient', lambda *args, **kwargs: client)
+    return client
+
+def encoding(seed):
+    return np.random.default_rng(seed).random(64).astype(np.float32)
+
+def register(db, *usernames):
+    for username in usernames:
+        assert db.add_user(username, '', '', encoding(hash(username) % 1000))[0]
+
+def new_sync(interval=2.0):
+    return GallerySync(Database(), GalleryIndex(), interval=interval, snapshot_dir='')
+
+def test_sync_applies_adds_and_deletes_from_other_workers(client):
+    writer = Database()
+    register(writer, 'alice', 'bob')
+    sync = new_sync()
+    sync.load()
+    assert sorted(sync.gallery.usernames) == ['alice', 'bob']
+    
+    register(writer, 'carol')
+    writer.delete_user('alice')
+    assert sync.sync() == 2
+    assert sorted(sync.gallery.usernames) == ['bob', 'carol']
+    assert sync.version == writer.get_gallery_version() == 4
+    assert sync.staleness()['versions_behind'] == 0
+    assert sync.sync() == 0
+
+def test_sync_catches_up_over_many_versions(client):
+    writer = Database()
+    sync = new_sync()
+    sync.load()
+    assert len(sync.gallery) == 0
+    
+    register(writer, *[f'user{i}' for i in range(20)])
+    for i in range(0, 20, 2):
+        writer.delete_user(f'user{i}')
+    writer.add_users([(f'bulk{i}', '', '', encoding(100 + i)) for i in range(5)])
+    
+    assert sync.sync() == 35
+    assert sorted(sync.gallery.usernames) == sorted([f'user{i}' for i in range(1, 20, 2)] + [f'bulk{i}' for i in range(5)])
+    assert sync.version == writer.get_gallery_version() == 35
+
+def test_sync_reloads_when_missing_changes_expired(client):
+    writer = Database()
+    register(writer, 'alice')
+    sync = new_sync()
+    sync.load()
+    
+    register(writer, 'bob', 'carol')
+    # Changes 2 and 3 expire before this worker sees them (TTL index)
+    writer.gallery_changes.delete_many({'version': {'$lte': 3}})
+    register(writer, 'dave')
+    
+    reloads = sync.full_reloads
+    assert sync.sync() == 0
+    assert sync.full_reloads == reloads + 1
+    assert sorted(sync.gallery.usernames) == ['alice', 'bob', 'carol', 'dave']
+    assert sync.version == 4
+
+def test_background_thread_falls_back_to_polling(client, monkeypatch):
+    monkeypatch.setattr(Config, 'GALLERY_USE_CHANGE_STREAM', True)
+    writer = Database()
+    sync = new_sync(interval=0.05)
+    sync.load()
+    sync.start()
+    try:
+        register(writer, 'alice')
+        deadline = time.time() + 5
+        while 'alice' not in sync.gallery and time.time() < deadline:
+            time.sleep(0.02)
+        assert sync.mode == 'polling'
+        assert 'alice' in sync.gallery
+    finally:
+        sync.stop()